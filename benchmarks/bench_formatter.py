@@ -0,0 +1,140 @@
+# benchmarks/bench_formatter.py
+"""
+Micro-benchmark: single-pass formatter engine vs. the previous multi-pass
+regex implementation (kept verbatim below for comparison).
+
+Usage:
+    python -m benchmarks.bench_formatter [--repeat 2000]
+"""
+
+import argparse
+import re
+import timeit
+
+from utils.formatter import (
+    markdown_to_telegram_html,
+    sanitize_html,
+    replace_markdown_bold,
+    clean_model_output,
+    add_emoticons_to_summary,
+)
+
+
+# --- Previous implementation (reference only) ---
+
+def legacy_sanitize_html(summary):
+    allowed_tags = ['b', 'strong', 'i', 'em', 'a']
+    pattern = r'</?(?!(' + '|'.join(allowed_tags) + r'))\w+[^>]*>'
+    return re.sub(pattern, '', summary, flags=re.IGNORECASE)
+
+
+def legacy_replace_markdown_bold(summary):
+    return re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', summary)
+
+
+def legacy_add_emoticons_to_summary(summary):
+    topic_emojis = {
+        "growth": "🚀",
+        "trending": "🔥",
+        "progress": "🌱",
+        "debate": "🤔",
+        "warning": "⚠️",
+        "positive": "📈",
+    }
+    enhanced_summary = ""
+    for line in summary.split("\n"):
+        if any(keyword in line.lower() for keyword in ["growth", "launch", "new feature"]):
+            line = f"{topic_emojis['growth']} {line}"
+        elif any(keyword in line.lower() for keyword in ["trend", "buzz", "hot topic"]):
+            line = f"{topic_emojis['trending']} {line}"
+        elif any(keyword in line.lower() for keyword in ["progress", "develop", "update"]):
+            line = f"{topic_emojis['progress']} {line}"
+        elif any(keyword in line.lower() for keyword in ["discuss", "question", "debate"]):
+            line = f"{topic_emojis['debate']} {line}"
+        elif any(keyword in line.lower() for keyword in ["warn", "critical", "issue"]):
+            line = f"{topic_emojis['warning']} {line}"
+        elif any(keyword in line.lower() for keyword in ["success", "positive", "gain"]):
+            line = f"{topic_emojis['positive']} {line}"
+        enhanced_summary += line + "\n"
+    return enhanced_summary.strip()
+
+
+def legacy_markdown_to_telegram_html(text):
+    text = re.sub(r'^(#{1,6})\s*(.*)', r'<b>\2</b>', text, flags=re.MULTILINE)
+    text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', text)
+    text = re.sub(r'\[(.*?)\]\((.*?)\)', r'<a href="\2">\1</a>', text)
+    return legacy_sanitize_html(text)
+
+
+# --- Sample inputs ---
+
+# Shape of a real final summary: <2500 chars, a heading, a few bold spans.
+TYPICAL_SUMMARY = "\n".join([
+    "### Summary of the last 6 hours",
+    "- **BTC** held above support while members debated the next move and shared charts.",
+    "- Several users asked about the staking update and how rewards are calculated now.",
+    "- A wallet sync issue was reported; admins confirmed a fix is in progress.",
+    "- General mood stayed positive with talk of gains on a few smaller alts.",
+    "Overall the chat was active, constructive and mostly focused on market direction.",
+] * 4)
+
+# Adversarial: raw HTML, links and entities on every line.
+SAMPLE_SUMMARY = "\n".join([
+    "### Key Topics",
+    "- **BTC** broke resistance; the community is discussing a new feature launch.",
+    "- Trending: <i>ETH</i> staking update and [docs](https://example.com/docs?a=1&b=2).",
+    "- Some users warn about a critical <div>wallet</div> issue, see <br> notes.",
+    "- Progress on the roadmap; gains across alts, positive mood overall.",
+    "Plain concluding line with nothing to classify.",
+] * 20)
+
+
+def _cases(label, text):
+    return [
+        (f"markdown_to_telegram_html [{label}]",
+         lambda: legacy_markdown_to_telegram_html(text),
+         lambda: markdown_to_telegram_html(text)),
+        (f"sanitize_html + replace_markdown_bold [{label}]",
+         lambda: legacy_replace_markdown_bold(legacy_sanitize_html(text)),
+         lambda: clean_model_output(text)),
+        (f"add_emoticons_to_summary [{label}]",
+         lambda: legacy_add_emoticons_to_summary(text),
+         lambda: add_emoticons_to_summary(text)),
+    ]
+
+
+def run(repeat):
+    """
+    Times each legacy/new pair. Note the new HTML functions also escape stray
+    '<'/'&' and balance tags, which the legacy ones never did.
+    """
+    cases = _cases("typical", TYPICAL_SUMMARY) + _cases("markup-heavy", SAMPLE_SUMMARY)
+
+    results = {}
+    for name, legacy_fn, new_fn in cases:
+        legacy_t = timeit.timeit(legacy_fn, number=repeat)
+        new_t = timeit.timeit(new_fn, number=repeat)
+        results[name] = {
+            "legacy_us": round(legacy_t / repeat * 1e6, 2),
+            "new_us": round(new_t / repeat * 1e6, 2),
+            "speedup": round(legacy_t / new_t, 2) if new_t else None,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    # Sanity check: the engines agree on the emoticon output.
+    assert add_emoticons_to_summary(SAMPLE_SUMMARY) == legacy_add_emoticons_to_summary(SAMPLE_SUMMARY)
+    assert replace_markdown_bold("**x**") == legacy_replace_markdown_bold("**x**")
+    assert sanitize_html("<p>x</p>") == legacy_sanitize_html("<p>x</p>")
+
+    for name, r in run(args.repeat).items():
+        print(f"{name:55s} legacy={r['legacy_us']:>9.2f}us  new={r['new_us']:>9.2f}us  x{r['speedup']}")
+
+
+if __name__ == "__main__":
+    main()
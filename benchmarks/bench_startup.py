@@ -0,0 +1,127 @@
+# benchmarks/bench_startup.py
+"""
+Cold-start benchmark: imports a module in fresh interpreters and reports
+wall time, the slowest imports (from -X importtime) and any import-time side
+effects (log handlers installed, heavy SDKs loaded, state backend opened).
+
+Usage:
+    python -m benchmarks.bench_startup [--module handlers] [--runs 5] [--top 10]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Printed by the child interpreter after the import.
+_PROBE = """
+import json, logging, sys, time
+t0 = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t0
+try:
+    import utils.state_store as store
+    store_opened = store._store is not None
+except Exception:
+    store_opened = None
+print(json.dumps({{
+    "import_s": elapsed,
+    "root_log_handlers": len(logging.getLogger().handlers),
+    "openai_loaded": "openai" in sys.modules,
+    "pil_loaded": "PIL.Image" in sys.modules,
+    "state_store_opened": store_opened,
+}}))
+"""
+
+# Stand-in values so config imports cleanly without a real .env.
+_ENV_DEFAULTS = {
+    "API_KEY": "123456:bench",
+    "OPENWEBUI_API_KEY": "bench",
+    "OPENWEBUI_BASE_URL": "http://localhost",
+    "STATE_BACKEND": "memory",
+}
+
+
+def _env():
+    env = dict(os.environ)
+    for key, value in _ENV_DEFAULTS.items():
+        env.setdefault(key, value)
+    return env
+
+
+def measure(module, runs):
+    """
+    Returns per-run probe results for importing `module` in a fresh interpreter.
+    """
+    results = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module)],
+            capture_output=True, text=True, env=_env(), check=True,
+        )
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return results
+
+
+def slowest_imports(module, top):
+    """
+    Parses `python -X importtime` output into (cumulative_us, module) pairs, slowest first.
+    """
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=_env(), check=True,
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nesting is shown by indentation (two spaces per level). Keep the
+        # interpreter's own top-level imports and the target's direct ones.
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        if depth <= 1 and name != module:
+            rows.append((int(cumulative), name))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--module", default="handlers")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="print one JSON object instead of text")
+    args = parser.parse_args()
+
+    runs = measure(args.module, args.runs)
+    times = [r["import_s"] for r in runs]
+    report = {
+        "module": args.module,
+        "runs": args.runs,
+        "import_ms_median": round(statistics.median(times) * 1000, 1),
+        "import_ms_min": round(min(times) * 1000, 1),
+        "side_effects": {k: v for k, v in runs[-1].items() if k != "import_s"},
+        "slowest_imports_ms": [
+            {"module": name, "cumulative_ms": round(us / 1000, 1)}
+            for us, name in slowest_imports(args.module, args.top)
+        ],
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"import {args.module}: median {report['import_ms_median']} ms, min {report['import_ms_min']} ms "
+          f"over {args.runs} fresh interpreters")
+    print("side effects after import:")
+    for key, value in report["side_effects"].items():
+        print(f"  {key:22s} {value}")
+    print("slowest imports (cumulative):")
+    for row in report["slowest_imports_ms"]:
+        print(f"  {row['cumulative_ms']:>9.1f} ms  {row['module']}")
+
+
+if __name__ == "__main__":
+    main()
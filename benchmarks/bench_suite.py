@@ -0,0 +1,320 @@
+# benchmarks/bench_suite.py
+"""
+Offline end-to-end benchmarks against a fake OpenWebUI (and, for the handler
+scenarios, a fake Telegram Bot API), using synthetic group-chat traffic.
+
+Scenarios:
+  ingest     messages/second through log_group_message (store + hot window)
+  summarize  summarize_categorized latency per window size
+  sentiment  window read + analyze_sentiment latency per window size
+  digest     one cross-group digest of DIGEST_BENCH_CHATS chats vs a
+             summarize_categorized per chat, and a repeat digest after a
+             few chats got new messages (sizes = messages per chat)
+  chat       one /chat turn (get_openai_response) with a full history
+  handlers   /summarize, /sentiment and /chat through the real telebot
+             handlers (needs pyTelegramBotAPI installed)
+
+Usage:
+    python -m benchmarks.bench_suite [--scenarios ingest,summarize] [--sizes 100,1000,5000]
+        [--runs 5] [--latency-ms 50] [--jitter-ms 0] [--error-rate 0]
+        [--output results.json] [--compare baseline.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from benchmarks.fakes import FakeOpenWebUI, FakeTelegram, load_offline_handlers, use_offline_environment
+from benchmarks.synthetic import SyntheticChat, to_update
+
+SCENARIOS = ("ingest", "summarize", "sentiment", "digest", "chat", "handlers")
+DIGEST_BENCH_CHATS = 12
+
+
+def latency_stats(samples):
+    """
+    Summarises durations in seconds as milliseconds: count, mean, p50/p95/p99, max.
+    """
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 2)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2),
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def _as_message(record):
+    """
+    Minimal stand-in for a telebot Message, enough for log_group_message.
+    """
+    return SimpleNamespace(
+        chat=SimpleNamespace(id=record["chat_id"]),
+        from_user=SimpleNamespace(
+            id=record["user_id"], username=record["user"], first_name=record["user"], is_bot=record["is_bot"]
+        ),
+        text=record["text"],
+    )
+
+
+def _seed_chat(chat_id, size, seed):
+    from utils.history import log_group_message
+
+    for record in SyntheticChat(chat_id=chat_id, seed=seed).messages(size, interval_s=0):
+        log_group_message(_as_message(record))
+
+
+def _llm_delta(openwebui, before):
+    after = openwebui.stats()
+    return {key: after[key] - before[key] for key in after}
+
+
+def bench_ingest(sizes, runs, openwebui, seed):
+    from utils.history import log_group_message
+    from utils import db_manager
+
+    results = {}
+    for size in sizes:
+        records = [_as_message(r) for r in SyntheticChat(chat_id=-100_100 - size, seed=seed).messages(size)]
+        start = time.perf_counter()
+        for message in records:
+            log_group_message(message)
+        elapsed = time.perf_counter() - start
+        results[str(size)] = {
+            "messages": size,
+            "seconds": round(elapsed, 4),
+            "messages_per_s": round(size / elapsed, 1),
+            "db_bytes": os.path.getsize(db_manager.DB_PATH) if os.path.exists(db_manager.DB_PATH) else None,
+        }
+    return results
+
+
+def bench_summarize(sizes, runs, openwebui, seed):
+    from services.summarize import summarize_categorized
+
+    results = {}
+    for size in sizes:
+        chat_id = -100_200 - size
+        _seed_chat(chat_id, size, seed)
+        samples, before = [], openwebui.stats()
+        for _ in range(runs):
+            start = time.perf_counter()
+            summarize_categorized(chat_id, bot_username="bench_bot")
+            samples.append(time.perf_counter() - start)
+        llm = _llm_delta(openwebui, before)
+        results[str(size)] = {
+            **latency_stats(samples),
+            "llm_calls_per_run": llm["requests"] / runs,
+            "prompt_chars_per_run": llm["prompt_chars"] // runs,
+            "llm_errors": llm["errors"],
+        }
+    return results
+
+
+def bench_sentiment(sizes, runs, openwebui, seed):
+    from services.sentiment import analyze_sentiment
+    from utils.history import get_last_6h_raw_messages
+
+    results = {}
+    for size in sizes:
+        chat_id = -100_300 - size
+        _seed_chat(chat_id, size, seed)
+        samples, before = [], openwebui.stats()
+        for _ in range(runs):
+            start = time.perf_counter()
+            analyze_sentiment(get_last_6h_raw_messages(chat_id, bot_username="bench_bot"))
+            samples.append(time.perf_counter() - start)
+        llm = _llm_delta(openwebui, before)
+        results[str(size)] = {
+            **latency_stats(samples),
+            "llm_calls_per_run": llm["requests"] / runs,
+            "prompt_chars_per_run": llm["prompt_chars"] // runs,
+            "llm_errors": llm["errors"],
+        }
+    return results
+
+
+def bench_digest(sizes, runs, openwebui, seed):
+    from services.digest import build_digest
+    from services.summarize import summarize_categorized
+
+    def measure(fn):
+        before, start = openwebui.stats(), time.perf_counter()
+        fn()
+        elapsed, llm = time.perf_counter() - start, _llm_delta(openwebui, before)
+        return {"seconds": round(elapsed, 3), "llm_calls": llm["requests"], "prompt_chars": llm["prompt_chars"]}
+
+    results = {}
+    for size in sizes:
+        chats = {-100_600 - size * 100 - i: f"Group {i}" for i in range(DIGEST_BENCH_CHATS)}
+        for i, chat_id in enumerate(chats):
+            _seed_chat(chat_id, size, seed + i)
+        row = {
+            "per_chat_summarize": measure(
+                lambda: [summarize_categorized(chat_id, bot_username="bench_bot") for chat_id in chats]
+            ),
+            "digest": measure(lambda: build_digest(chats, bot_username="bench_bot")),
+        }
+        # A quarter of the chats move on; the rest reuse their sections.
+        for i, chat_id in enumerate(list(chats)[:DIGEST_BENCH_CHATS // 4]):
+            _seed_chat(chat_id, 5, seed + 100 + i)
+        row["repeat_digest"] = measure(lambda: build_digest(chats, bot_username="bench_bot"))
+        results[str(size)] = row
+    return results
+
+
+def bench_chat(sizes, runs, openwebui, seed):
+    from config import get_settings
+    from services.conversation import history_tail_rows
+    from services.openwebui import get_openai_response
+    from utils.history import add_to_chat_history, get_chat_history
+
+    chat_id = -100_400
+    chat = SyntheticChat(chat_id=chat_id, seed=seed)
+    for i in range(get_settings().history_length):
+        add_to_chat_history(chat_id, "user" if i % 2 == 0 else "assistant", chat.text())
+
+    samples, before = [], openwebui.stats()
+    for _ in range(runs):
+        start = time.perf_counter()
+        get_openai_response(chat_id, chat.text(), get_chat_history(chat_id, limit=history_tail_rows()))
+        samples.append(time.perf_counter() - start)
+    llm = _llm_delta(openwebui, before)
+    return {"turn": {**latency_stats(samples), "llm_errors": llm["errors"]}}
+
+
+def bench_handlers(sizes, runs, openwebui, seed):
+    try:
+        from telebot import types
+    except ImportError:
+        return {"skipped": "pyTelegramBotAPI is not installed"}
+
+    with FakeTelegram() as telegram:
+        handlers = load_offline_handlers(telegram)
+        from utils.rate_limit import rate_limiter
+
+        results = {}
+        for size in sizes:
+            chat_id = -100_500 - size
+            chat = SyntheticChat(chat_id=chat_id, seed=seed)
+            _seed_chat(chat_id, size, seed)
+            admin_id, admin = chat.users[0]
+            per_command = {}
+            for command in ("/summarize", "/sentiment", "/chat what moved BTC today?"):
+                samples = []
+                for _ in range(runs):
+                    # A new message each time, so /summarize does not answer from its cache.
+                    _seed_chat(chat_id, 1, seed + len(samples) + 1)
+                    rate_limiter.reset(command.split()[0][1:], chat_id=chat_id)
+                    rate_limiter.reset("sentiment", user_id=admin_id)
+                    update = to_update(
+                        {"chat_id": chat_id, "user_id": admin_id, "user": admin, "is_bot": False, "text": command}
+                    )
+                    start = time.perf_counter()
+                    handlers.bot.process_new_updates([types.Update.de_json(update)])
+                    samples.append(time.perf_counter() - start)
+                per_command[command.split()[0]] = latency_stats(samples)
+            results[str(size)] = per_command
+        results["telegram"] = telegram.stats()
+    return results
+
+
+def compare(report, baseline):
+    """
+    Lines describing p50/throughput changes against a previous report.
+    """
+    lines = []
+    for scenario, sizes in report["results"].items():
+        for size, row in sizes.items():
+            old = baseline.get("results", {}).get(scenario, {}).get(size)
+            if not isinstance(row, dict) or not isinstance(old, dict):
+                continue
+            for key in ("p50_ms", "messages_per_s"):
+                if key in row and old.get(key):
+                    change = (row[key] - old[key]) / old[key] * 100
+                    lines.append(f"{scenario}[{size}] {key}: {old[key]} -> {row[key]} ({change:+.1f}%)")
+            for command, stats in row.items():
+                old_stats = old.get(command)
+                if isinstance(stats, dict) and isinstance(old_stats, dict) and old_stats.get("p50_ms"):
+                    change = (stats["p50_ms"] - old_stats["p50_ms"]) / old_stats["p50_ms"] * 100
+                    lines.append(
+                        f"{scenario}[{size}] {command} p50_ms: {old_stats['p50_ms']} -> {stats['p50_ms']} ({change:+.1f}%)"
+                    )
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="ingest,summarize,sentiment,chat",
+                        help=f"comma-separated, from: {', '.join(SCENARIOS)}")
+    parser.add_argument("--sizes", default="100,1000,5000", help="window sizes (messages)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=50, help="fake LLM latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of LLM requests answered with HTTP 500")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="previous JSON report to diff against")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    sizes = [int(s) for s in args.sizes.split(",")]
+
+    workdir = tempfile.mkdtemp(prefix="tgbot-bench-")
+    with FakeOpenWebUI(args.latency_ms, args.jitter_ms, args.error_rate, seed=args.seed) as openwebui:
+        use_offline_environment(openwebui, os.path.join(workdir, "bot_data.db"))
+        from config import get_settings
+
+        report = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "parameters": {**vars(args), "sizes": sizes, "scenarios": scenarios},
+            "settings": {
+                key: getattr(get_settings(), key)
+                for key in ("base_chunk_size", "chunk_workers", "llm_max_concurrency", "max_group_messages", "history_length")
+            },
+            "results": {},
+        }
+        runners = globals()
+        for scenario in scenarios:
+            print(f"running {scenario}...", file=sys.stderr)
+            report["results"][scenario] = runners[f"bench_{scenario}"](sizes, args.runs, openwebui, args.seed)
+        report["openwebui"] = openwebui.stats()
+        from services.llm_scheduler import llm_scheduler
+        report["llm_scheduler"] = llm_scheduler.stats()
+        from services.llm_client import circuit_states
+        report["circuits"] = circuit_states()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print("\nchanges vs baseline:", file=sys.stderr)
+        for line in compare(report, baseline) or ["(nothing comparable)"]:
+            print(f"  {line}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+# benchmarks/fakes.py
+"""
+Local stand-ins for the external services, so benchmarks run offline:
+
+- FakeOpenWebUI: POST /chat/completions with configurable latency and
+  injected HTTP errors.
+- FakeTelegram: enough of the Bot API (getMe, sendMessage, deleteMessage(s),
+  sendPhoto, getChatMember, getUpdates) for the real telebot client; point
+  telebot.apihelper.API_URL at `api_url`.
+
+Both run on 127.0.0.1 on a free port in a daemon thread.
+"""
+
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class _FakeServer:
+    """
+    Runs a ThreadingHTTPServer whose requests go to self.handle(method, path, query, body).
+    """
+
+    def __init__(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _dispatch(self, method):
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                status, payload = fake.handle(method, url.path, parse_qs(url.query), body, self.headers)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def handle(self, method, path, query, body, headers):
+        raise NotImplementedError
+
+
+class FakeOpenWebUI(_FakeServer):
+    """
+    Answers /chat/completions after `latency_ms` (+/- `jitter_ms`), failing a
+    fraction `error_rate` of requests with HTTP `error_status`.
+    The reply echoes a short, summary-shaped text.
+    """
+
+    def __init__(self, latency_ms=50, jitter_ms=0, error_rate=0.0, error_status=500, seed=0):
+        super().__init__()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.prompt_chars = 0
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def handle(self, method, path, query, body, headers):
+        if method != "POST" or not path.endswith("/chat/completions"):
+            return 404, {"detail": "Not Found"}
+        request = json.loads(body or b"{}")
+        with self.lock:
+            self.requests += 1
+            self.prompt_chars += sum(len(m.get("content") or "") for m in request.get("messages", []))
+            jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        time.sleep(max(0.0, self.latency_ms + jitter) / 1000)
+        if fail:
+            return self.error_status, {"detail": "injected error"}
+        bullets = (
+            "- **BTC** discussion stayed active with questions about the staking update.\n"
+            "- Members shared charts and debated short-term direction.\n"
+        )
+        prompt = "\n".join(m.get("content") or "" for m in request.get("messages", []))
+        # Like a model following the digest format: one answer per "### <group>" section.
+        sections = [line for line in prompt.split("\n") if line.startswith("### ")]
+        if len(sections) > 1:
+            content = "".join(f"{header}\n{bullets}" for header in sections)
+        else:
+            content = f"### Summary\n{bullets}Overall the mood was neutral to positive."
+        return 200, {
+            "id": f"fake-{self.requests}",
+            "object": "chat.completion",
+            "model": request.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        }
+
+    def stats(self):
+        with self.lock:
+            return {"requests": self.requests, "errors": self.errors, "prompt_chars": self.prompt_chars}
+
+
+class FakeTelegram(_FakeServer):
+    """
+    Minimal Bot API. Every user is reported as a chat administrator, so
+    trusted-only commands run. Sent texts are kept per method for inspection.
+    """
+
+    BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+    # Fields the Bot API always sends for an administrator (telebot requires them).
+    ADMIN_RIGHTS = (
+        "can_manage_chat", "can_delete_messages", "can_manage_video_chats", "can_restrict_members",
+        "can_promote_members", "can_change_info", "can_invite_users", "can_post_stories",
+        "can_edit_stories", "can_delete_stories",
+    )
+
+    def __init__(self, latency_ms=0):
+        super().__init__()
+        self.latency_ms = latency_ms
+        self._message_ids = itertools.count(1_000_000)
+        self.calls = {}
+        self.sent = []
+        self.updates = []
+
+    @property
+    def api_url(self):
+        # Format expected by telebot.apihelper.API_URL.
+        return f"http://127.0.0.1:{self.port}/bot{{0}}/{{1}}"
+
+    def _param(self, query, body, headers, name):
+        if name in query:
+            return query[name][0]
+        if body and "application/x-www-form-urlencoded" in (headers.get("Content-Type") or ""):
+            form = parse_qs(body.decode())
+            if name in form:
+                return form[name][0]
+        if body and "application/json" in (headers.get("Content-Type") or ""):
+            return json.loads(body).get(name)
+        return None
+
+    def _message(self, chat_id, text=None):
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "supergroup", "title": "Bench"},
+            "from": self.BOT_USER,
+            "text": text or "",
+        }
+
+    def handle(self, method, path, query, body, headers):
+        api_method = path.rsplit("/", 1)[-1]
+        with self.lock:
+            self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        param = lambda name: self._param(query, body, headers, name)
+
+        if api_method == "getMe":
+            result = self.BOT_USER
+        elif api_method in ("sendMessage", "sendPhoto"):
+            text = param("text") or param("caption")
+            with self.lock:
+                self.sent.append((api_method, param("chat_id"), text))
+            result = self._message(param("chat_id") or 0, text)
+        elif api_method in ("deleteMessage", "deleteMessages"):
+            result = True
+        elif api_method == "getChatMember":
+            user_id = int(param("user_id") or 0)
+            result = {
+                "status": "administrator",
+                "user": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+                "can_be_edited": False,
+                "is_anonymous": False,
+                **{right: True for right in self.ADMIN_RIGHTS},
+            }
+        elif api_method == "getUpdates":
+            with self.lock:
+                result, self.updates = self.updates, []
+        else:
+            return 404, {"ok": False, "error_code": 404, "description": f"Not Found: {api_method}"}
+        return 200, {"ok": True, "result": result}
+
+    def stats(self):
+        with self.lock:
+            return {"calls": dict(self.calls), "messages_sent": len(self.sent)}
+
+
+def use_offline_environment(openwebui, db_path, **overrides):
+    """
+    Points the bot's configuration at the fakes. Must run before config (or
+    any module importing it) is imported; real environment values win except
+    for the OpenWebUI URL. Also moves the SQLite file to `db_path` (and the
+    chat memory index next to it).
+    """
+    os.environ["OPENWEBUI_BASE_URL"] = openwebui.base_url
+    defaults = {
+        "API_KEY": "123456:bench",
+        "OPENWEBUI_API_KEY": "bench",
+        "STATE_BACKEND": "sqlite",
+        # Outbound sends are not what is being measured; keep the send
+        # scheduler's Telegram rate limits out of the way.
+        "TELEGRAM_GLOBAL_RATE": "1000",
+        "TELEGRAM_CHAT_RATE": "1000",
+        "TELEGRAM_CHAT_BURST": "1000",
+        "LOG_LEVEL": "WARNING",
+        # Keep the chat memory index next to the throwaway database.
+        "MEMORY_INDEX_DIR": os.path.join(os.path.dirname(db_path) or ".", "memory_index"),
+    }
+    defaults.update({key: str(value) for key, value in overrides.items()})
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+    from utils import db_manager
+    db_manager.DB_PATH = db_path
+
+
+def load_offline_handlers(telegram):
+    """
+    Imports the real handlers module wired to `telegram` (a running
+    FakeTelegram), with updates handled inline so a process_new_updates call
+    lasts exactly as long as its handler. Needs pyTelegramBotAPI.
+    """
+    from telebot import apihelper
+
+    apihelper.API_URL = telegram.api_url
+    import handlers
+
+    handlers.bot.threaded = False
+    # The fear & greed gauge calls a public API; keep the run offline.
+    handlers.get_fear_greed_value = lambda: (50, "Neutral")
+    handlers.send_resized_fear_greed_image = lambda *args, **kwargs: None
+    return handlers
@@ -0,0 +1,232 @@
+# benchmarks/replay.py
+"""
+Replays recorded group-chat traffic through the real handler stack against
+the local fakes, interleaving /summarize, /sentiment and /chat commands, and
+reports handler latency percentiles and database growth.
+
+The source is a bot_data.db (its group_chat_logs table) or a JSONL file with
+one {"chat_id", "user", "text", "timestamp"} object per line. The source is
+only read; the replay writes to a fresh database in a temporary directory.
+
+Usage:
+    python -m benchmarks.replay --db bot_data.db [--speed 60] [--limit 20000]
+    python -m benchmarks.replay --jsonl export.jsonl --speed 0 --summarize-rate 0.005
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from benchmarks.bench_suite import latency_stats
+from benchmarks.fakes import FakeOpenWebUI, FakeTelegram, load_offline_handlers, use_offline_environment
+from benchmarks.synthetic import to_update
+
+
+def read_db(path, chats=None, limit=None):
+    """
+    Yields messages from a bot_data.db, oldest first. Works with databases
+    from before the is_bot column existed.
+    """
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(group_chat_logs)")}
+        is_bot = "is_bot" if "is_bot" in columns else "0"
+        query = f"SELECT chat_id, user, text, timestamp, {is_bot} AS is_bot FROM group_chat_logs"
+        params = []
+        if chats:
+            query += f" WHERE chat_id IN ({','.join('?' * len(chats))})"
+            params.extend(chats)
+        query += " ORDER BY timestamp"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        for row in conn.execute(query, params):
+            yield dict(row)
+    finally:
+        conn.close()
+
+
+def read_jsonl(path, chats=None, limit=None):
+    """
+    Yields messages from a JSONL export in file order (build_schedule sorts them).
+    """
+    count = 0
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            if chats and str(row["chat_id"]) not in chats:
+                continue
+            yield row
+            count += 1
+            if limit and count >= limit:
+                return
+
+
+def build_schedule(messages, speed, rates, seed):
+    """
+    Turns recorded messages into (offset_seconds, kind, update) items. Bot
+    messages and recorded commands are dropped (bots never receive their own
+    messages, and commands are injected at the configured rates instead).
+    After each message, a command of each kind follows with its probability.
+    """
+    from utils.db_manager import is_command_text
+
+    rng = random.Random(seed)
+    schedule = []
+    users = {}
+    first = None
+    for row in sorted(messages, key=lambda row: row["timestamp"]):
+        if row.get("is_bot") or not row.get("text") or is_command_text(row["text"]):
+            continue
+        ts = datetime.fromisoformat(row["timestamp"])
+        first = first or ts
+        offset = (ts - first).total_seconds() / speed if speed else 0.0
+        user_id = users.setdefault(row["user"], 10_000 + len(users))
+        message = {"chat_id": int(row["chat_id"]), "user_id": user_id, "user": row["user"],
+                   "is_bot": False, "text": row["text"]}
+        schedule.append((offset, "message", to_update(message)))
+        for command, rate in rates.items():
+            if rng.random() < rate:
+                text = "/chat what is everyone talking about?" if command == "chat" else f"/{command}"
+                schedule.append((offset, command, to_update({**message, "text": text})))
+    return schedule
+
+
+def _db_footprint(path):
+    if not os.path.exists(path):
+        return {"bytes": 0, "group_chat_logs": 0, "chat_histories": 0}
+    conn = sqlite3.connect(path)
+    try:
+        counts = {
+            table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("group_chat_logs", "chat_histories")
+        }
+    finally:
+        conn.close()
+    size = sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+    return {"bytes": size, **counts}
+
+
+def replay(schedule, handlers, workers, ignore_cooldowns):
+    """
+    Feeds the schedule to the bot on `workers` threads (like telebot's own
+    pool), keeping to each item's offset. Latency is measured from the moment
+    an update is due to when its handler returns, so it includes any queueing.
+    Returns (latencies by kind, max lag behind schedule in seconds).
+    """
+    from telebot import types
+    from utils.rate_limit import rate_limiter
+
+    latencies = {}
+    lock = threading.Lock()
+    max_lag = 0.0
+
+    def run(kind, update, due):
+        if ignore_cooldowns and kind != "message":
+            msg = update["message"]
+            rate_limiter.reset(kind, chat_id=msg["chat"]["id"])
+            rate_limiter.reset(kind, user_id=msg["from"]["id"])
+        try:
+            handlers.bot.process_new_updates([types.Update.de_json(update)])
+        finally:
+            elapsed = time.perf_counter() - due
+            with lock:
+                latencies.setdefault(kind, []).append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="replay") as pool:
+        for offset, kind, update in schedule:
+            due = start + offset
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+            pool.submit(run, kind, update, due)
+    return latencies, max_lag
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--db", help="bot_data.db to replay (opened read-only)")
+    source.add_argument("--jsonl", help="JSONL export to replay")
+    parser.add_argument("--chats", help="comma-separated chat ids to replay (default: all)")
+    parser.add_argument("--limit", type=int, help="replay at most this many recorded messages")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="time compression: 1 = original pace, 60 = an hour per minute, 0 = no waiting")
+    parser.add_argument("--summarize-rate", type=float, default=0.002, help="/summarize per replayed message")
+    parser.add_argument("--sentiment-rate", type=float, default=0.001, help="/sentiment per replayed message")
+    parser.add_argument("--chat-rate", type=float, default=0.005, help="/chat per replayed message")
+    parser.add_argument("--ignore-cooldowns", action="store_true",
+                        help="reset command cooldowns so every injected command runs in full")
+    parser.add_argument("--workers", type=int, default=2, help="handler threads (telebot's default pool size is 2)")
+    parser.add_argument("--latency-ms", type=float, default=500, help="fake LLM latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    chats = [c.strip() for c in args.chats.split(",")] if args.chats else None
+    messages = read_db(args.db, chats, args.limit) if args.db else read_jsonl(args.jsonl, chats, args.limit)
+    rates = {"summarize": args.summarize_rate, "sentiment": args.sentiment_rate, "chat": args.chat_rate}
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="tgbot-replay-"), "bot_data.db")
+    with FakeOpenWebUI(args.latency_ms, args.jitter_ms, args.error_rate, seed=args.seed) as openwebui, \
+            FakeTelegram() as telegram:
+        use_offline_environment(openwebui, db_path)
+        handlers = load_offline_handlers(telegram)
+        from utils.state_store import get_state_store
+
+        get_state_store()
+        schedule = build_schedule(messages, args.speed, rates, args.seed)
+        if not schedule:
+            sys.exit("Nothing to replay.")
+        db_before = _db_footprint(db_path)
+        print(f"replaying {len(schedule)} updates over {schedule[-1][0]:.0f}s...", file=sys.stderr)
+
+        started = time.perf_counter()
+        latencies, max_lag = replay(schedule, handlers, args.workers, args.ignore_cooldowns)
+        wall = time.perf_counter() - started
+        db_after = _db_footprint(db_path)
+
+        messages_logged = db_after["group_chat_logs"] - db_before["group_chat_logs"]
+        report = {
+            "parameters": vars(args),
+            "updates": len(schedule),
+            "wall_s": round(wall, 2),
+            "scheduled_s": round(schedule[-1][0], 2),
+            "max_lag_s": round(max_lag, 3),
+            "latency": {kind: latency_stats(samples) for kind, samples in sorted(latencies.items())},
+            "db": {
+                "before": db_before,
+                "after": db_after,
+                "growth_bytes": db_after["bytes"] - db_before["bytes"],
+                "bytes_per_message": round((db_after["bytes"] - db_before["bytes"]) / messages_logged, 1)
+                if messages_logged else None,
+            },
+            "openwebui": openwebui.stats(),
+            "telegram": telegram.stats(),
+        }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
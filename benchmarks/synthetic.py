@@ -0,0 +1,102 @@
+# benchmarks/synthetic.py
+"""
+Seeded generator of crypto group-chat traffic for benchmarks: plain
+messages with slang and emoji, the odd command and bot message, and helpers
+to wrap them as raw Telegram update dicts.
+"""
+
+import itertools
+import random
+import time
+from datetime import datetime, timedelta
+
+_TICKERS = ["BTC", "ETH", "SOL", "ADA", "DOGE", "XRP", "LINK", "DOT"]
+_TEMPLATES = [
+    "{t} looking strong today 🚀",
+    "anyone else buying the {t} dip?",
+    "{t} to the moon 🌕🚀 wagmi",
+    "rekt on {t} again 😭 should have set a stop loss",
+    "gm! what's the plan for {t} this week?",
+    "{t} chart looks like a bull flag 📈",
+    "ngmi if you sell {t} here lol",
+    "just staked more {t}, APY is decent",
+    "is the {t} upgrade still on schedule?",
+    "whales dumping {t} 🐋📉 careful",
+    "{t} broke resistance, next target {n}k",
+    "fud everywhere about {t} but fundamentals unchanged",
+    "lfg {t} 🔥🔥",
+    "{t} funding rates look overheated",
+    "bought {n} {t} at the bottom, diamond hands 💎🙌",
+    "can someone explain how {t} bridging works?",
+]
+_COMMANDS = ["/summarize", "/sentiment", "/help", "/chat what happened to {t}?"]
+
+
+class SyntheticChat:
+    """
+    Deterministic stream of messages for one chat. `command_rate` and
+    `bot_rate` are the fractions of commands and bot-authored messages.
+    """
+
+    def __init__(self, chat_id=-1001000000000, users=40, seed=0, command_rate=0.02, bot_rate=0.01):
+        self.chat_id = chat_id
+        self.users = [(10_000 + i, f"trader{i}") for i in range(users)]
+        self.command_rate = command_rate
+        self.bot_rate = bot_rate
+        self._random = random.Random(seed)
+
+    def text(self):
+        r = self._random
+        template = r.choice(_COMMANDS) if r.random() < self.command_rate else r.choice(_TEMPLATES)
+        return template.format(t=r.choice(_TICKERS), n=r.randint(1, 120))
+
+    def messages(self, count, start=None, interval_s=5.0):
+        """
+        Yields `count` dicts {chat_id, user_id, user, is_bot, text, timestamp}
+        spaced about `interval_s` apart (exponential gaps), starting at `start`
+        (default: so the last message lands at "now").
+        """
+        r = self._random
+        now = datetime.now()
+        ts = start or now - timedelta(seconds=count * interval_s)
+        for _ in range(count):
+            ts += timedelta(seconds=r.expovariate(1 / interval_s) if interval_s else 0)
+            if r.random() < self.bot_rate:
+                user_id, user, is_bot = 1, "bench_bot", True
+            else:
+                (user_id, user), is_bot = r.choice(self.users), False
+            yield {
+                "chat_id": self.chat_id,
+                "user_id": user_id,
+                "user": user,
+                "is_bot": is_bot,
+                "text": self.text(),
+                "timestamp": min(ts, now).isoformat(),
+            }
+
+
+_update_ids = itertools.count(1)
+
+
+def to_update(message, message_id=None, date=None):
+    """
+    Wraps a message dict (as yielded by SyntheticChat.messages or read back
+    from the DB) as a raw Telegram `message` update.
+    """
+    update_id = next(_update_ids)
+    user_id = message.get("user_id") or 10_000 + (hash(message["user"]) % 100_000)
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": message_id or update_id,
+            "date": int(date if date is not None else time.time()),
+            "chat": {"id": message["chat_id"], "type": "supergroup", "title": "Bench"},
+            "from": {
+                "id": user_id,
+                "is_bot": bool(message.get("is_bot")),
+                "first_name": message["user"],
+                "username": message["user"],
+            },
+            "text": message["text"],
+        },
+    }
@@ -0,0 +1,25 @@
+# bootstrap.py
+
+import logging
+
+from config import validate_config
+from utils.logging_conf import setup_logging
+from utils.settings_watch import install_reload_triggers
+from utils.state_store import get_state_store
+
+logger = logging.getLogger(__name__)
+
+
+def bootstrap():
+    """
+    Process start-up, in order: validate config, install log handlers, open
+    the state backend (creating tables if needed), arm settings hot reload. Importing modules has no
+    such side effects; heavy clients (OpenAI SDK, Pillow) load on first use.
+    Returns the root logger.
+    """
+    validate_config()
+    root_logger = setup_logging()
+    get_state_store()
+    install_reload_triggers()
+    logger.debug("Bootstrap complete.")
+    return root_logger
@@ -1,16 +1,20 @@
 # bot.py
 
-from dotenv import load_dotenv
 import time
 import requests
 import logging
-from handlers import bot
-from utils.logging_conf import setup_logging
-
-load_dotenv()
+from bootstrap import bootstrap
+from config import SHARD_COUNT
+from handlers import bot, send_digest
+from services.digest import start_digest_schedule
+from utils.sharding import run_sharded
 
 if __name__ == "__main__":
-    logger = setup_logging()
+    logger = bootstrap()
+    start_digest_schedule(send_digest)
+    if SHARD_COUNT > 1:
+        run_sharded(bot)  # runs until the process exits
+
     logger.debug("Starting bot polling...")
 
     while True:
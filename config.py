@@ -1,34 +1,36 @@
 # config.py
 
-from dotenv import load_dotenv
+from dotenv import load_dotenv, find_dotenv, dotenv_values
+from dataclasses import dataclass, fields
 import os
 import sys
 import logging
+import threading
 
-# Load environment variables from a .env file
-load_dotenv()
+# Variables set in the real environment win over .env, now and on reload.
+_PROCESS_ENV = dict(os.environ)
+DOTENV_PATH = find_dotenv()
+
+# Load environment variables from a .env file. This is the only place it
+# happens: the values below are read from the environment at import time.
+load_dotenv(DOTENV_PATH)
 
 # --- Basic Configuration Constants ---
 API_KEY = os.environ.get('API_KEY')
 OPENWEBUI_API_KEY = os.environ.get('OPENWEBUI_API_KEY')
 OPENWEBUI_BASE_URL = os.environ.get('OPENWEBUI_BASE_URL')
-MODEL_NAME = os.environ.get('MODEL_NAME', 'default-model')
-MAX_TOKENS = int(os.environ.get('MAX_TOKENS', 500))
-TEMPERATURE = float(os.environ.get('TEMPERATURE', 0.7))
-HISTORY_LENGTH = int(os.environ.get('HISTORY_LENGTH', 10))
+# Optional second server used while the first is failing (see FALLBACK_MODEL_NAME)
+OPENWEBUI_FALLBACK_BASE_URL = os.environ.get('OPENWEBUI_FALLBACK_BASE_URL')
+OPENWEBUI_FALLBACK_API_KEY = os.environ.get('OPENWEBUI_FALLBACK_API_KEY', OPENWEBUI_API_KEY)
+# Circuit breaker: fail fast for CIRCUIT_RESET_SECONDS after this many failures in a row
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', 5))
+CIRCUIT_RESET_SECONDS = int(os.environ.get('CIRCUIT_RESET_SECONDS', 30))
 
 # --- Persistence and Rotation Settings ---
 ROTATION_THRESHOLD_HOURS = int(os.environ.get('ROTATION_THRESHOLD_HOURS', 6))
-MAX_GROUP_MESSAGES = int(os.environ.get('MAX_GROUP_MESSAGES', 1000))
 PERSIST_INTERVAL = int(os.environ.get('PERSIST_INTERVAL', 30))  # in seconds
 MAX_CHANGES_BEFORE_PERSIST = int(os.environ.get('MAX_CHANGES_BEFORE_PERSIST', 5))
 
-# --- Summarization Settings ---
-SUMMARIZATION_HOURS = int(os.getenv('SUMMARIZATION_HOURS', 6))  # Default: 6 hours
-
-# --- Cooldown Settings ---
-COOLDOWN_MINUTES = int(os.getenv("COOLDOWN_MINUTES", 10))  # Default: 10 minutes
-
 # --- Bing Grounding Search Settings ---
 BING_GROUNDING_API_KEY = os.getenv("BING_GROUNDING_API_KEY")
 BING_GROUNDING_ENDPOINT = os.getenv("BING_GROUNDING_ENDPOINT")
@@ -40,37 +42,271 @@ KB_MAPPINGS = {
     # Add more keyword-KB mappings as needed
 }
 
-# --- Chunk Processing ---
-BASE_CHUNK_SIZE = int(os.getenv("BASE_CHUNK_SIZE", 4000))  # Default to 4000 characters
+# --- State Backend and Sharding ---
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite").lower()  # sqlite | redis | memory
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", 1))  # number of bot workers splitting chats
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", 0))  # this worker's shard, 0..SHARD_COUNT-1
+# The router polls Telegram and hands updates to the shards; exactly one worker should do it.
+SHARD_ROUTER = os.getenv("SHARD_ROUTER", "1" if SHARD_INDEX == 0 else "0") == "1"
+
+# --- Sentiment Time Series ---
+# Restart-only: the bucket size is baked into the persisted series.
+SENTIMENT_BUCKET_SECONDS = int(os.getenv("SENTIMENT_BUCKET_SECONDS", 300))
+SENTIMENT_RETENTION_HOURS = int(os.getenv("SENTIMENT_RETENTION_HOURS", 24))
+SENTIMENT_FLUSH_SECONDS = int(os.getenv("SENTIMENT_FLUSH_SECONDS", 30))  # write-behind to the state store
+
+# --- Long-term Chat Memory ---
+# Vector index of past /chat turns and group messages (needs numpy); one pair of files per chat.
+MEMORY_INDEX_DIR = os.getenv("MEMORY_INDEX_DIR", "")  # default: memory_index/ next to the SQLite database
+MEMORY_MAX_ITEMS = int(os.getenv("MEMORY_MAX_ITEMS", 50000))  # per chat, newest kept
+
+# --- Cross-group Digest ---
+# Chats covered by /digest (comma-separated ids), and the admin chat that may
+# run it and receives the scheduled digest (DIGEST_INTERVAL_HOURS).
+DIGEST_CHAT_IDS = [int(cid) for cid in os.getenv("DIGEST_CHAT_IDS", "").replace(" ", "").split(",") if cid]
+DIGEST_ADMIN_CHAT_ID = int(os.getenv("DIGEST_ADMIN_CHAT_ID") or 0) or None
+
+# --- Tunable Settings (hot-reloadable) ---
+# Model, history, window, cooldown, send-rate, chunking and log-level knobs.
+# The module constants below are the values at start-up. Code that should pick
+# up changes without a restart reads get_settings() at the point of use; the
+# values are re-read from the environment/.env on SIGHUP or when .env changes
+# (see utils/settings_watch.py). Credentials, URLs, the state backend and
+# sharding stay restart-only.
+
+def _positive(value):
+    return value > 0
+
+_LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+
+
+def parse_log_sampling(spec):
+    """
+    Parses LOG_SAMPLING, e.g. "ingest=0.01,services.openwebui=0.1", into
+    {category: fraction of records kept}. Raises ValueError if malformed.
+    """
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        category, sep, rate = item.partition("=")
+        if not sep or not category.strip() or not 0 <= float(rate) <= 1:
+            raise ValueError(item)
+        rates[category.strip()] = float(rate)
+    return rates
+
+
+def _valid_sampling(spec):
+    try:
+        parse_log_sampling(spec)
+    except ValueError:
+        return False
+    return True
+
+# field name -> (env var, type, default, check, description of the check)
+_SETTINGS_SPEC = {
+    "model_name": ("MODEL_NAME", str, "default-model", bool, "must not be empty"),
+    "fallback_model_name": ("FALLBACK_MODEL_NAME", str, "", lambda v: True, ""),
+    "max_tokens": ("MAX_TOKENS", int, 500, _positive, "must be > 0"),
+    "temperature": ("TEMPERATURE", float, 0.7, lambda v: 0 <= v <= 2, "must be between 0 and 2"),
+    "history_length": ("HISTORY_LENGTH", int, 10, _positive, "must be > 0"),
+    "max_group_messages": ("MAX_GROUP_MESSAGES", int, 1000, _positive, "must be > 0"),
+    "hot_window_max_chats": ("HOT_WINDOW_MAX_CHATS", int, 200, _positive, "must be > 0"),
+    "summarization_hours": ("SUMMARIZATION_HOURS", int, 6, _positive, "must be > 0"),
+    "cooldown_minutes": ("COOLDOWN_MINUTES", int, 10, _positive, "must be > 0"),
+    "search_cooldown_seconds": ("SEARCH_COOLDOWN_SECONDS", int, 60, _positive, "must be > 0"),
+    "rate_limit_max_entries": ("RATE_LIMIT_MAX_ENTRIES", int, 50000, _positive, "must be > 0"),
+    "rate_limit_sweep_seconds": ("RATE_LIMIT_SWEEP_SECONDS", int, 60, _positive, "must be > 0"),
+    "telegram_global_rate": ("TELEGRAM_GLOBAL_RATE", float, 25, _positive, "must be > 0"),
+    "telegram_chat_rate": ("TELEGRAM_CHAT_RATE", float, 1, _positive, "must be > 0"),
+    "telegram_chat_burst": ("TELEGRAM_CHAT_BURST", int, 3, lambda v: v >= 1, "must be >= 1"),
+    "telegram_send_workers": ("TELEGRAM_SEND_WORKERS", int, 4, lambda v: v >= 1, "must be >= 1"),
+    "sentiment_remark": ("SENTIMENT_REMARK", int, 1, lambda v: v in (0, 1), "must be 0 or 1"),
+    "retrieval_top_k": ("RETRIEVAL_TOP_K", int, 4, lambda v: v >= 0, "must be >= 0"),
+    "chat_context_tokens": ("CHAT_CONTEXT_TOKENS", int, 3000, lambda v: v >= 500, "must be >= 500"),
+    "llm_max_concurrency": ("LLM_MAX_CONCURRENCY", int, 4, lambda v: v >= 1, "must be >= 1"),
+    "summarize_deadline_seconds": ("SUMMARIZE_DEADLINE_SECONDS", int, 120, lambda v: v >= 10, "must be >= 10"),
+    "sentiment_deadline_seconds": ("SENTIMENT_DEADLINE_SECONDS", int, 30, lambda v: v >= 5, "must be >= 5"),
+    "digest_interval_hours": ("DIGEST_INTERVAL_HOURS", int, 0, lambda v: v >= 0, "must be >= 0 (0 disables)"),
+    "digest_deadline_seconds": ("DIGEST_DEADLINE_SECONDS", int, 300, lambda v: v >= 30, "must be >= 30"),
+    "summary_token_budget": ("SUMMARY_TOKEN_BUDGET", int, 6000, lambda v: v == 0 or v >= 500, "must be 0 (off) or >= 500"),
+    "base_chunk_size": ("BASE_CHUNK_SIZE", int, 4000, lambda v: v >= 200, "must be >= 200"),
+    "chunk_workers": ("CHUNK_WORKERS", int, 2, lambda v: v >= 1, "must be >= 1"),
+    "log_level": ("LOG_LEVEL", str, "INFO", lambda v: v in _LOG_LEVELS, f"must be one of {', '.join(_LOG_LEVELS)}"),
+    "log_sampling": ("LOG_SAMPLING", str, "", _valid_sampling, "must look like 'category=rate,...' with rates in 0..1"),
+    "log_max_chars": ("LOG_MAX_CHARS", int, 1000, lambda v: v >= 50, "must be >= 50"),
+    "settings_watch_seconds": ("SETTINGS_WATCH_SECONDS", float, 5, lambda v: v >= 0, "must be >= 0 (0 disables)"),
+}
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    One validated, immutable snapshot of the tunable settings. A reload
+    swaps in a new snapshot; work already running keeps the one it read.
+    """
+    model_name: str
+    fallback_model_name: str
+    max_tokens: int
+    temperature: float
+    history_length: int
+    max_group_messages: int
+    hot_window_max_chats: int
+    summarization_hours: int
+    cooldown_minutes: int
+    search_cooldown_seconds: int
+    rate_limit_max_entries: int
+    rate_limit_sweep_seconds: int
+    telegram_global_rate: float
+    telegram_chat_rate: float
+    telegram_chat_burst: int
+    telegram_send_workers: int
+    sentiment_remark: int
+    retrieval_top_k: int
+    chat_context_tokens: int
+    llm_max_concurrency: int
+    summarize_deadline_seconds: int
+    sentiment_deadline_seconds: int
+    digest_interval_hours: int
+    digest_deadline_seconds: int
+    summary_token_budget: int
+    base_chunk_size: int
+    chunk_workers: int
+    log_level: str
+    log_sampling: str
+    log_max_chars: int
+    settings_watch_seconds: float
+
+    @classmethod
+    def from_env(cls, env):
+        """
+        Parses and validates every field from `env`; raises ValueError listing
+        all problems at once.
+        """
+        values = {}
+        errors = []
+        for name, (var, kind, default, check, rule) in _SETTINGS_SPEC.items():
+            raw = env.get(var)
+            try:
+                value = kind(default if raw in (None, "") else raw)
+            except ValueError:
+                errors.append(f"{var}={raw!r} is not a valid {kind.__name__}.")
+                continue
+            if kind is str and name == "log_level":
+                value = value.upper()
+            if not check(value):
+                errors.append(f"{var}={value!r} {rule}.")
+                continue
+            values[name] = value
+        if errors:
+            raise ValueError(" ".join(errors))
+        return cls(**values)
+
+    def changed_fields(self, other):
+        return [f.name for f in fields(self) if getattr(self, f.name) != getattr(other, f.name)]
+
+
+_settings = Settings.from_env(os.environ)
+_settings_lock = threading.Lock()
+_settings_listeners = []
+
+# Start-up values, for code that only needs them once.
+MODEL_NAME = _settings.model_name
+MAX_TOKENS = _settings.max_tokens
+TEMPERATURE = _settings.temperature
+HISTORY_LENGTH = _settings.history_length
+MAX_GROUP_MESSAGES = _settings.max_group_messages
+HOT_WINDOW_MAX_CHATS = _settings.hot_window_max_chats  # chats kept in memory
+SUMMARIZATION_HOURS = _settings.summarization_hours
+COOLDOWN_MINUTES = _settings.cooldown_minutes
+SEARCH_COOLDOWN_SECONDS = _settings.search_cooldown_seconds  # per chat
+RATE_LIMIT_MAX_ENTRIES = _settings.rate_limit_max_entries  # live cooldowns kept in memory
+RATE_LIMIT_SWEEP_SECONDS = _settings.rate_limit_sweep_seconds  # expiry sweep + snapshot
+TELEGRAM_GLOBAL_RATE = _settings.telegram_global_rate  # requests/second across all chats
+TELEGRAM_CHAT_RATE = _settings.telegram_chat_rate  # requests/second per chat
+TELEGRAM_CHAT_BURST = _settings.telegram_chat_burst  # short bursts allowed per chat
+TELEGRAM_SEND_WORKERS = _settings.telegram_send_workers
+BASE_CHUNK_SIZE = _settings.base_chunk_size  # characters per chunk
+
+
+def get_settings():
+    """
+    Returns the current Settings snapshot. Cheap; call it where the value is used.
+    """
+    return _settings
+
+
+def on_settings_change(callback):
+    """
+    Registers callback(old, new) to run after every reload that changes something.
+    """
+    with _settings_lock:
+        _settings_listeners.append(callback)
+    return callback
+
+
+def reload_settings():
+    """
+    Re-reads .env (the process environment still wins) and swaps in the new
+    settings if they validate. Invalid values are logged and ignored, keeping
+    the running settings. Returns the list of changed field names.
+    """
+    global _settings
+    env = dict(dotenv_values(DOTENV_PATH)) if DOTENV_PATH else {}
+    env.update(_PROCESS_ENV)
+    try:
+        new = Settings.from_env(env)
+    except ValueError as e:
+        logging.error(f"Settings reload rejected: {e}")
+        return []
+
+    with _settings_lock:
+        old = _settings
+        changed = new.changed_fields(old)
+        if not changed:
+            return []
+        _settings = new
+        listeners = list(_settings_listeners)
+
+    logging.info(f"Settings reloaded; changed: {', '.join(changed)}")
+    for callback in listeners:
+        try:
+            callback(old, new)
+        except Exception as e:
+            logging.error(f"Settings listener {getattr(callback, '__name__', callback)} failed: {e}", exc_info=True)
+    return changed
+
 
 # --- Critical Configuration Validation ---
-critical_vars = [
-    ('API_KEY', API_KEY),
-    ('OPENWEBUI_API_KEY', OPENWEBUI_API_KEY),
-    ('OPENWEBUI_BASE_URL', OPENWEBUI_BASE_URL),
-]
-
-# Check for missing critical environment variables
-missing_vars = [var_name for var_name, var_value in critical_vars if not var_value]
-if missing_vars:
-    for var_name in missing_vars:
-        logging.error(f"Critical configuration '{var_name}' is missing.")
-    sys.exit(1)
-
-# Validate Knowledge Base IDs
-for keyword, kb_id in KB_MAPPINGS.items():
-    if not kb_id:
-        logging.error(f"Knowledge Base ID for keyword '{keyword}' is missing.")
+def validate_config():
+    """
+    Logs every missing/invalid critical setting and exits if there are any.
+    Called once by bootstrap(), not at import, so importing config is side-effect free.
+    """
+    critical_vars = [
+        ('API_KEY', API_KEY),
+        ('OPENWEBUI_API_KEY', OPENWEBUI_API_KEY),
+        ('OPENWEBUI_BASE_URL', OPENWEBUI_BASE_URL),
+    ]
+    errors = [f"Critical configuration '{var_name}' is missing." for var_name, var_value in critical_vars if not var_value]
+
+    if not 0 <= SHARD_INDEX < SHARD_COUNT:
+        errors.append(f"SHARD_INDEX={SHARD_INDEX} is outside 0..{SHARD_COUNT - 1}.")
+    if SHARD_COUNT > 1 and STATE_BACKEND != "redis":
+        errors.append(f"SHARD_COUNT={SHARD_COUNT} needs STATE_BACKEND=redis; '{STATE_BACKEND}' is not shared between workers.")
+
+    # Validate Knowledge Base IDs
+    for keyword, kb_id in KB_MAPPINGS.items():
+        if not kb_id:
+            errors.append(f"Knowledge Base ID for keyword '{keyword}' is missing.")
+
+    if errors:
+        for error in errors:
+            logging.error(error)
         sys.exit(1)
 
 # --- Logging Configuration ---
-LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
-
-logging.basicConfig(
-    level=getattr(logging, LOG_LEVEL, logging.INFO),
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.StreamHandler(),  # Print logs to console
-        # Additional handlers (e.g., file logging) can be added here
-    ]
-)
+LOG_LEVEL = _settings.log_level
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+LOG_FILE = os.getenv("LOG_FILE", "bot.log")  # JSON lines, rotated at 5 MB
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))  # records waiting for the writer; extra ones are dropped
+# Handlers are installed by utils.logging_conf.setup_logging() during bootstrap.
@@ -1,45 +1,49 @@
 # handlers.py
 
+import html
 import logging
-import re
 import math
 import time
-from datetime import datetime, timedelta
+from datetime import datetime
 
 from telebot import TeleBot
-from telebot.apihelper import ApiTelegramException
 
-from config import API_KEY, KB_MAPPINGS, COOLDOWN_MINUTES
+from config import API_KEY, SHARD_COUNT, DIGEST_CHAT_IDS, DIGEST_ADMIN_CHAT_ID, get_settings
 from utils.helpers import is_group_chat, is_trusted_user
+from utils.kb_matcher import match_knowledge_bases
 from utils.history import (
     get_chat_history, 
-    get_summary_metadata,
     update_summary_metadata,
     add_to_chat_history,
     log_group_message,
     get_last_summary_message_ids,
-    get_last_warning_message_ids,
-    get_last_summarized_timestamp,
     get_last_6h_raw_messages,
+    find_group_messages,
 )
 from services.openwebui import get_openai_response
-from services.summarize import summarize_categorized
+from services.conversation import compact_snippet, history_tail_rows
+from services.llm_scheduler import PRIORITY_REPLY, PRIORITY_SUMMARY, PRIORITY_BACKGROUND
+from services.summarize import summarize_categorized, OUT_OF_TIME
+from services.digest import build_digest
 from services.image_analyser import analyze_image
+from utils.db_manager import MATCH_START, MATCH_END
 from utils.formatter import sanitize_html, markdown_to_telegram_html
-from services.sentiment import analyze_sentiment
+from services.sentiment import analyze_chat_sentiment
 from utils.telegram_utils import safe_send_message
+from utils.send_queue import OutboundScheduler, PRIORITY_STATUS
+from utils.message_cleanup import message_ids_from, schedule_cleanup
+from utils.summary_state import load_summary_state
+from utils.rate_limit import rate_limiter
 from services.sentiment_gauge import get_fear_greed_value, send_resized_fear_greed_image
 from services.bing_search_api import query_bing_api  # Our Bing search function
 
 logger = logging.getLogger(__name__)
 bot = TeleBot(API_KEY)
+FIND_RESULTS = 8
+# All outbound sends/deletes go through the rate-limited queue.
+# Shards share the bot's global limit, so each gets an equal slice of it.
+outbox = OutboundScheduler(bot, rate_share=1 / SHARD_COUNT)
 
-# Search cooldown in seconds (e.g. 60)
-SEARCH_COOLDOWN_SECONDS = 60
-search_cooldowns = {}
-
-# Dictionary to track user cooldowns for sentiment summarization
-user_cooldowns = {}
 
 
 @bot.message_handler(commands=['help'])
@@ -48,11 +52,49 @@ def help_command(message):
         "Available Commands:\n"
         "/summarize - Summarize the recent group chat\n"
         "/sentiment - Analyse the group sentiment\n"
-        "/chat <message> - Chat with the bot\n\n"
+        "/chat <message> - Chat with the bot\n"
+        "/find <words> - Search earlier messages of this group\n"
+        "/digest - One summary across the configured groups (admin chat)\n\n"
         "Reply to the bot to continue a conversation.\n"
         "Use '/chat search: <your query>' to do a Bing search."
     )
-    bot.send_message(message.chat.id, text)
+    outbox.send_message(message.chat.id, text)
+
+
+def _search_response(chat_id, query):
+    """
+    HTML answer to "search: <query>" (from /chat or a reply to the bot):
+    Bing results plus what this chat itself said, from the local search
+    index. If one source fails, the other is still shown.
+    """
+    try:
+        local_hits = find_group_messages(chat_id, query, limit=3)
+    except Exception as e:
+        logger.error(f"Local search error in chat_id={chat_id}: {e}", exc_info=True)
+        local_hits = []
+    local = "".join(f"<b>From this chat:</b>\n{_format_hit(hit)}\n\n" for hit in local_hits)
+
+    try:
+        results = query_bing_api(query=query, count=3, market="en-US")
+    except Exception as e:
+        logger.error(f"Bing Search error: {e}", exc_info=True)
+        if not local:
+            return f"Error calling Bing search: {e}"
+        results = []
+    if not results and not local:
+        return "I couldn't find any results for your query. Please try again."
+
+    response_chunks = []
+    for idx, r in enumerate(results, start=1):
+        chunk = (
+            f"<b>Result {idx}:</b>\n"
+            f"<b>{r['title']}</b>\n"
+            f"<i>{r['snippet']}</i>\n"
+            f"<a href='{r['url']}'>{r['url']}</a>\n\n"
+        )
+        response_chunks.append(chunk)
+    response = "".join(response_chunks) + local
+    return response + "Use this info for follow-up questions. If asked about these details, refer to the snippet above."
 
 
 @bot.message_handler(commands=['chat'])
@@ -71,81 +113,53 @@ def chat_command(message):
         if user_input.lower().startswith("search:"):
             search_query = user_input[len("search:"):].strip()
 
-            # Enforce search cooldown
+            # Enforce search cooldown (per chat)
             chat_id = message.chat.id
-            now = time.time()
-            last_search_time = search_cooldowns.get(chat_id, 0)
-            elapsed = now - last_search_time
-
-            if elapsed < SEARCH_COOLDOWN_SECONDS:
-                wait_sec = int(SEARCH_COOLDOWN_SECONDS - elapsed)
-                bot.send_message(
+            wait = rate_limiter.check("search", chat_id=chat_id)
+            if wait:
+                outbox.send_message(
                     chat_id,
-                    f"Please wait {wait_sec} second(s) before the next search."
+                    f"Please wait {math.ceil(wait)} second(s) before the next search."
                 )
                 return
-            # Update cooldown
-            search_cooldowns[chat_id] = now
-
-            # Execute Bing search
-            try:
-                results = query_bing_api(query=search_query, count=3, market="en-US")
-                if not results:
-                    response = "I couldn't find any results for your query. Please try again."
-                else:
-                    # Format results with HTML
-                    response_chunks = []
-                    for idx, r in enumerate(results, start=1):
-                        chunk = (
-                            f"<b>Result {idx}:</b>\n"
-                            f"<b>{r['title']}</b>\n"
-                            f"<i>{r['snippet']}</i>\n"
-                            f"<a href='{r['url']}'>{r['url']}</a>\n\n"
-                        )
-                        response_chunks.append(chunk)
-                    # Combine
-                    response = "".join(response_chunks)
-                    response += "Use this info for follow-up questions. If asked about these details, refer to the snippet above."
-            except Exception as e:
-                logger.error(f"Bing Search error: {e}", exc_info=True)
-                response = f"Error calling Bing search: {e}"
+
+            response = _search_response(chat_id, search_query)
 
             # Send to user & store in chat history
-            bot.send_message(
+            outbox.send_message(
                 message.chat.id,
                 response,
                 parse_mode="HTML",
                 reply_to_message_id=message.message_id
             )
-            snippet_text = "[WEB_SNIPPET]\n" + response
-            add_to_chat_history(message.chat.id, "assistant", snippet_text)
+            add_to_chat_history(message.chat.id, "assistant", compact_snippet("[WEB_SNIPPET]\n" + response))
 
         else:
             # 2) Normal GPT-based logic
             add_to_chat_history(message.chat.id, "user", user_input)
             # Retrieve the conversation context from the DB
-            context = get_chat_history(message.chat.id)
-            response = get_openai_response(message.chat.id, user_input, context)
-            add_to_chat_history(message.chat.id, "assistant", response)
+            context = get_chat_history(message.chat.id, limit=history_tail_rows())
+
+            # Optional: Knowledge Base detection (single pass over the input)
+            applied_kbs = match_knowledge_bases(user_input)
+            # get_openai_response stores the answer in the chat history.
+            response = get_openai_response(
+                message.chat.id, user_input, context, kb_ids=list(applied_kbs.values())
+            )
 
             # Convert Markdown-like formatting to Telegram HTML
             formatted_response = markdown_to_telegram_html(response)
 
-            # Optional: Knowledge Base detection
-            applied_kbs = [
-                kw for kw in KB_MAPPINGS
-                if re.search(r'\b' + re.escape(kw.lower()) + r'\b', user_input.lower())
-            ]
             if applied_kbs:
                 kb_names = ', '.join(applied_kbs)
-                bot.send_message(
+                outbox.send_message(
                     message.chat.id,
                     f"<b>Applied Knowledge Bases:</b> {kb_names}",
                     parse_mode='HTML',
                     reply_to_message_id=message.message_id
                 )
 
-            bot.send_message(
+            outbox.send_message(
                 message.chat.id,
                 formatted_response,
                 parse_mode='HTML',
@@ -154,7 +168,7 @@ def chat_command(message):
 
     except Exception as e:
         logger.error(f"Error in /chat command: {e}")
-        bot.send_message(
+        outbox.send_message(
             message.chat.id,
             "An unexpected error occurred. Please try again later."
         )
@@ -170,7 +184,7 @@ def chat_command(message):
 def reply_to_bot(message):
     """
     When user replies to the bot:
-       - If message text starts with "search:", perform a Bing search;
+       - If message text starts with "search:", search Bing and this chat's messages;
        - Otherwise use normal GPT logic with updated context if replying to a summary;
        - If it's a photo, perform image analysis.
     """
@@ -181,55 +195,31 @@ def reply_to_bot(message):
         user_input = message.text.strip()
         try:
             if user_input.lower().startswith("search:"):
-                # [Bing search logic remains unchanged]
                 chat_id = message.chat.id
-                now = time.time()
-                last_search_time = search_cooldowns.get(chat_id, 0)
-                elapsed = now - last_search_time
-                if elapsed < SEARCH_COOLDOWN_SECONDS:
-                    wait_sec = int(SEARCH_COOLDOWN_SECONDS - elapsed)
-                    bot.send_message(
+                wait = rate_limiter.check("search", chat_id=chat_id)
+                if wait:
+                    outbox.send_message(
                         chat_id,
-                        f"Please wait {wait_sec} second(s) before the next search."
+                        f"Please wait {math.ceil(wait)} second(s) before the next search."
                     )
                     return
-                search_cooldowns[chat_id] = now
 
                 search_query = user_input[len("search:"):].strip()
-                try:
-                    results = query_bing_api(query=search_query, count=3, market="en-US")
-                    if not results:
-                        response = "I couldn't find any results. Please try again."
-                    else:
-                        response_chunks = []
-                        for idx, r in enumerate(results, start=1):
-                            chunk = (
-                                f"<b>Result {idx}:</b>\n"
-                                f"<b>{r['title']}</b>\n"
-                                f"<i>{r['snippet']}</i>\n"
-                                f"<a href='{r['url']}'>{r['url']}</a>\n\n"
-                            )
-                            response_chunks.append(chunk)
-                        response = "".join(response_chunks)
-                        response += "Use this info for follow-up questions. If asked, refer to the snippet above."
-                except Exception as e:
-                    logger.error(f"Bing search error: {e}", exc_info=True)
-                    response = f"Error: {e}"
-
-                bot.send_message(
+                response = _search_response(chat_id, search_query)
+
+                outbox.send_message(
                     message.chat.id,
                     response,
                     parse_mode="HTML",
                     reply_to_message_id=message.message_id
                 )
-                snippet_text = "[WEB_SNIPPET]\n" + response
-                add_to_chat_history(message.chat.id, "assistant", snippet_text)
+                add_to_chat_history(message.chat.id, "assistant", compact_snippet("[WEB_SNIPPET]\n" + response))
 
             else:
                 # Normal GPT logic with enhanced context if replying to a summary.
                 add_to_chat_history(message.chat.id, "user", user_input)
                 # Retrieve the default conversation history:
-                context = get_chat_history(message.chat.id)
+                context = get_chat_history(message.chat.id, limit=history_tail_rows())
 
                 # Detect if this reply is to a summary:
                 summary_context = ""
@@ -242,29 +232,27 @@ def reply_to_bot(message):
                     # if "<!--SUMMARY_START-->" in message.reply_to_message.text:
                     #     summary_context = "\n[Context Reminder: The previous summary was:] " + message.reply_to_message.text
 
-                # Append the summary context to the conversation context if it exists:
-                if summary_context:
-                    context.append({"role": "system", "content": summary_context})
+                # The summary reminder goes just before the user's turn; the older history stays a cacheable prefix.
+                extra = [{"role": "system", "content": summary_context}] if summary_context else []
 
-                response = get_openai_response(message.chat.id, user_input, context)
-                add_to_chat_history(message.chat.id, "assistant", response)
+                applied_kbs = match_knowledge_bases(user_input)
+                response = get_openai_response(
+                    message.chat.id, user_input, context, kb_ids=list(applied_kbs.values()),
+                    priority=PRIORITY_REPLY, extra_messages=extra
+                )
 
                 formatted_response = markdown_to_telegram_html(response)
 
-                applied_kbs = [
-                    kw for kw in KB_MAPPINGS
-                    if re.search(r'\b' + re.escape(kw.lower()) + r'\b', user_input.lower())
-                ]
                 if applied_kbs:
                     kb_names = ', '.join(applied_kbs)
-                    bot.send_message(
+                    outbox.send_message(
                         message.chat.id,
                         f"<b>Applied Knowledge Bases:</b> {kb_names}",
                         parse_mode='HTML',
                         reply_to_message_id=message.message_id
                     )
 
-                bot.send_message(
+                outbox.send_message(
                     message.chat.id,
                     formatted_response,
                     parse_mode='HTML',
@@ -273,7 +261,7 @@ def reply_to_bot(message):
 
         except Exception as e:
             logger.error(f"Error handling reply: {e}", exc_info=True)
-            bot.send_message(
+            outbox.send_message(
                 message.chat.id,
                 "An unexpected error occurred. Please try again later."
             )
@@ -285,14 +273,14 @@ def reply_to_bot(message):
             image_analysis = analyze_image(image_bytes)
             add_to_chat_history(message.chat.id, "user", "[User sent an image]")
             add_to_chat_history(message.chat.id, "assistant", image_analysis)
-            bot.send_message(
+            outbox.send_message(
                 message.chat.id,
                 text=f"Here's what I see:\n\n{image_analysis}",
                 reply_to_message_id=message.message_id
             )
         except Exception as e:
             logger.error(f"Error handling photo reply: {e}", exc_info=True)
-            bot.send_message(
+            outbox.send_message(
                 message.chat.id,
                 f"An error occurred while analyzing the photo: {e}"
             )
@@ -302,95 +290,63 @@ def reply_to_bot(message):
 def summarize_group_chat_command(message):
     logger.debug(f"Summarize command in chat_id={message.chat.id} by user_id={message.from_user.id}")
     if not is_group_chat(message):
-        bot.send_message(message.chat.id, "This command is only available in group chats.")
+        outbox.send_message(message.chat.id, "This command is only available in group chats.")
         return
 
     cid = message.chat.id
     user_id = message.from_user.id
 
+    # One state read per command (cached after the first); stale messages are
+    # deleted after the reply goes out.
+    state = load_summary_state(cid)
+    old_warning_ids = state.last_warning_message_ids
+
     if not is_trusted_user(bot, cid, user_id):
-        last_warning_ids = get_last_warning_message_ids(cid)
-        for mid in last_warning_ids:
-            try:
-                bot.delete_message(cid, mid)
-            except ApiTelegramException as exc:
-                msg_str = str(exc)
-                if "message to delete not found" in msg_str:
-                    logger.debug(f"Warning message {mid} not found.")
-                else:
-                    logger.warning(f"Could not delete old warning message_id={mid}: {exc}")
-
-        warning_msg = bot.send_message(cid, "⚠️ Only trusted (admin/titled) users can request a summary.")
+        warning_msg = outbox.send_message(cid, "⚠️ Only trusted (admin/titled) users can request a summary.", priority=PRIORITY_STATUS)
         update_summary_metadata(cid, last_warning_message_ids=[warning_msg.message_id])
+        schedule_cleanup(outbox, cid, old_warning_ids, reason="old summarize warnings")
         return
 
-    meta = get_summary_metadata(cid)
-    last_summary_time_str = meta.get("last_summary_time")
-    last_summary_result = meta.get("last_summary_result")
-    last_summarized_ts = get_last_summarized_timestamp(cid)
+    last_summary_result = state.last_summary_result
+    last_summarized_ts = state.last_summarized_timestamp
     now = datetime.now()
 
-    if last_summary_time_str:
-        last_summary_time = datetime.fromisoformat(last_summary_time_str)
-        elapsed = (now - last_summary_time).total_seconds() / 60
-        if elapsed < COOLDOWN_MINUTES:
-            wait_time = math.ceil(COOLDOWN_MINUTES - elapsed)
-            last_warning_ids = get_last_warning_message_ids(cid)
-            for mid in last_warning_ids:
-                try:
-                    bot.delete_message(cid, mid)
-                except ApiTelegramException as exc:
-                    msg_str = str(exc)
-                    if "message to delete not found" in msg_str:
-                        logger.debug(f"Warning message {mid} not found.")
-                    else:
-                        logger.warning(f"Could not delete old warning message_id={mid}: {exc}")
-
-            warning_msg = bot.send_message(
-                cid,
-                f"⏳ Please wait another {wait_time} minute(s) before requesting another summary."
-            )
-            update_summary_metadata(cid, last_warning_message_ids=[warning_msg.message_id])
-            return
+    # The cooldown is reserved now, so concurrent requests cannot all get
+    # through, and refunded below if no summary goes out.
+    wait = rate_limiter.check("summarize", chat_id=cid)
+    if wait:
+        warning_msg = outbox.send_message(
+            cid,
+            f"⏳ Please wait another {math.ceil(wait / 60)} minute(s) before requesting another summary.",
+            priority=PRIORITY_STATUS
+        )
+        update_summary_metadata(cid, last_warning_message_ids=[warning_msg.message_id])
+        schedule_cleanup(outbox, cid, old_warning_ids, reason="old summarize warnings")
+        return
 
-    progress_msg = bot.send_message(cid, "🛠️ Working on your summary, please wait...")
+    progress_msg = outbox.send_message(cid, "🛠️ Working on your summary, please wait...", priority=PRIORITY_STATUS)
+    # End-to-end budget: chunk calls, retries and the merge all stop by then.
+    deadline = time.monotonic() + get_settings().summarize_deadline_seconds
+    stale_ids = message_ids_from(state.last_summary_message_ids, state.last_warning_message_ids)
+    sent = False
 
     try:
-        recent_raw_messages = get_last_6h_raw_messages(cid, bot_username=bot.get_me().username, hours=6)
+        recent_raw_messages = get_last_6h_raw_messages(cid, bot_username=bot.get_me().username)
+
+        # Messages come back oldest first, so only the last timestamp needs parsing.
+        newest_msg_ts = (
+            datetime.fromisoformat(recent_raw_messages[-1]['timestamp']) if recent_raw_messages else None
+        )
 
         have_newer = True
         if last_summarized_ts:
-            have_newer = any(
-                datetime.fromisoformat(msg['timestamp']) > last_summarized_ts
-                for msg in recent_raw_messages
-            )
+            have_newer = newest_msg_ts is not None and newest_msg_ts > last_summarized_ts
 
         if last_summary_result and not have_newer:
-            old_summary_ids = get_last_summary_message_ids(cid)
-            for mid in old_summary_ids:
-                try:
-                    bot.delete_message(cid, mid)
-                except ApiTelegramException as exc:
-                    msg_str = str(exc)
-                    if "message to delete not found" in msg_str:
-                        logger.debug(f"Old summary message_id={mid} not found.")
-                    else:
-                        logger.warning(f"Could not delete old summary message_id={mid}: {exc}")
-
-            old_warning_ids = get_last_warning_message_ids(cid)
-            for mid in old_warning_ids:
-                try:
-                    bot.delete_message(cid, mid)
-                except ApiTelegramException as exc:
-                    msg_str = str(exc)
-                    if "message to delete not found" in msg_str:
-                        logger.debug(f"Warning message {mid} not found.")
-                    else:
-                        logger.warning(f"Could not delete old warning message_id={mid}: {exc}")
-
-            bot.send_message(cid, "ℹ️ No new messages since last summary. Here's the cached summary:")
+            outbox.send_message(cid, "ℹ️ No new messages since last summary. Here's the cached summary:")
             cached_summary_formatted = markdown_to_telegram_html(last_summary_result)
-            msg_ids = safe_send_message(bot, cid, cached_summary_formatted, parse_mode='HTML')
+            msg_ids = safe_send_message(outbox, cid, cached_summary_formatted, parse_mode='HTML', min_interval=0)
+            sent = True
 
             update_summary_metadata(
                 cid,
@@ -401,47 +357,18 @@ def summarize_group_chat_command(message):
             )
             return
 
-        old_summary_ids = get_last_summary_message_ids(cid)
-        for mid in old_summary_ids:
-            try:
-                bot.delete_message(cid, mid)
-            except ApiTelegramException as exc:
-                msg_str = str(exc)
-                if "message to delete not found" in msg_str:
-                    logger.debug(f"Summary message {mid} not found.")
-                else:
-                    logger.warning(f"Could not delete old summary message_id={mid}: {exc}")
-
-        old_warning_ids = get_last_warning_message_ids(cid)
-        for mid in old_warning_ids:
-            try:
-                bot.delete_message(cid, mid)
-            except ApiTelegramException as exc:
-                msg_str = str(exc)
-                if "message to delete not found" in msg_str:
-                    logger.debug(f"Warning msg {mid} missing.")
-                else:
-                    logger.warning(f"Could not delete old warning message_id={mid}: {exc}")
-
-        summary = summarize_categorized(cid, bot_username=bot.get_me().username)
+        summary = summarize_categorized(cid, bot_username=bot.get_me().username, deadline=deadline)
         if not summary or "An error occurred" in summary:
-            try:
-                bot.delete_message(cid, progress_msg.message_id)
-            except:
-                pass
-            bot.send_message(cid, "❌ Sorry, I couldn't generate a summary at this time.")
+            outbox.send_message(cid, "❌ Sorry, I couldn't generate a summary at this time.")
+        elif summary.startswith(OUT_OF_TIME):
+            # Not a summary, so neither cached nor counted against the cooldown.
+            outbox.send_message(cid, summary)
         else:
-            try:
-                bot.delete_message(cid, progress_msg.message_id)
-            except:
-                pass
-
             summary_formatted = markdown_to_telegram_html(summary)
-            new_message_ids = safe_send_message(bot, cid, summary_formatted, parse_mode='HTML')
+            new_message_ids = safe_send_message(outbox, cid, summary_formatted, parse_mode='HTML', min_interval=0)
+            sent = True
 
-            if recent_raw_messages:
-                newest_msg_ts = max(datetime.fromisoformat(msg['timestamp']) for msg in recent_raw_messages)
-            else:
+            if newest_msg_ts is None:
                 newest_msg_ts = now
 
             update_summary_metadata(
@@ -454,12 +381,15 @@ def summarize_group_chat_command(message):
 
     except Exception as e:
         logger.error(f"Error summarizing chat: {e}")
-        bot.send_message(cid, "❌ An error occurred while attempting to summarize.")
+        outbox.send_message(cid, "❌ An error occurred while attempting to summarize.")
     finally:
-        try:
-            bot.delete_message(cid, progress_msg.message_id)
-        except:
-            pass
+        if not sent:
+            rate_limiter.refund("summarize", chat_id=cid)
+        # Old summaries, old warnings and the progress note go in one batched delete.
+        schedule_cleanup(
+            outbox, cid, stale_ids + [progress_msg.message_id],
+            reason="summarize", priority=PRIORITY_STATUS
+        )
 
 
 @bot.message_handler(commands=['sentiment'])
@@ -467,55 +397,150 @@ def sentiment_command(message):
     logger.debug(f"Sentiment command in chat_id={message.chat.id}, user_id={message.from_user.id}")
     cid = message.chat.id
     user_id = message.from_user.id
-    current_time = datetime.now()
 
     if not is_group_chat(message):
-        bot.send_message(cid, "This command is only available in group chats.")
+        outbox.send_message(cid, "This command is only available in group chats.")
         return
 
     if not is_trusted_user(bot, cid, user_id):
-        warning_msg = bot.send_message(cid, "⚠️ Only trusted (admin/titled) users can request sentiment analysis.")
+        warning_msg = outbox.send_message(cid, "⚠️ Only trusted (admin/titled) users can request sentiment analysis.", priority=PRIORITY_STATUS)
         update_summary_metadata(cid, last_warning_message_ids=[warning_msg.message_id])
         return
 
-    cooldown_end = user_cooldowns.get(user_id)
-    if cooldown_end and current_time < cooldown_end:
-        remaining_time = (cooldown_end - current_time).total_seconds() / 60
-        wait_time = math.ceil(remaining_time)
-        bot.send_message(cid, f"⏳ Please wait {wait_time} minute(s) before requesting sentiment analysis again.")
+    wait = rate_limiter.check("sentiment", user_id=user_id)
+    if wait:
+        outbox.send_message(cid, f"⏳ Please wait {math.ceil(wait / 60)} minute(s) before requesting sentiment analysis again.")
         return
 
-    user_cooldowns[user_id] = current_time + timedelta(minutes=COOLDOWN_MINUTES)
-
-    progress_msg = bot.send_message(cid, "🛠️ Analyzing sentiment, please wait...")
+    progress_msg = outbox.send_message(cid, "🛠️ Analyzing sentiment, please wait...", priority=PRIORITY_STATUS)
+    deadline = time.monotonic() + get_settings().sentiment_deadline_seconds
 
     try:
-        recent_raw_messages = get_last_6h_raw_messages(cid, bot_username=bot.get_me().username)
-        if not recent_raw_messages:
-            bot.send_message(cid, "No messages found for sentiment analysis.")
+        sentiment_result = analyze_chat_sentiment(cid, bot_username=bot.get_me().username, deadline=deadline)
+        if sentiment_result is None:
+            outbox.send_message(cid, "No messages found for sentiment analysis.")
             return
 
-        sentiment_result = analyze_sentiment(recent_raw_messages)
         sentiment_result_formatted = markdown_to_telegram_html(sentiment_result)
 
-        bot.send_message(cid, sentiment_result_formatted, parse_mode='HTML')
+        outbox.send_message(cid, sentiment_result_formatted, parse_mode='HTML')
 
         global_value, global_class = get_fear_greed_value()
-        send_resized_fear_greed_image(bot, cid, global_value, global_class, width=250)
+        send_resized_fear_greed_image(outbox, cid, global_value, global_class, width=250)
 
     except Exception as e:
         logger.error(f"Error analyzing sentiment in chat_id={cid}: {e}", exc_info=True)
-        bot.send_message(cid, "❌ An error occurred while analyzing sentiment.")
+        outbox.send_message(cid, "❌ An error occurred while analyzing sentiment.")
     finally:
+        schedule_cleanup(outbox, cid, [progress_msg.message_id], reason="sentiment", priority=PRIORITY_STATUS)
+
+
+def _format_hit(hit):
+    """
+    One search hit as Telegram HTML: author, date and the snippet with the
+    matched words in bold.
+    """
+    snippet = html.escape(hit["snippet"] or "").replace(MATCH_START, "<b>").replace(MATCH_END, "</b>")
+    return f"<i>{html.escape(hit['user'] or '?')}, {(hit['timestamp'] or '')[:16].replace('T', ' ')}</i>\n{snippet}"
+
+
+@bot.message_handler(commands=['find'])
+def find_command(message):
+    """
+    /find <words> - earlier messages of this group containing every word,
+    best matches first. "Quoted phrases" and prefix* words are supported.
+    """
+    cid = message.chat.id
+    if not is_group_chat(message):
+        outbox.send_message(cid, "This command is only available in group chats.")
+        return
+
+    query = message.text.replace(f"/find@{bot.get_me().username}", "").replace("/find", "", 1).strip()
+    if not query:
+        outbox.send_message(cid, "Usage: /find <words>, e.g. /find \"price target\" eth*")
+        return
+
+    started = time.monotonic()
+    try:
+        hits = find_group_messages(cid, query, limit=FIND_RESULTS)
+    except Exception as e:
+        logger.error(f"Error searching chat_id={cid}: {e}", exc_info=True)
+        outbox.send_message(cid, "❌ An error occurred while searching.")
+        return
+    logger.debug(f"/find in chat_id={cid}: {len(hits)} hit(s) in {(time.monotonic() - started) * 1000:.1f}ms")
+
+    if not hits:
+        outbox.send_message(cid, f"No messages found for <i>{html.escape(query)}</i>.", parse_mode="HTML")
+        return
+    text = "\n\n".join(_format_hit(hit) for hit in hits)
+    outbox.send_message(cid, text, parse_mode="HTML", reply_to_message_id=message.message_id)
+
+
+def _digest_titles():
+    """
+    {chat_id: title} for DIGEST_CHAT_IDS (the id if Telegram cannot tell).
+    """
+    titles = {}
+    for chat_id in DIGEST_CHAT_IDS:
         try:
-            bot.delete_message(cid, progress_msg.message_id)
-        except Exception as ex:
-            logger.warning(f"Failed to delete progress message: {ex}")
+            titles[chat_id] = bot.get_chat(chat_id).title or str(chat_id)
+        except Exception as e:
+            logger.warning(f"Could not get the title of chat {chat_id}: {e}")
+            titles[chat_id] = str(chat_id)
+    return titles
+
+
+def send_digest(chat_id, priority=PRIORITY_BACKGROUND):
+    """
+    Builds the digest of DIGEST_CHAT_IDS and sends it to `chat_id`.
+    Returns False if there was nothing to send. Also run by the digest schedule.
+    """
+    deadline = time.monotonic() + get_settings().digest_deadline_seconds
+    digest = build_digest(_digest_titles(), bot_username=bot.get_me().username, deadline=deadline, priority=priority)
+    if not digest:
+        return False
+    safe_send_message(outbox, chat_id, markdown_to_telegram_html(digest), parse_mode='HTML', min_interval=0)
+    return True
+
+
+@bot.message_handler(commands=['digest'])
+def digest_command(message):
+    """
+    /digest - one summary across all DIGEST_CHAT_IDS; admin chat only.
+    """
+    cid = message.chat.id
+    if not DIGEST_CHAT_IDS or cid != DIGEST_ADMIN_CHAT_ID:
+        outbox.send_message(cid, "The digest is only available in the configured admin chat.")
+        return
+
+    if is_group_chat(message) and not is_trusted_user(bot, cid, message.from_user.id):
+        outbox.send_message(cid, "⚠️ Only trusted (admin/titled) users can request a digest.", priority=PRIORITY_STATUS)
+        return
+
+    # Reserved now so concurrent requests cannot all run; refunded below if no digest goes out.
+    wait = rate_limiter.check("digest", chat_id=cid)
+    if wait:
+        outbox.send_message(cid, f"⏳ Please wait {math.ceil(wait / 60)} minute(s) before requesting another digest.")
+        return
+
+    sent = False
+    progress_msg = None
+    try:
+        progress_msg = outbox.send_message(cid, "🛠️ Working on the digest, please wait...", priority=PRIORITY_STATUS)
+        sent = send_digest(cid, priority=PRIORITY_SUMMARY)
+        if not sent:
+            outbox.send_message(cid, "No recent messages to digest.")
+    except Exception as e:
+        logger.error(f"Error building the digest for chat_id={cid}: {e}", exc_info=True)
+        outbox.send_message(cid, "❌ An error occurred while building the digest.")
+    finally:
+        if not sent:
+            rate_limiter.refund("digest", chat_id=cid)
+        if progress_msg is not None:
+            schedule_cleanup(outbox, cid, [progress_msg.message_id], reason="digest", priority=PRIORITY_STATUS)
 
 
 @bot.message_handler(func=lambda m: is_group_chat(m))
 def handle_group_message(message):
-    logger.debug(
-        f"Group msg from {message.from_user.username} in {message.chat.id}: {message.text}"
-    )
+    # Runs for every group message; log_group_message emits the (sampled) debug record.
     log_group_message(message)
\ No newline at end of file
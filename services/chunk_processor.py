@@ -2,44 +2,74 @@
 
 import requests
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+from dataclasses import replace
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
 
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
-from config import (
-    OPENWEBUI_BASE_URL,
-    OPENWEBUI_API_KEY,
-    MODEL_NAME,
-    MAX_TOKENS,
-    TEMPERATURE,
-    BASE_CHUNK_SIZE
-)
-from utils.formatter import sanitize_html, replace_markdown_bold
+from config import get_settings
+from services.llm_client import complete
+from services.llm_scheduler import PRIORITY_BACKGROUND
+from utils.formatter import clean_model_output
 
 logger = logging.getLogger(__name__)
 
-def create_session_with_retry(total_retries=3, backoff_factor=1):
+class DeadlineRetry(Retry):
+    """
+    Retry that also gives up once the next backoff would run past `deadline`
+    (a time.monotonic() value), so retries never outlast the caller's budget.
+    """
+
+    def __init__(self, *args, deadline=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.deadline = deadline
+
+    def new(self, **kw):
+        retry = super().new(**kw)
+        retry.deadline = self.deadline
+        return retry
+
+    def is_exhausted(self):
+        if self.deadline is not None and time.monotonic() + self.get_backoff_time() >= self.deadline:
+            return True
+        return super().is_exhausted()
+
+
+def remaining_seconds(deadline):
+    """
+    Seconds left until a time.monotonic() `deadline` (None = no deadline).
+    """
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def create_session_with_retry(total_retries=3, backoff_factor=1, deadline=None):
     """
     Create a requests.Session with a retry strategy to handle transient errors.
+    With a `deadline`, no retry starts if its backoff would end past it.
     """
     session = requests.Session()
-    retry_strategy = Retry(
+    retry_strategy = DeadlineRetry(
         total=total_retries,
         backoff_factor=backoff_factor,
         status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=["POST"]
+        allowed_methods=["POST"],
+        deadline=deadline,
     )
     adapter = HTTPAdapter(max_retries=retry_strategy)
     session.mount("http://", adapter)
     session.mount("https://", adapter)
     return session
 
-def chunk_text(text, chunk_size=BASE_CHUNK_SIZE):
+def chunk_text(text, chunk_size=None):
     """
-    Splits text into chunks of approximately `chunk_size` characters.
+    Splits text into chunks of approximately `chunk_size` characters
+    (default: the current BASE_CHUNK_SIZE setting).
     Tries to split on newline if possible.
     """
+    if chunk_size is None:
+        chunk_size = get_settings().base_chunk_size
     text = text.strip()
     if len(text) <= chunk_size:
         return [text]
@@ -58,72 +88,131 @@ def chunk_text(text, chunk_size=BASE_CHUNK_SIZE):
         start = end
     return chunks
 
-def call_openwebui(prompt, session=None, timeout=60):
+def call_openwebui(prompt, session=None, timeout=60, chat_id=None, priority=PRIORITY_BACKGROUND, deadline=None):
     """
-    Sends a single prompt to the OpenWebUI /chat/completions endpoint.
-    Returns the content (string) or an error string if something goes wrong.
+    Sends a single prompt to OpenWebUI (see services.llm_client.complete),
+    queued in the LLM scheduler under `priority` for `chat_id`.
+    With a `deadline` (time.monotonic()), the request timeout is cut to the
+    time left and nothing is sent once it has passed.
+    Returns an LLMResult; on success its text is cleaned up for Telegram.
     """
     if session is None:
-        session = create_session_with_retry()
-
-    data = {
-        "model": MODEL_NAME,
-        "messages": [{"role": "user", "content": prompt}],
-        "max_tokens": MAX_TOKENS,
-        "temperature": TEMPERATURE
-    }
-
-    try:
-        response = session.post(
-            f"{OPENWEBUI_BASE_URL}/chat/completions",
-            headers={
-                "Authorization": f"Bearer {OPENWEBUI_API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json=data,
-            timeout=timeout
-        )
-        response.raise_for_status()
-        resp_json = response.json()
-        if 'choices' in resp_json and resp_json['choices']:
-            content = resp_json['choices'][0]['message']['content']
-            # Clean up the content
-            content = sanitize_html(content)
-            content = replace_markdown_bold(content)
-            return content.strip()
-        else:
-            logger.warning("No 'choices' in response from OpenWebUI.")
-            return "No content returned."
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error calling OpenWebUI: {e}")
-        return f"Error: {e}"
+        session = create_session_with_retry(deadline=deadline)
+    result = complete(
+        [{"role": "user", "content": prompt}],
+        session=session, timeout=timeout, chat_id=chat_id, priority=priority, deadline=deadline,
+    )
+    if not result:
+        return result
+    # Clean up the content (sanitize + **bold** in one pass)
+    return replace(result, text=clean_model_output(result.text).strip())
+
+def run_prompts(
+    prompts,
+    parallel=False,
+    max_workers=None,
+    chunk_timeout=60,
+    chat_id=None,
+    priority=PRIORITY_BACKGROUND,
+    deadline=None,
+):
+    """
+    Sends each prompt to OpenWebUI and returns their texts in order.
+
+    A call that fails with a retryable error is tried once more. Prompts
+    that still fail, or are still pending when the `deadline`
+    (time.monotonic()) comes, are cancelled and come back as None.
+    """
+    if max_workers is None:
+        max_workers = get_settings().chunk_workers
+    total_chunks = len(prompts)
+    session = create_session_with_retry(deadline=deadline)
+    results_in_order = [None] * total_chunks
+
+    def run_chunk(idx, prompt):
+        result = call_openwebui(prompt, session, chunk_timeout, chat_id, priority, deadline)
+        if result.retryable:
+            logger.debug(f"Chunk {idx + 1}/{total_chunks} failed ({result.error}); retrying once.")
+            result = call_openwebui(prompt, session, chunk_timeout, chat_id, priority, deadline)
+        if not result:
+            logger.warning(f"Chunk {idx + 1}/{total_chunks} skipped: {result.error} {result.detail}")
+            return None
+        return result.text
+
+    if parallel and total_chunks > 1:
+        logger.debug(f"Processing {total_chunks} chunks in parallel (max_workers={max_workers})...")
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        future_to_idx = {
+            executor.submit(run_chunk, idx, prompt): idx
+            for idx, prompt in enumerate(prompts)
+        }
+        try:
+            for future in as_completed(future_to_idx, timeout=remaining_seconds(deadline)):
+                idx = future_to_idx[future]
+                try:
+                    results_in_order[idx] = future.result()
+                except Exception as e:
+                    logger.error(f"Chunk {idx + 1}/{total_chunks} raised: {e}")
+        except FuturesTimeout:
+            pass
+        finally:
+            # Queued chunks are cancelled; running ones end at the deadline (their timeout).
+            executor.shutdown(wait=False, cancel_futures=True)
+    else:
+        logger.debug(f"Processing {total_chunks} chunks sequentially...")
+        for idx, prompt in enumerate(prompts):
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            results_in_order[idx] = run_chunk(idx, prompt)
+
+    missing = results_in_order.count(None)
+    if missing:
+        logger.warning(f"{missing} of {total_chunks} chunks failed or missed the deadline.")
+    return results_in_order
 
 def process_chunks(
     text,
     prompt_generator_fn,
     combine_fn,
-    chunk_size=BASE_CHUNK_SIZE,
+    chunk_size=None,
     parallel=False,
-    max_workers=5,
-    chunk_timeout=60
+    max_workers=None,
+    chunk_timeout=60,
+    chat_id=None,
+    priority=PRIORITY_BACKGROUND,
+    deadline=None,
 ):
     """
     1) Splits the text into chunks of size <= chunk_size.
     2) For each chunk, calls prompt_generator_fn(chunk, i, total_chunks)
        to build a prompt.
-    3) Sends each prompt to OpenWebUI. If parallel=True, uses ThreadPoolExecutor
-       with max_workers to speed up.
+    3) Sends each prompt to OpenWebUI (run_prompts). If parallel=True, uses
+       ThreadPoolExecutor with max_workers to speed up.
     4) Gathers partial results and passes them to combine_fn for a final answer.
 
+    Chunks that fail, or are still pending when the `deadline`
+    (time.monotonic()) comes, appear as None in the list given to
+    combine_fn, so the caller can build a partial answer from the rest.
+
     :param text: The large text to be processed in chunks
     :param prompt_generator_fn: Function(chunk, index, total) -> string prompt
     :param combine_fn: Function(list_of_partial_results) -> final string
-    :param chunk_size: Max chunk size (defaults to BASE_CHUNK_SIZE)
+    :param chunk_size: Max chunk size (defaults to the BASE_CHUNK_SIZE setting)
     :param parallel: Whether to process chunks concurrently
-    :param max_workers: Number of workers if parallel is True
+    :param max_workers: Number of workers if parallel is True (defaults to the CHUNK_WORKERS setting)
     :param chunk_timeout: Timeout for each chunk request
+    :param chat_id: Chat the calls are made for (fair share in the LLM scheduler)
+    :param priority: LLM scheduler priority class for the chunk calls
+    :param deadline: time.monotonic() by which all chunk results are needed
     :return: A single string with the final combined result
     """
+    # Settings are read once, so a reload never changes a run halfway through.
+    settings = get_settings()
+    if chunk_size is None:
+        chunk_size = settings.base_chunk_size
+    if max_workers is None:
+        max_workers = settings.chunk_workers
+
     # 1) Chunk the text
     chunks = chunk_text(text, chunk_size)
     if not chunks:
@@ -136,32 +225,15 @@ def process_chunks(
         prompts.append(prompt)
 
     # 2) Send each prompt to OpenWebUI
-    session = create_session_with_retry()
-    partial_results = []
-
-    if parallel and total_chunks > 1:
-        logger.debug(f"Processing {total_chunks} chunks in parallel (max_workers={max_workers})...")
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_idx = {
-                executor.submit(call_openwebui, prompt, session, chunk_timeout): idx
-                for idx, prompt in enumerate(prompts)
-            }
-            for future in as_completed(future_to_idx):
-                idx = future_to_idx[future]
-                try:
-                    result = future.result()
-                    partial_results.append((idx, result))
-                except Exception as e:
-                    partial_results.append((idx, f"Error: {e}"))
-    else:
-        logger.debug(f"Processing {total_chunks} chunks sequentially...")
-        for idx, prompt in enumerate(prompts):
-            result = call_openwebui(prompt, session, chunk_timeout)
-            partial_results.append((idx, result))
-
-    # Sort by chunk index so final results are in correct order
-    partial_results.sort(key=lambda x: x[0])
-    results_in_order = [res for _, res in partial_results]
+    results_in_order = run_prompts(
+        prompts,
+        parallel=parallel,
+        max_workers=max_workers,
+        chunk_timeout=chunk_timeout,
+        chat_id=chat_id,
+        priority=priority,
+        deadline=deadline,
+    )
 
     # 3) Combine partial results
     final_result = combine_fn(results_in_order)
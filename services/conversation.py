@@ -0,0 +1,222 @@
+# services/conversation.py
+
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from config import get_settings
+from services.chunk_processor import call_openwebui
+from services.llm_scheduler import PRIORITY_BACKGROUND
+from utils.formatter import html_to_text
+
+logger = logging.getLogger(__name__)
+
+# Builds the message list for /chat and replies so consecutive turns share
+# the longest possible prefix (system prompt, memory, older turns): the
+# backend can then reuse its prompt cache and only process the new tail.
+# The window only moves when it outgrows CHAT_CONTEXT_TOKENS, and then by a
+# whole block that is folded into a rolling memory summary in the background.
+# Only the tail of the stored history is read (history_tail_rows()).
+
+SNIPPET_TAG = "[WEB_SNIPPET]"
+SNIPPET_TRAILER = "Use this info for follow-up questions."
+MEMORY_TAG = "[MEMORY]"
+MEMORY_MAX_CHARS = 800
+CHARS_PER_TOKEN = 4
+MIN_TURN_TOKENS = 10  # a short turn, for sizing the history tail
+MAX_CHATS = 1000  # chats whose encoded turns are kept in memory
+
+SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": (
+        "You are a helpful AI assistant. If there is any [WEB_SNIPPET] in the messages, "
+        "and the user asks something that snippet can answer, you MUST reference and use "
+        "that snippet data. Do not ignore or contradict it."
+    )
+}
+
+
+def compact_snippet(content):
+    """
+    Search results as stored in the history: plain text without the HTML
+    markup and the follow-up hint that were sent to Telegram.
+    """
+    if not content.startswith(SNIPPET_TAG) or "<" not in content:
+        return content
+    body = html_to_text(content[len(SNIPPET_TAG):])
+    body = body.split(SNIPPET_TRAILER)[0].strip()
+    return f"{SNIPPET_TAG}\n{body}"
+
+
+def _tokens(content):
+    return len(content or "") // CHARS_PER_TOKEN + 4
+
+
+def history_tail_rows():
+    """
+    Stored history rows to read per turn: enough short turns to fill
+    CHAT_CONTEXT_TOKENS. Anything older is in the memory or dropped.
+    """
+    return max(20, get_settings().chat_context_tokens // MIN_TURN_TOKENS)
+
+
+def _row_key(row):
+    return row.get("timestamp"), row.get("content")
+
+
+def memory_prompt(memory, turns):
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in turns)
+    return (
+        "Update the running summary of a conversation between a group chat and an assistant.\n\n"
+        f"CURRENT SUMMARY:\n{memory or '(none)'}\n\n"
+        f"NEW TURNS:\n{transcript}\n\n"
+        f"Write the updated summary in at most 5 short bullet points (max {MEMORY_MAX_CHARS} characters). "
+        "Keep names, facts, numbers and open questions."
+    )
+
+
+def _fallback_memory(memory, turns):
+    # Used when the model is unavailable: keep what the user asked about.
+    asked = "; ".join(m["content"][:80] for m in turns if m["role"] == "user")
+    text = f"{memory}\n- Earlier questions: {asked}" if memory else f"- Earlier questions: {asked}"
+    return text[-MEMORY_MAX_CHARS:]
+
+
+class _ChatContext:
+    __slots__ = ("last_row", "messages", "tokens", "spilled", "memory", "memory_message", "folding")
+
+    def __init__(self):
+        self.last_row = None     # (timestamp, content) of the last encoded row
+        self.messages = []       # encoded turns still in the window, shared between calls
+        self.tokens = 0          # estimated tokens of `messages`
+        self.spilled = []        # turns that left the window, not yet in the memory
+        self.memory = ""
+        self.memory_message = None
+        self.folding = False
+
+
+class ConversationEncoder:
+    """
+    Turns the stored chat history into OpenWebUI messages. Encoded turns are
+    kept per chat and reused as the same dict objects on the next call; only
+    rows added since are encoded (snippet HTML stripped, repeated rows
+    dropped). The window is trimmed to CHAT_CONTEXT_TOKENS on every call
+    (a single longer turn is kept whole).
+    Callers must not modify the returned messages.
+    """
+
+    def __init__(self, max_chats=MAX_CHATS):
+        self.max_chats = max_chats
+        self._chats = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-memory")
+
+    def encode(self, chat_id, history, extra_messages=()):
+        """
+        [system, memory (if any), window of turns..., *extra_messages].
+        `history` is the tail of the stored conversation, oldest first (see
+        history_tail_rows()); rows before the last one encoded are skipped.
+        """
+        budget = get_settings().chat_context_tokens
+        with self._lock:
+            context, new_rows = self._context(chat_id, history)
+            for row in new_rows:
+                self._append(context, row)
+            if history:
+                context.last_row = _row_key(history[-1])
+            if context.tokens > budget:
+                self._fold(chat_id, context, budget)
+            messages = [SYSTEM_MESSAGE]
+            if context.memory_message:
+                messages.append(context.memory_message)
+            messages.extend(context.messages)
+        messages.extend(extra_messages)
+        return messages
+
+    def reset(self, chat_id):
+        with self._lock:
+            self._chats.pop(chat_id, None)
+
+    # --- Internals ---
+
+    def _context(self, chat_id, history):
+        """
+        (context, rows of `history` not encoded yet). Caller holds the lock.
+        """
+        context = self._chats.get(chat_id)
+        if context is not None:
+            self._chats.move_to_end(chat_id)
+            if context.last_row is None:
+                return context, history
+            for i in range(len(history) - 1, -1, -1):
+                if _row_key(history[i]) == context.last_row:
+                    return context, history[i + 1:]
+            # The last encoded row is not in the tail (history rewritten, or
+            # more new rows than the tail holds): start over from the tail,
+            # keeping the memory of what came before.
+        old, context = context, _ChatContext()
+        if old is not None:
+            context.memory, context.memory_message = old.memory, old.memory_message
+        self._chats[chat_id] = context
+        while len(self._chats) > self.max_chats:
+            self._chats.popitem(last=False)
+        return context, history
+
+    @staticmethod
+    def _append(context, row):
+        role = row.get("role")
+        content = compact_snippet(row.get("content") or "")
+        last = context.messages[-1] if context.messages else None
+        if last is not None and last["role"] == role and last["content"] == content:
+            return  # the same turn stored twice
+        context.messages.append({"role": role, "content": content})
+        context.tokens += _tokens(content)
+
+    def _fold(self, chat_id, context, budget):
+        """
+        Moves the oldest turns out of the window, down to half the budget (so
+        it then stays put for a while), and summarizes them into the memory
+        in the background. Turns that leave while a summary is running are
+        folded in by the next one. Caller holds the lock.
+        """
+        cut = 0
+        while context.tokens > budget // 2 and cut < len(context.messages) - 1:
+            context.tokens -= _tokens(context.messages[cut]["content"])
+            cut += 1
+        if cut:
+            context.spilled.extend(context.messages[:cut])
+            context.messages = context.messages[cut:]
+        if context.spilled and not context.folding:
+            self._start_fold(chat_id, context)
+
+    def _start_fold(self, chat_id, context):
+        # Caller holds the lock.
+        folded, context.spilled = context.spilled, []
+        context.folding = True
+        logger.debug(f"Folding {len(folded)} turns of chat {chat_id} into memory.")
+        self._pool.submit(self._update_memory, chat_id, context, folded)
+
+    def _update_memory(self, chat_id, context, folded):
+        # The prompt is capped at about the context budget, newest turns kept.
+        limit = get_settings().chat_context_tokens * CHARS_PER_TOKEN
+        recent = folded
+        while len(recent) > 1 and sum(len(m["content"]) for m in recent) > limit:
+            recent = recent[1:]
+        try:
+            result = call_openwebui(
+                memory_prompt(context.memory, recent), chat_id=chat_id, priority=PRIORITY_BACKGROUND, timeout=60
+            )
+            memory = result.text[:MEMORY_MAX_CHARS] if result else _fallback_memory(context.memory, recent)
+        except Exception as e:
+            logger.error(f"Memory update failed for chat {chat_id}: {e}")
+            memory = _fallback_memory(context.memory, recent)
+        with self._lock:
+            context.memory = memory
+            context.memory_message = {"role": "system", "content": f"{MEMORY_TAG} Earlier in this conversation:\n{memory}"}
+            context.folding = False
+            if context.spilled:
+                self._start_fold(chat_id, context)
+
+
+conversation_encoder = ConversationEncoder()
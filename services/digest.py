@@ -0,0 +1,329 @@
+# services/digest.py
+
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from config import DIGEST_CHAT_IDS, DIGEST_ADMIN_CHAT_ID, get_settings
+from services.chunk_processor import chunk_text, run_prompts, call_openwebui, create_session_with_retry, remaining_seconds
+from services.llm_scheduler import PRIORITY_BACKGROUND
+from services.summarize import MERGE_RESERVE_SECONDS
+from utils.formatter import add_emoticons_to_summary
+from utils.history import get_last_6h_raw_messages
+from utils.salience import select_salient
+from utils.sharding import owns_chat
+from utils.state_store import get_state_store
+from utils.summary_state import load_summary_state
+
+logger = logging.getLogger(__name__)
+
+# One digest over several related chats for about the LLM cost of a single
+# /summarize: a chat with nothing new since its last summary reuses it, small
+# chats share one chunk call, and all chunk calls go through one pool of
+# CHUNK_WORKERS that counts as a single chat in the LLM scheduler.
+
+DIGEST_MAX_CHARS = 3500
+MIN_CHAT_TOKENS = 800          # salience budget floor per chat
+SCHEDULER_KEY = "digest"       # the digest's chat_id in the LLM scheduler
+_HEADER = re.compile(r"^\W*#{2,}(.*)$")
+_MARKUP = re.compile(r"<[^>]+>|[*_:#]")
+
+
+@dataclass
+class DigestChat:
+    chat_id: int
+    title: str
+    newest: str            # timestamp of the newest message in the window
+    text: str = ""         # transcript still to summarize
+    pieces: int = 0        # chunk sections the transcript was split into
+    summary: str = ""      # reused or new summary of the chat
+
+
+# Last digest summary per chat, keyed by the newest message it covered.
+# Only the chats of the latest digest are kept (see _keep_sections).
+_sections = {}
+_sections_lock = threading.Lock()
+
+
+def _keep_sections(chat_ids):
+    """
+    Drops remembered sections of chats no longer in the digest, e.g. after
+    DIGEST_CHAT_IDS changed.
+    """
+    with _sections_lock:
+        for chat_id in [cid for cid in _sections if cid not in chat_ids]:
+            del _sections[chat_id]
+
+
+def section_prompt(sections, index, total):
+    body = "\n\n".join(f"### {title}\n{text}" for title, text in sections)
+    return (
+        f"This is part {index}/{total} of several group chats, one '### <group>' section per group.\n"
+        "For each group, repeat its '### <group>' line, then write at most 2 very concise bullet points.\n\n"
+        f"{body}\n"
+    )
+
+
+def digest_merge_prompt(summaries_text, chat_count):
+    return (
+        f"Below are short summaries of {chat_count} related group chats.\n"
+        f"Combine them into ONE digest, strictly under {DIGEST_MAX_CHARS} characters: first at most 3 bullet "
+        "points on what several groups talked about, then one line per group on anything specific to it "
+        "(skip groups with nothing notable).\n\n"
+        f"GROUP SUMMARIES:\n{summaries_text}\n\n"
+        f"Now produce the digest (<{DIGEST_MAX_CHARS} chars)."
+    )
+
+
+def _header_key(text):
+    return " ".join(_MARKUP.sub(" ", text).split()).lower()
+
+
+def split_sections(output):
+    """
+    {normalized group title: text} from a chunk answer with '### <group>' lines.
+    """
+    sections, key = {}, None
+    for line in output.split("\n"):
+        match = _HEADER.match(line)
+        if match:
+            key = _header_key(match.group(1))
+            sections[key] = []
+        elif key is not None and line.strip():
+            sections[key].append(line)
+    return {key: "\n".join(lines) for key, lines in sections.items() if lines}
+
+
+def _window(chat_id, hours, bot_username):
+    # Other shards' chats are read from the store; a hot window here would go stale.
+    if owns_chat(chat_id):
+        return get_last_6h_raw_messages(chat_id, bot_username=bot_username, hours=hours)
+    since = (datetime.now() - timedelta(hours=hours)).isoformat()
+    return list(get_state_store().iter_group_messages_since(chat_id, since, bot_username=bot_username))
+
+
+def _last_summary(chat_id):
+    """
+    (last /summarize result, ISO timestamp of the newest message it covered).
+    """
+    if owns_chat(chat_id):
+        state = load_summary_state(chat_id)
+        covered = state.last_summarized_timestamp
+        return state.last_summary_result, covered.isoformat() if covered else None
+    meta = get_state_store().get_summary_metadata(chat_id)
+    return meta.get("last_summary_result"), meta.get("last_summarized_timestamp")
+
+
+def select_chats(chats, hours, bot_username=None):
+    """
+    DigestChats for the chats ({chat_id: title}) with messages in the last
+    `hours`. Those with nothing new since their last digest section or
+    /summarize come with that `summary`; the others with their messages
+    in `text`, reduced by the salience selector to a share of
+    SUMMARY_TOKEN_BUDGET.
+    """
+    selected, windows = [], {}
+    titles = list(chats.values())
+    for chat_id, title in chats.items():
+        messages = _window(chat_id, hours, bot_username)
+        if not messages:
+            continue
+        if titles.count(title) > 1:
+            title = f"{title} ({chat_id})"
+        chat = DigestChat(chat_id, title, newest=messages[-1]["timestamp"])
+        with _sections_lock:
+            cached = _sections.get(chat_id)
+        if cached and cached[0] == chat.newest:
+            chat.summary = cached[1]
+        else:
+            result, covered = _last_summary(chat_id)
+            if result and covered and covered >= chat.newest:
+                chat.summary = result
+            else:
+                windows[chat_id] = messages
+        selected.append(chat)
+
+    budget = get_settings().summary_token_budget
+    if windows and budget:
+        budget = max(MIN_CHAT_TOKENS, budget // len(windows))
+    for chat in selected:
+        if chat.chat_id in windows:
+            messages = select_salient(windows[chat.chat_id], budget)
+            chat.text = "\n".join(f"@{m['user']}: {m['text'].strip()}" for m in messages)
+    return selected
+
+
+def pack_sections(chats, chunk_size):
+    """
+    Packs the chats' transcripts into chunks of about `chunk_size` characters,
+    as lists of (chat, section title, text). Small chats share a chunk; a chat
+    larger than one is split into parts of its own.
+    """
+    batches, current, size = [], [], 0
+    for chat in chats:
+        pieces = chunk_text(chat.text, chunk_size)
+        chat.pieces = len(pieces)
+        for i, piece in enumerate(pieces, start=1):
+            title = chat.title if len(pieces) == 1 else f"{chat.title} (part {i}/{len(pieces)})"
+            if current and size + len(piece) > chunk_size:
+                batches.append(current)
+                current, size = [], 0
+            current.append((chat, title, piece))
+            size += len(piece)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _summarize_sections(chats, priority, deadline):
+    """
+    Fills in the `summary` of `chats` from batched chunk calls; chats whose
+    sections all came back are remembered for the next digest.
+    """
+    settings = get_settings()
+    batches = pack_sections(chats, settings.base_chunk_size)
+    prompts = [
+        section_prompt([(title, text) for _, title, text in batch], i, len(batches))
+        for i, batch in enumerate(batches, start=1)
+    ]
+    outputs = run_prompts(
+        prompts,
+        parallel=True,
+        max_workers=settings.chunk_workers,
+        chunk_timeout=30,
+        chat_id=SCHEDULER_KEY,
+        priority=priority,
+        deadline=deadline,
+    )
+    parts = {}
+    for batch, output in zip(batches, outputs):
+        if not output:
+            continue
+        sections = split_sections(output)
+        for chat, title, _ in batch:
+            text = sections.get(_header_key(title))
+            if text is None:
+                # The model reworded the header: take one that names the chat.
+                name = _header_key(chat.title)
+                text = next((v for k, v in sections.items() if name in k), None)
+            if text is None and len(batch) == 1:
+                text = output  # one section: whatever came back is about it
+            if text:
+                parts.setdefault(chat.chat_id, []).append(text)
+    for chat in chats:
+        pieces = parts.get(chat.chat_id)
+        if not pieces:
+            continue
+        chat.summary = "\n".join(pieces)
+        if len(pieces) == chat.pieces:
+            with _sections_lock:
+                _sections[chat.chat_id] = (chat.newest, chat.summary)
+
+
+def build_digest(chats, bot_username=None, hours=None, deadline=None, priority=PRIORITY_BACKGROUND):
+    """
+    One merged digest (<DIGEST_MAX_CHARS chars) of the chats ({chat_id:
+    title}) over the last `hours` (default SUMMARIZATION_HOURS), or None if
+    none of them had messages or nothing could be summarized.
+
+    Chats not summarized by the `deadline` (time.monotonic()) are listed in
+    a note; if the final merge fails, the per-chat summaries are returned.
+    """
+    settings = get_settings()
+    _keep_sections(chats)
+    selected = select_chats(chats, hours or settings.summarization_hours, bot_username)
+    if not selected:
+        return None
+
+    fresh = [chat for chat in selected if not chat.summary]
+    if fresh:
+        chunk_deadline = None
+        if deadline is not None:
+            chunk_deadline = deadline - min(MERGE_RESERVE_SECONDS, remaining_seconds(deadline) / 3)
+        _summarize_sections(fresh, priority, chunk_deadline)
+    logger.info(
+        f"Digest of {len(selected)} chats: {len(selected) - len(fresh)} reused, "
+        f"{sum(1 for chat in fresh if chat.summary)} of {len(fresh)} summarized."
+    )
+
+    done = [chat for chat in selected if chat.summary]
+    if not done:
+        return None
+    summaries_text = "\n\n".join(f"### {chat.title}\n{chat.summary}" for chat in done)
+    if len(done) == 1:
+        digest = summaries_text
+    else:
+        merged = call_openwebui(
+            digest_merge_prompt(summaries_text, len(done)),
+            session=create_session_with_retry(deadline=deadline),
+            timeout=60,
+            chat_id=SCHEDULER_KEY,
+            priority=priority,
+            deadline=deadline,
+        )
+        if merged:
+            digest = merged.text
+        else:
+            logger.warning(f"Digest merge failed ({merged.error}); sending the per-chat summaries.")
+            digest = summaries_text
+
+    if len(digest) > DIGEST_MAX_CHARS:
+        digest = digest[:DIGEST_MAX_CHARS - 10] + "..."
+    missing = [chat.title for chat in selected if not chat.summary]
+    if missing:
+        digest = f"{digest}\n\n⏱️ Not covered (out of time): {', '.join(missing)}."
+    return add_emoticons_to_summary(digest)
+
+
+class DigestSchedule:
+    """
+    Calls deliver(DIGEST_ADMIN_CHAT_ID) every DIGEST_INTERVAL_HOURS. The
+    setting is re-read every `check_seconds`, so a reload can turn the
+    schedule on or off or change its interval.
+    """
+
+    def __init__(self, deliver, check_seconds=60):
+        self.deliver = deliver
+        self.check_seconds = check_seconds
+        self._last_run = time.monotonic()
+
+    def start(self):
+        threading.Thread(target=self._run, name="digest-schedule", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.check_seconds)
+            self._tick(time.monotonic())
+
+    def _tick(self, now):
+        """
+        Delivers a digest if one is due at `now` (time.monotonic()).
+        Returns True if it did.
+        """
+        hours = get_settings().digest_interval_hours
+        if not hours:
+            self._last_run = now  # the interval starts when it is switched on
+            return False
+        if now - self._last_run < hours * 3600:
+            return False
+        self._last_run = now
+        try:
+            self.deliver(DIGEST_ADMIN_CHAT_ID)
+        except Exception as e:
+            logger.error(f"Scheduled digest failed: {e}", exc_info=True)
+        return True
+
+
+def start_digest_schedule(deliver):
+    """
+    Starts the scheduled digest on the worker that owns DIGEST_ADMIN_CHAT_ID
+    (if DIGEST_CHAT_IDS and DIGEST_ADMIN_CHAT_ID are set). Returns it, or None.
+    """
+    if not DIGEST_CHAT_IDS or not DIGEST_ADMIN_CHAT_ID or not owns_chat(DIGEST_ADMIN_CHAT_ID):
+        return None
+    schedule = DigestSchedule(deliver)
+    schedule.start()
+    return schedule
@@ -1,9 +1,9 @@
 # services/image_analyser.py
 
-from openai import AzureOpenAI
 import base64
 import os
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
@@ -12,11 +12,25 @@ endpoint = os.getenv("ENDPOINT_URL", "REPLACE_WITH_YOUR_ENDPOINT_URL")
 deployment = os.getenv("DEPLOYMENT_NAME", "REPLACE_WITH_YOUR_DEPLOYMENT_NAME")
 subscription_key = os.getenv("AZURE_OPENAI_API_KEY", "REPLACE_WITH_YOUR_KEY_VALUE_HERE")
 
-client = AzureOpenAI(
-    azure_endpoint=endpoint,
-    api_key=subscription_key,
-    api_version="2024-08-01-preview",
-)
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """
+    Builds the Azure OpenAI client on first use; importing the openai SDK is
+    slow and only photo analysis needs it.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import AzureOpenAI
+                _client = AzureOpenAI(
+                    azure_endpoint=endpoint,
+                    api_key=subscription_key,
+                    api_version="2024-08-01-preview",
+                )
+    return _client
 
 def analyze_image(image_bytes, prompt="Please analyze this image."):
     """
@@ -55,7 +69,7 @@ def analyze_image(image_bytes, prompt="Please analyze this image."):
         ]
 
         # Call the Azure OpenAI API
-        completion = client.chat.completions.create(
+        completion = get_client().chat.completions.create(
             model=deployment,
             messages=chat_prompt,
             max_tokens=1500,
@@ -0,0 +1,276 @@
+# services/llm_client.py
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+import requests
+
+from config import (
+    OPENWEBUI_BASE_URL,
+    OPENWEBUI_API_KEY,
+    OPENWEBUI_FALLBACK_BASE_URL,
+    OPENWEBUI_FALLBACK_API_KEY,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_SECONDS,
+    get_settings,
+)
+from services.llm_scheduler import llm_scheduler, DeadlineExceeded, PRIORITY_BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+# Every OpenWebUI /chat/completions request goes through complete(): it picks
+# the primary endpoint, or the fallback (FALLBACK_MODEL_NAME and/or
+# OPENWEBUI_FALLBACK_BASE_URL) while the primary is failing, each behind its
+# own circuit breaker, and returns an LLMResult instead of raising or
+# returning error text.
+
+# Status codes that mean "overloaded or down" rather than "bad request".
+OVERLOAD_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+# A call's share of the LLM workers grows with its prompt: one unit per this
+# many characters (about 1000 tokens), at least one per call.
+COST_UNIT_CHARS = 4000
+
+
+@dataclass(frozen=True)
+class LLMResult:
+    """
+    Outcome of one completion. `ok` results carry the model's `text`; failed
+    ones an `error` kind ("timeout", "overloaded", "http", "network",
+    "empty", "circuit_open" or "deadline") and a `detail` for logs.
+    `retryable` failures may succeed if tried again later.
+    """
+    ok: bool
+    text: str = ""
+    error: str = ""
+    detail: str = ""
+    endpoint: str = ""
+
+    def __bool__(self):
+        return self.ok
+
+    @property
+    def retryable(self):
+        return not self.ok and self.error in ("timeout", "overloaded", "network", "empty")
+
+    @classmethod
+    def success(cls, text, endpoint=""):
+        return cls(True, text=text, endpoint=endpoint)
+
+    @classmethod
+    def failure(cls, error, detail="", endpoint=""):
+        return cls(False, error=error, detail=detail, endpoint=endpoint)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and fails fast for
+    `reset_seconds`; then lets a single probe through (half-open). The probe's
+    outcome closes the circuit again or restarts the wait.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_seconds=CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Admits a request: returns CLOSED for a normal one, HALF_OPEN for the
+        single probe (handed to exactly one caller), or None if it must not go
+        out now. Checked and claimed under the lock, so two callers can never
+        both get the probe.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return self.CLOSED
+            now = time.monotonic()
+            if self.state == self.OPEN:
+                if now - self.opened_at < self.reset_seconds:
+                    return None
+                self.state = self.HALF_OPEN
+                self._probing = False
+            # A probe that never reported back expires.
+            if self._probing and now - self.opened_at < self.reset_seconds:
+                return None
+            self._probing = True
+            self.opened_at = now
+            return self.HALF_OPEN
+
+    def release(self):
+        """
+        Gives back a probe slot whose request said nothing about the endpoint
+        (dropped in the queue, or cut short by the caller's deadline).
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"OpenWebUI circuit '{self.name}' closed again.")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(
+                        f"OpenWebUI circuit '{self.name}' opened after {self.failures} failure(s); "
+                        f"failing fast for {self.reset_seconds}s."
+                    )
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+@dataclass(frozen=True)
+class _Endpoint:
+    name: str
+    base_url: str
+    api_key: str
+    breaker: CircuitBreaker
+
+
+_primary = _Endpoint("primary", OPENWEBUI_BASE_URL, OPENWEBUI_API_KEY, CircuitBreaker("primary"))
+_fallback = _Endpoint(
+    "fallback", OPENWEBUI_FALLBACK_BASE_URL or OPENWEBUI_BASE_URL, OPENWEBUI_FALLBACK_API_KEY,
+    CircuitBreaker("fallback"),
+)
+
+
+def _routes(settings):
+    """
+    (endpoint, model) pairs to try, in order.
+    """
+    routes = [(_primary, settings.model_name)]
+    if OPENWEBUI_FALLBACK_BASE_URL or settings.fallback_model_name:
+        routes.append((_fallback, settings.fallback_model_name or settings.model_name))
+    return routes
+
+
+def circuit_states():
+    """
+    {endpoint name: breaker state}, for logs and benchmarks.
+    """
+    return {endpoint.name: endpoint.breaker.state for endpoint, _ in _routes(get_settings())}
+
+
+def prompt_cost(messages):
+    """
+    Scheduler cost of sending `messages`, from the size of their text.
+    """
+    chars = sum(len(m["content"]) for m in messages if isinstance(m.get("content"), str))
+    return max(1.0, chars / COST_UNIT_CHARS)
+
+
+def _post(endpoint, payload, session, timeout, chat_id, priority, deadline, cost=1.0):
+    """
+    One request to one endpoint, classified into an LLMResult.
+    """
+    post = (session or requests).post
+    try:
+        response = llm_scheduler.run(
+            post,
+            f"{endpoint.base_url}/chat/completions",
+            headers={
+                "Authorization": f"Bearer {endpoint.api_key}",
+                "Content-Type": "application/json"
+            },
+            json=payload,
+            timeout=timeout,
+            chat_id=chat_id,
+            priority=priority,
+            deadline=deadline,
+            cost=cost,
+        )
+    except DeadlineExceeded as e:
+        return LLMResult.failure("deadline", str(e), endpoint.name)
+    except requests.exceptions.Timeout as e:
+        return LLMResult.failure("timeout", str(e), endpoint.name)
+    except requests.exceptions.RetryError as e:
+        # The session's own retries on 429/5xx ran out.
+        return LLMResult.failure("overloaded", str(e), endpoint.name)
+    except requests.exceptions.RequestException as e:
+        return LLMResult.failure("network", str(e), endpoint.name)
+
+    if response.status_code in OVERLOAD_STATUSES:
+        return LLMResult.failure("overloaded", f"HTTP {response.status_code}", endpoint.name)
+    if response.status_code >= 400:
+        return LLMResult.failure("http", f"HTTP {response.status_code}: {response.text[:200]}", endpoint.name)
+    try:
+        choices = response.json().get("choices") or []
+        content = choices[0]["message"]["content"] if choices else None
+    except (ValueError, KeyError, TypeError) as e:
+        return LLMResult.failure("empty", f"Unreadable response: {e}", endpoint.name)
+    if not content:
+        return LLMResult.failure("empty", "No 'choices' in response", endpoint.name)
+    return LLMResult.success(content, endpoint.name)
+
+
+def complete(messages, extra=None, session=None, timeout=60, chat_id=None, priority=PRIORITY_BACKGROUND,
+             deadline=None):
+    """
+    Sends `messages` (chat format) to OpenWebUI and returns an LLMResult.
+
+    The primary endpoint is tried first unless its circuit is open; on an
+    overload-type failure (timeout, 429/5xx, network) the fallback is tried
+    in the same call, if configured. With every circuit open this returns
+    at once with error "circuit_open". `extra` adds fields to the request
+    body (e.g. knowledge-base "files"); `deadline` is a time.monotonic()
+    value passed on to the scheduler, along with the prompt's cost.
+    """
+    settings = get_settings()
+    cost = prompt_cost(messages)
+    result = None
+    for endpoint, model in _routes(settings):
+        call_timeout = timeout
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return result or LLMResult.failure("deadline", "deadline passed before the request was sent")
+            call_timeout = min(timeout, remaining)
+        admitted = endpoint.breaker.acquire()
+        if admitted is None:
+            continue
+        payload = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": settings.max_tokens,
+            "temperature": settings.temperature,
+            **(extra or {}),
+        }
+        # A half-open probe is a single attempt, without the session's retries.
+        probe = admitted == CircuitBreaker.HALF_OPEN
+        result = _post(endpoint, payload, None if probe else session, call_timeout, chat_id, priority, deadline, cost)
+        if result.ok:
+            endpoint.breaker.record_success()
+            return result
+        if result.error == "deadline" or (result.error == "timeout" and call_timeout < timeout):
+            # Queue backlog, or a timeout we shortened to fit the deadline:
+            # neither says the endpoint is failing.
+            if probe:
+                endpoint.breaker.release()
+            return result
+        if result.error != "http":
+            endpoint.breaker.record_failure()
+        elif probe:
+            endpoint.breaker.release()  # a 4xx answer is the request's fault, not the endpoint's
+        logger.warning(
+            f"OpenWebUI {endpoint.name} ({model}) failed: {result.error} {result.detail}",
+            extra={"category": "llm", "chat_id": chat_id},
+        )
+        if not result.retryable:
+            return result
+    return result or LLMResult.failure("circuit_open", "OpenWebUI is unavailable; not sending requests for now")
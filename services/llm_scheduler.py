@@ -0,0 +1,264 @@
+# services/llm_scheduler.py
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+from config import get_settings, on_settings_change
+
+logger = logging.getLogger(__name__)
+
+# Priority classes: lower runs first. A waiting job of a higher class always
+# goes before any job of a lower one.
+PRIORITY_CHAT = 0        # /chat turns
+PRIORITY_REPLY = 1       # replies to the bot
+PRIORITY_SUMMARY = 2     # /summarize chunks and merges, /sentiment remarks
+PRIORITY_BACKGROUND = 3  # precompute nobody is waiting for
+
+PRIORITY_NAMES = {
+    PRIORITY_CHAT: "chat",
+    PRIORITY_REPLY: "reply",
+    PRIORITY_SUMMARY: "summary",
+    PRIORITY_BACKGROUND: "background",
+}
+
+# Default time from submission by which a job's result is needed, per class
+# (None = no limit). A caller's own deadline takes precedence.
+DEADLINE_SECONDS = {
+    PRIORITY_CHAT: 60,
+    PRIORITY_REPLY: 60,
+    PRIORITY_SUMMARY: 180,
+    PRIORITY_BACKGROUND: None,
+}
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised by a job's future when it was dropped because it could not
+    finish before its deadline (given recent call latency in its class).
+    """
+
+
+class _Job:
+    __slots__ = ("fn", "args", "kwargs", "chat_id", "priority", "deadline", "submitted", "future")
+
+    def __init__(self, fn, args, kwargs, chat_id, priority, deadline):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.chat_id = chat_id
+        self.priority = priority
+        self.deadline = deadline
+        self.submitted = time.monotonic()
+        self.future = Future()
+
+
+class _ClassQueue:
+    """
+    Weighted fair queue for one priority class (start-time fair queuing).
+    Each job is tagged with a virtual finish time: it starts at the later of
+    the class clock and its chat's previous finish, and advances by
+    cost / weight. Jobs run in tag order, so a chat that queued fifty
+    summary chunks takes turns with a chat that queued one.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.clock = 0.0
+        self.finish = {}  # chat_id -> virtual finish of its last queued job
+
+    def push(self, job, seq, cost, weight):
+        start = max(self.clock, self.finish.get(job.chat_id, 0.0))
+        tag = start + cost / weight
+        self.finish[job.chat_id] = tag
+        heapq.heappush(self.heap, (tag, seq, start, job))
+
+    def pop(self):
+        tag, _, start, job = heapq.heappop(self.heap)
+        self.clock = max(self.clock, start)
+        if not self.heap:
+            # Idle: forget history so old chats get no credit or debt.
+            self.finish.clear()
+        return job
+
+    def __len__(self):
+        return len(self.heap)
+
+
+class LLMScheduler:
+    """
+    Runs every OpenWebUI call on a small worker pool of LLM_MAX_CONCURRENCY
+    threads: strict priority between classes, weighted fair queuing between
+    chats within a class, and jobs whose deadline can no longer be met are
+    dropped instead of occupying a slot. Callers block on the result, so
+    the existing synchronous code paths stay as they are.
+    """
+
+    def __init__(self):
+        self.workers = get_settings().llm_max_concurrency
+        self.weights = {}  # chat_id -> share within a class (default 1)
+        self._queues = {p: _ClassQueue() for p in PRIORITY_NAMES}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = 0
+        # Moving average of call duration per class, seconds: a slow summary
+        # or background call says nothing about how long a chat turn takes.
+        self._latency = {p: 0.0 for p in PRIORITY_NAMES}
+        self._counts = Counter()
+        self._wait_total = Counter()
+        on_settings_change(lambda old, new: self.apply_settings(new))
+
+    # --- Public API ---
+
+    def apply_settings(self, settings):
+        with self._cond:
+            self.workers = settings.llm_max_concurrency
+            if self._threads:
+                self._ensure_workers()
+            self._cond.notify_all()
+
+    def submit(self, fn, *args, chat_id=None, priority=PRIORITY_BACKGROUND, deadline=None, cost=1.0, **kwargs):
+        """
+        Queues fn(*args, **kwargs) and returns a Future with its result.
+        `deadline` is the time.monotonic() value by which the result is needed;
+        without one, the class's DEADLINE_SECONDS applies. A job that would
+        only start when its class's recent average call time no longer fits
+        before its deadline is dropped with DeadlineExceeded. `cost` is the
+        job's size for fair queuing (see llm_client.prompt_cost).
+        """
+        if deadline is None and DEADLINE_SECONDS.get(priority) is not None:
+            deadline = time.monotonic() + DEADLINE_SECONDS[priority]
+        job = _Job(fn, args, kwargs, chat_id, priority, deadline)
+        with self._cond:
+            self._ensure_workers()
+            self._queues[priority].push(job, next(self._seq), cost, self.weights.get(chat_id, 1.0))
+            self._counts[f"{PRIORITY_NAMES[priority]}.submitted"] += 1
+            self._cond.notify()
+        return job.future
+
+    def run(self, fn, *args, **kwargs):
+        """
+        submit() and wait for the result (or the exception).
+        """
+        return self.submit(fn, *args, **kwargs).result()
+
+    def set_weight(self, chat_id, weight):
+        """
+        Gives `chat_id` `weight` times the default share within each class.
+        """
+        with self._cond:
+            if weight == 1:
+                self.weights.pop(chat_id, None)
+            else:
+                self.weights[chat_id] = float(weight)
+
+    def queue_depth(self):
+        """
+        Waiting jobs per class name.
+        """
+        with self._cond:
+            return {PRIORITY_NAMES[p]: len(q) for p, q in self._queues.items()}
+
+    def stats(self):
+        """
+        Queue depths, running calls, per-class counters (submitted, completed,
+        failed, dropped), mean call latency and queue wait, for logs and benchmarks.
+        """
+        with self._cond:
+            counts = dict(self._counts)
+            mean_wait = {
+                PRIORITY_NAMES[p]: round(self._wait_total[p] / n * 1000, 1)
+                for p in PRIORITY_NAMES
+                if (n := self._counts[f"{PRIORITY_NAMES[p]}.started"])
+            }
+            return {
+                "queued": {PRIORITY_NAMES[p]: len(q) for p, q in self._queues.items()},
+                "running": self._running,
+                "workers": self.workers,
+                "latency_ms": {PRIORITY_NAMES[p]: round(v * 1000, 1) for p, v in self._latency.items() if v},
+                "mean_wait_ms": mean_wait,
+                "counts": counts,
+            }
+
+    # --- Internals ---
+
+    def _ensure_workers(self):
+        while len(self._threads) < self.workers:
+            index = len(self._threads)
+            t = threading.Thread(target=self._worker, args=(index,), name=f"llm-{index}", daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def _next_job(self, index):
+        """
+        Blocks until a job may run; returns None if worker `index` should exit.
+        """
+        with self._cond:
+            while True:
+                if index >= self.workers:
+                    # The pool shrank: retire the highest-numbered workers.
+                    if index == len(self._threads) - 1:
+                        self._threads.pop()
+                        self._cond.notify_all()
+                        return None
+                    self._cond.wait(timeout=1.0)
+                    continue
+                for priority in sorted(self._queues):
+                    queue = self._queues[priority]
+                    while queue:
+                        job = queue.pop()
+                        now = time.monotonic()
+                        if job.deadline is not None and now + self._latency[priority] > job.deadline:
+                            self._drop(job, now)
+                            continue
+                        self._running += 1
+                        self._counts[f"{PRIORITY_NAMES[priority]}.started"] += 1
+                        self._wait_total[priority] += now - job.submitted
+                        return job
+                self._cond.wait()
+
+    def _drop(self, job, now):
+        # Caller holds the lock.
+        name = PRIORITY_NAMES[job.priority]
+        self._counts[f"{name}.dropped"] += 1
+        logger.warning(
+            f"Dropped {name} LLM call for chat {job.chat_id}: deadline "
+            f"{'passed' if now > job.deadline else 'too close'} after {now - job.submitted:.1f}s in queue.",
+            extra={"category": "llm", "queued": sum(len(q) for q in self._queues.values())},
+        )
+        if job.future.set_running_or_notify_cancel():
+            job.future.set_exception(DeadlineExceeded(f"{name} call cannot finish before its deadline"))
+
+    def _worker(self, index):
+        while True:
+            job = self._next_job(index)
+            if job is None:
+                return
+            name = PRIORITY_NAMES[job.priority]
+            if not job.future.set_running_or_notify_cancel():
+                with self._cond:
+                    self._running -= 1
+                continue
+            started = time.monotonic()
+            outcome = "completed"
+            try:
+                result = job.fn(*job.args, **job.kwargs)
+            except Exception as exc:
+                outcome = "failed"
+                job.future.set_exception(exc)
+            else:
+                job.future.set_result(result)
+            with self._cond:
+                self._running -= 1
+                self._counts[f"{name}.{outcome}"] += 1
+                elapsed = time.monotonic() - started
+                average = self._latency[job.priority]
+                self._latency[job.priority] = elapsed if not average else 0.8 * average + 0.2 * elapsed
+
+
+llm_scheduler = LLMScheduler()
@@ -1,37 +1,50 @@
 # services/openwebui.py
 
-import requests
 import logging
-from config import (
-    OPENWEBUI_BASE_URL,
-    OPENWEBUI_API_KEY,
-    MODEL_NAME,
-    MAX_TOKENS,
-    TEMPERATURE
-)
+from datetime import datetime
+from services.conversation import conversation_encoder
+from services.llm_client import complete
+from services.llm_scheduler import PRIORITY_CHAT
 from utils.history import add_to_chat_history
+from utils.vector_memory import vector_memory
 
 logger = logging.getLogger(__name__)
 
-def get_openai_response(chat_id, user_input, chat_history_input, retries=3, timeout=30):
+def recall_message(items):
+    """
+    System message listing remembered items (see utils/vector_memory.py).
+    """
+    lines = []
+    for item in items:
+        when = datetime.fromtimestamp(item["ts"]).strftime("%Y-%m-%d")
+        who = f"@{item['who']}" if item["source"] == "group" else item["who"]
+        lines.append(f"- {when} {who}: {item['text']}")
+    return {
+        "role": "system",
+        "content": "[RECALL] Possibly relevant earlier messages (may be outdated):\n" + "\n".join(lines),
+    }
+
+def get_openai_response(chat_id, user_input, chat_history_input, retries=3, timeout=30, kb_ids=None,
+                        priority=PRIORITY_CHAT, extra_messages=()):
     """
     Calls the local/remote LLM for a response.
-    A special system message is prepended to instruct the LLM.
+    The messages come from the conversation encoder: a fixed system message,
+    a rolling memory of older turns and the recent window. Related older
+    messages recalled from the local vector memory and `extra_messages`
+    (e.g. a reminder of the summary being replied to) go just before the
+    latest user message, so the model reads them as context for it.
     
     The parameter chat_history_input is expected to be a list of message dicts,
     each with keys "role" and "content". (If a dict is passed instead, we try to extract
     the conversation for this chat_id.)
+
+    kb_ids is an optional list of OpenWebUI knowledge base (collection) IDs
+    that are attached to the request so retrieval uses them.
+
+    Each attempt is queued in the LLM scheduler under `priority`; while
+    OpenWebUI's circuit is open the call fails fast (or uses the fallback).
     """
     # (In the handlers, user's message has already been added to the chat history.)
-    system_message = {
-        "role": "system",
-        "content": (
-            "You are a helpful AI assistant. If there is any [WEB_SNIPPET] in the messages, "
-            "and the user asks something that snippet can answer, you MUST reference and use "
-            "that snippet data. Do not ignore or contradict it."
-        )
-    }
-
     # If chat_history_input is a list, use it directly.
     if isinstance(chat_history_input, list):
         conversation = chat_history_input
@@ -40,56 +53,50 @@ def get_openai_response(chat_id, user_input, chat_history_input, retries=3, time
     else:
         conversation = []
 
-    # Build the final list of messages.
-    final_messages = [system_message]
-    for msg in conversation:
-        role = msg.get("role")
-        content = msg.get("content")
-        final_messages.append({"role": role, "content": content})
+    # System prompt, memory and older turns stay identical between turns (prompt-cache friendly).
+    final_messages = conversation_encoder.encode(chat_id, conversation)
+    # Long-ago turns and group messages relevant to this question, from the local index.
+    recalled = vector_memory.search(chat_id, user_input, exclude=[m["content"] for m in final_messages])
+    context = ([recall_message(recalled)] if recalled else []) + list(extra_messages)
+    if context:
+        # The user's turn was stored before this call, so it ends the window.
+        at = len(final_messages) - 1 if final_messages[-1]["role"] == "user" else len(final_messages)
+        final_messages[at:at] = context
 
-    data = {
-        "model": MODEL_NAME,
-        "messages": final_messages,
-        "max_tokens": MAX_TOKENS,
-        "temperature": TEMPERATURE
-    }
-
-    headers = {
-        "Authorization": f"Bearer {OPENWEBUI_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    attempt = 0
-    while attempt < retries:
-        try:
-            logger.debug(f"Sending request to OpenWebUI (text): {data}")
-            response = requests.post(
-                f"{OPENWEBUI_BASE_URL}/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=timeout
-            )
-            logger.debug(f"OpenWebUI (text) response: {response.text}")
-            response.raise_for_status()
-            response_json = response.json()
+    extra = {}
+    if kb_ids:
+        # Deduplicate while keeping order; several keywords may map to the same KB.
+        extra["files"] = [
+            {"type": "collection", "id": kb_id}
+            for kb_id in dict.fromkeys(kb_ids)
+        ]
 
-            if 'choices' in response_json and response_json['choices']:
-                bot_response = response_json['choices'][0]['message']['content'].strip()
-                add_to_chat_history(chat_id, "assistant", bot_response)
-                return bot_response
-            else:
-                return (
-                    "I'm having trouble getting a response right now. "
-                    "Please try again later."
-                )
-
-        except requests.exceptions.RequestException as e:
-            logger.error(
-                f"OpenWebUI (text) request failed (attempt {attempt+1}/{retries}): {e}"
-            )
-            attempt += 1
+    result = None
+    for attempt in range(retries):
+        logger.debug(
+            "Sending request to OpenWebUI (text)",
+            extra={
+                "category": "llm",
+                "chat_id": chat_id,
+                "messages": len(final_messages),
+                "prompt_chars": sum(len(m["content"] or "") for m in final_messages),
+            },
+        )
+        result = complete(final_messages, extra=extra, timeout=timeout, chat_id=chat_id, priority=priority)
+        if result:
+            bot_response = result.text.strip()
+            add_to_chat_history(chat_id, "assistant", bot_response)
+            return bot_response
+        logger.error(
+            f"OpenWebUI (text) request failed (attempt {attempt+1}/{retries}): {result.error} {result.detail}"
+        )
+        if not result.retryable:
+            # Open circuit, queue backlog or a rejected request: retrying now would not help.
+            break
 
+    if result is not None and result.error in ("circuit_open", "deadline"):
+        return "I'm busy right now. Please try again in a minute."
     return (
         "There was an error processing your request after multiple attempts. "
         "Please try again later."
     )
-
@@ -1,109 +1,143 @@
 # services/sentiment.py
 
 import logging
-from services.chunk_processor import process_chunks, create_session_with_retry, call_openwebui
-from config import BASE_CHUNK_SIZE
+from config import get_settings
+from services.chunk_processor import create_session_with_retry, call_openwebui
+from services.llm_scheduler import PRIORITY_SUMMARY
+from utils.history import get_last_6h_raw_messages
+from utils.sentiment_score import NEUTRAL_BAND, aggregate_sentiment, format_digest
+from utils.sentiment_series import sentiment_series
 
 logger = logging.getLogger(__name__)
 
+# The Positive/Neutral/Negative split is computed locally by the lexicon
+# scorer (utils/sentiment_score.py). The model only sees a compact digest of
+# it - numbers, topics, a few representative messages - and adds the closing
+# remark, so one short call replaces the chunked pass over the transcript.
+# For chats the bot has been logging, the numbers come straight from the
+# sentiment time series kept at ingest (utils/sentiment_series.py).
+
+MAX_SENTIMENT_CHARS = 300
+
 ###############################################################################
-# 1) PARTIAL SENTIMENT (chunk-based)
+# 1) DIGEST PROMPT
 ###############################################################################
 
-def partial_sentiment_prompt(chunk, index, total):
+def sentiment_remark_prompt(digest):
     """
-    Prompt to analyze a chunk of messages for sentiment.
-    We'll keep it detailed, because we do a final merge for brevity.
+    Asks for one short concluding sentence about the digest.
     """
     return (
-        f"This is chunk {index}/{total} of a crypto-related group chat.\n\n"
-        f"{chunk}\n\n"
-        "Analyze the sentiment and produce a short summary with:\n"
-        "- Overall Hodlers chat group Sentiment (Bullish 🚀, Bearish 🛑, or Neutral 🤔)\n"
-        "- Percentages of Positive, Neutral, and Negative\n"
-        "- A few key topics or observations."
+        "Below is a digest of the last hours of a crypto-related group chat, "
+        "with sentiment already scored.\n\n"
+        f"{digest}\n\n"
+        "Write ONE short concluding sentence (max 80 characters) on the mood "
+        "and what drives it. Do not repeat the percentages."
     )
 
-def partial_sentiment_combine_fn(partial_results):
-    """
-    Joins partial chunk results into one text. We'll do a 2nd pass
-    to unify them into the final short sentiment.
-    """
-    return "\n---\n".join(partial_results)
-
-def get_partial_sentiment(text):
+def get_sentiment_remark(aggregate, chat_id=None, deadline=None):
     """
-    Runs chunk-based analysis for 'text', returning a big
-    string of partial sentiment results.
+    Returns the model's closing sentence for `aggregate`, or None if the call
+    failed or did not finish before `deadline` (time.monotonic()).
     """
-    return process_chunks(
-        text,
-        prompt_generator_fn=partial_sentiment_prompt,
-        combine_fn=partial_sentiment_combine_fn,
-        chunk_size=BASE_CHUNK_SIZE,
-        parallel=True,       # parallel for speed
-        max_workers=2,       # tweak as needed
-        chunk_timeout=30     # shorter time
+    session = create_session_with_retry(deadline=deadline)
+    remark = call_openwebui(
+        sentiment_remark_prompt(format_digest(aggregate)), session=session, timeout=30,
+        chat_id=chat_id, priority=PRIORITY_SUMMARY, deadline=deadline,
     )
+    if not remark or not remark.text.strip():
+        logger.warning(f"No sentiment remark from the model: {remark.error} {remark.detail}")
+        return None
+    return remark.text.strip().splitlines()[0]
 
 ###############################################################################
-# 2) FINAL MERGE INTO A SHORT SENTIMENT
+# 2) FINAL FORMAT
 ###############################################################################
 
-def final_sentiment_prompt(partials_text):
+def format_trend(short, long, short_label="1h", long_label="6h"):
     """
-    We unify partial sentiment analyses into one short final result:
-      1) Overall Hodlers chat group Sentiment: ...
-      2) Sentiment Breakdown: ...
-      3) One short concluding sentence
-      (under 300 chars)
+    One line comparing the mean score of a recent window with a longer one.
     """
-    return (
-        "We have multiple partial sentiment analyses:\n"
-        f"{partials_text}\n\n"
-        "Now produce a SINGLE, very short final sentiment result with the format:\n"
-        "📊 Overall Hodlers chat group Sentiment: (Bullish 🚀, Bearish 🛑, or Neutral 🤔)\n"
-        "🔍 Sentiment Breakdown: - Positive: X%, Neutral: Y%, Negative: Z%\n"
-        "One short concluding sentence (max 80 characters).\n"
-        "Keep the entire output under 300 characters total."
-    )
-
-def unify_into_short_sentiment(partials_text):
+    if not short.total or not long.total:
+        return ""
+    change = short.mean - long.mean
+    if change > NEUTRAL_BAND:
+        direction = "more bullish 📈"
+    elif change < -NEUTRAL_BAND:
+        direction = "more bearish 📉"
+    else:
+        direction = "steady"
+    return f"⏱️ Trend: last {short_label} {short.mean:+.2f} vs {long_label} {long.mean:+.2f} ({direction})"
+
+def format_sentiment(aggregate, remark=None, trend=""):
     """
-    Calls the model once more to unify partial sentiments
-    into a short final snippet. We do a local truncate if the model
-    ignores instructions.
+    The short /sentiment result (under 300 characters):
+      📊 Overall Hodlers chat group Sentiment: ...
+      🔍 Sentiment Breakdown: - Positive: X%, Neutral: Y%, Negative: Z%
+      ⏱️ Trend line, when there is one
+      one concluding sentence
+    Without a remark from the model, the top topics are listed instead.
     """
-    prompt = final_sentiment_prompt(partials_text)
-    session = create_session_with_retry()
-    final_text = call_openwebui(prompt, session=session, timeout=60)
-
-    # Truncate if it disobeys
-    if len(final_text) > 300:
-        final_text = final_text[:290] + "..."
-    return final_text
+    positive, neutral, negative = aggregate.percentages
+    if not remark:
+        topics = ", ".join(keyword for keyword, _ in aggregate.keywords[:3])
+        remark = f"Most discussed: {topics}." if topics else ""
+    lines = [
+        f"📊 Overall Hodlers chat group Sentiment: {aggregate.label}",
+        f"🔍 Sentiment Breakdown: - Positive: {positive}%, Neutral: {neutral}%, Negative: {negative}%",
+        trend,
+        remark,
+    ]
+    text = "\n".join(line for line in lines if line)
+
+    # Truncate if the remark ran long
+    if len(text) > MAX_SENTIMENT_CHARS:
+        text = text[:MAX_SENTIMENT_CHARS - 10] + "..."
+    return text
 
 ###############################################################################
 # 3) Main Function Called by Handler
 ###############################################################################
 
-def analyze_sentiment(messages):
+def analyze_sentiment(messages, chat_id=None, deadline=None):
     """
-    1) Build text from messages.
-    2) partial chunk-based sentiment
-    3) unify partial results => short snippet
+    1) Score and aggregate the messages locally.
+    2) One short model call for the concluding remark, on a digest
+       (skipped if it does not finish before `deadline`).
+    3) Format the short snippet.
     """
     if not messages:
         logger.debug("No messages provided for sentiment analysis.")
         return "No messages found for sentiment analysis."
 
-    text_to_analyze = "\n".join(f"@{msg['user']}: {msg['text']}" for msg in messages)
+    aggregate = aggregate_sentiment(messages)
+    logger.debug(f"Local sentiment over {aggregate.total} messages: {aggregate.label}, mean {aggregate.mean:+.2f}")
 
-    partial_summaries = get_partial_sentiment(text_to_analyze)
-    logger.debug("Finished partial sentiment. Now merging into short final...")
-
-    final_result = unify_into_short_sentiment(partial_summaries)
+    final_result = format_sentiment(aggregate, get_sentiment_remark(aggregate, chat_id, deadline))
     logger.debug(f"Final short sentiment length: {len(final_result)}")
 
     return final_result
 
+def analyze_chat_sentiment(chat_id, bot_username=None, deadline=None):
+    """
+    /sentiment for a chat: counts and the 1h-vs-window trend come from the
+    ingest-time series; the stored messages are only read for the model's
+    remark (SENTIMENT_REMARK=1) or when the series has nothing yet (e.g.
+    right after an upgrade). Without time for the remark before `deadline`,
+    the result lists the top topics instead. Returns None if there are no messages.
+    """
+    settings = get_settings()
+    hours = settings.summarization_hours
+    short, aggregate = sentiment_series.trend(chat_id, 3600, hours * 3600)
+    if not aggregate.total:
+        messages = get_last_6h_raw_messages(chat_id, bot_username=bot_username, hours=hours)
+        return analyze_sentiment(messages, chat_id, deadline) if messages else None
+
+    remark = None
+    if settings.sentiment_remark:
+        # Scores are cached from ingest, so this only gathers topics and examples.
+        detail = aggregate_sentiment(get_last_6h_raw_messages(chat_id, bot_username=bot_username, hours=hours))
+        aggregate.keywords = detail.keywords
+        if detail.total:
+            remark = get_sentiment_remark(detail, chat_id, deadline)
+    return format_sentiment(aggregate, remark, format_trend(short, aggregate, long_label=f"{hours}h"))
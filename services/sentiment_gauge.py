@@ -1,7 +1,6 @@
 # services/sentiment_gauge.py
 import requests
 import io
-from PIL import Image
 
 def get_fear_greed_value():
     """
@@ -21,12 +20,15 @@ def send_resized_fear_greed_image(bot, chat_id, value, classification, width=250
     """
     Downloads the official chart from alternative.me, resizes it,
     and sends it to Telegram with the given (value, classification).
+    `bot` is anything with send_photo/send_message, normally the outbox.
     """
     chart_url = "https://alternative.me/crypto/fear-and-greed-index.png"
     try:
         resp = requests.get(chart_url, timeout=10)
         resp.raise_for_status()
 
+        # Pillow is only needed here, so it is imported on first use.
+        from PIL import Image
         img_original = Image.open(io.BytesIO(resp.content))
         orig_w, orig_h = img_original.size
         ratio = orig_h / float(orig_w)
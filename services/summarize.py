@@ -1,13 +1,20 @@
 # services/summarize.py
 
 import logging
-from config import SUMMARIZATION_HOURS, BASE_CHUNK_SIZE
+from config import get_settings
 from utils.history import get_last_6h_raw_messages
-from services.chunk_processor import process_chunks, create_session_with_retry, call_openwebui
+from services.chunk_processor import process_chunks, create_session_with_retry, call_openwebui, remaining_seconds
+from services.llm_scheduler import PRIORITY_SUMMARY
 from utils.formatter import add_emoticons_to_summary  # Import the new emoticon enhancer
+from utils.salience import select_salient
+from utils.sentiment_score import topic_keywords
 
 logger = logging.getLogger(__name__)
 
+# Part of the deadline kept back from the chunk calls for the final merge.
+MERGE_RESERVE_SECONDS = 15
+OUT_OF_TIME = "⏱️ Ran out of time to summarize."
+
 # 1) PARTIAL SUMMARIES
 def partial_summary_prompt(chunk, index, total):
     return (
@@ -17,7 +24,8 @@ def partial_summary_prompt(chunk, index, total):
     )
 
 def partial_combine_fn(partial_summaries):
-    return "\n---\n".join(partial_summaries)
+    # Chunks that failed or missed the deadline come back as None.
+    return "\n---\n".join(p for p in partial_summaries if p)
 
 # 2) FINAL MERGE PROMPT
 def final_merge_prompt(partials_text):
@@ -29,37 +37,78 @@ def final_merge_prompt(partials_text):
         "Now produce the final short summary (<2500 chars)."
     )
 
-def summarize_categorized(chat_id, bot_username="Chat Summary"):
+def partial_note(done, total):
+    return f"⏱️ Partial summary: covers {done} of {total} parts of the chat."
+
+def summarize_categorized(chat_id, bot_username="Chat Summary", deadline=None):
     """
     Returns a final short summary (<2500 chars) from the last X hours of chat,
     enhanced with emoticons.
+
+    Chunks that fail or are not done by the `deadline` (time.monotonic()) are
+    dropped and the summary covers the rest, with a note saying so; if the
+    final merge fails, the partial summaries are returned as they are.
     """
-    raw_messages = get_last_6h_raw_messages(chat_id, bot_username=bot_username, hours=SUMMARIZATION_HOURS)
+    settings = get_settings()
+    raw_messages = get_last_6h_raw_messages(chat_id, bot_username=bot_username, hours=settings.summarization_hours)
     if not raw_messages:
         return "No messages in the last 6 hours."
 
+    # Drop repeats and chatter, keep the most informative messages within budget
+    raw_messages = select_salient(raw_messages, settings.summary_token_budget)
+
     text_to_summarize = "\n".join(
         f"@{m['user']}: {m['text'].strip()}" for m in raw_messages
     )
 
-    # 1) Partial summaries
+    # 1) Partial summaries, leaving time for the merge
+    chunk_deadline = None
+    if deadline is not None:
+        chunk_deadline = deadline - min(MERGE_RESERVE_SECONDS, remaining_seconds(deadline) / 3)
+    coverage = []
+
+    def combine(partials):
+        coverage.extend([sum(1 for p in partials if p), len(partials)])
+        return partial_combine_fn(partials)
+
     partial_summaries_text = process_chunks(
         text_to_summarize,
         prompt_generator_fn=partial_summary_prompt,
-        combine_fn=partial_combine_fn,
-        chunk_size=BASE_CHUNK_SIZE,
+        combine_fn=combine,
+        chunk_size=settings.base_chunk_size,
         parallel=True,
-        max_workers=2,
-        chunk_timeout=30
+        max_workers=settings.chunk_workers,
+        chunk_timeout=30,
+        chat_id=chat_id,
+        priority=PRIORITY_SUMMARY,
+        deadline=chunk_deadline,
     )
+    done, total = coverage or (0, 0)
+    note = partial_note(done, total) if done < total else ""
+    if not done:
+        if deadline is None:
+            return None  # every chunk call failed
+        # Nothing came back in time: say what was discussed rather than fail.
+        topics = ", ".join(k for k, _ in topic_keywords([m["text"] for m in raw_messages], limit=5))
+        logger.warning(f"No chunk summaries for chat {chat_id} before the deadline.")
+        return OUT_OF_TIME + (f" Most discussed: {topics}." if topics else "")
 
     # 2) Final unify
     prompt = final_merge_prompt(partial_summaries_text)
-    session = create_session_with_retry()
-    final_summary = call_openwebui(prompt, session=session, timeout=60)
+    session = create_session_with_retry(deadline=deadline)
+    merged = call_openwebui(
+        prompt, session=session, timeout=60, chat_id=chat_id, priority=PRIORITY_SUMMARY, deadline=deadline
+    )
+    if merged:
+        final_summary = merged.text
+    else:
+        logger.warning(f"Final merge for chat {chat_id} failed ({merged.error}); sending the partial summaries.")
+        final_summary = partial_summaries_text.replace("\n---\n", "\n")
 
     if len(final_summary) > 2500:
         final_summary = final_summary[:2490] + "..."
+    if note:
+        final_summary = f"{final_summary}\n\n{note}"
 
     # 3) Enhance with emoticons
     final_summary_with_emoticons = add_emoticons_to_summary(final_summary)
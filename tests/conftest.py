@@ -0,0 +1,21 @@
+# tests/conftest.py
+
+import os
+import sys
+
+import pytest
+
+# config reads these at import; the tests never talk to real services.
+os.environ.setdefault("API_KEY", "1:test-token")
+os.environ.setdefault("OPENWEBUI_API_KEY", "test-key")
+os.environ.setdefault("OPENWEBUI_BASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("STATE_BACKEND", "memory")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True, scope="session")
+def _memory_index_dir(tmp_path_factory):
+    # The shared chat memory writes behind; keep its files out of the tree.
+    from utils.vector_memory import vector_memory
+    vector_memory.directory = str(tmp_path_factory.mktemp("memory_index"))
@@ -0,0 +1,67 @@
+# tests/test_bootstrap.py
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+import bootstrap
+import config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def valid_config(monkeypatch):
+    monkeypatch.setattr(config, "SHARD_COUNT", 1)
+    monkeypatch.setattr(config, "SHARD_INDEX", 0)
+    monkeypatch.setattr(config, "KB_MAPPINGS", {"btc": "kb-1"})
+
+
+def test_valid_config_passes(valid_config):
+    config.validate_config()
+
+
+@pytest.mark.parametrize("changes, message", [
+    ({"API_KEY": None}, "'API_KEY' is missing"),
+    ({"OPENWEBUI_BASE_URL": ""}, "'OPENWEBUI_BASE_URL' is missing"),
+    ({"SHARD_INDEX": 2, "SHARD_COUNT": 2, "STATE_BACKEND": "redis"}, "SHARD_INDEX=2 is outside 0..1"),
+    ({"SHARD_COUNT": 2, "STATE_BACKEND": "sqlite"}, "SHARD_COUNT=2 needs STATE_BACKEND=redis"),
+    ({"KB_MAPPINGS": {"btc": ""}}, "keyword 'btc' is missing"),
+])
+def test_invalid_config_logs_and_exits(valid_config, monkeypatch, caplog, changes, message):
+    for name, value in changes.items():
+        monkeypatch.setattr(config, name, value)
+    with pytest.raises(SystemExit):
+        config.validate_config()
+    assert message in caplog.text
+
+
+def test_bootstrap_runs_the_steps_in_order(monkeypatch):
+    calls = []
+    monkeypatch.setattr(bootstrap, "validate_config", lambda: calls.append("validate"))
+    monkeypatch.setattr(bootstrap, "setup_logging", lambda: calls.append("logging") or "root")
+    monkeypatch.setattr(bootstrap, "get_state_store", lambda: calls.append("store"))
+    monkeypatch.setattr(bootstrap, "install_reload_triggers", lambda: calls.append("reload"))
+
+    assert bootstrap.bootstrap() == "root"
+    assert calls == ["validate", "logging", "store", "reload"]
+
+
+def test_importing_the_bot_has_no_side_effects(tmp_path):
+    # A fresh interpreter, so modules imported by other tests do not count.
+    # (Pillow is not checked: telebot itself imports it when installed.)
+    script = (
+        "import logging, sys\n"
+        "import handlers\n"
+        "from utils import state_store\n"
+        "print(state_store._store is None, 'openai' in sys.modules,"
+        " logging.getLogger().handlers == [])\n"
+    )
+    env = dict(os.environ, PYTHONPATH=ROOT, API_KEY="1:test-token")
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=tmp_path, env=env, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["True", "False", "True"]
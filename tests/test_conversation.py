@@ -0,0 +1,75 @@
+# tests/test_conversation.py
+
+import threading
+
+import pytest
+
+from config import get_settings
+from services import conversation
+from services.conversation import ConversationEncoder, MEMORY_TAG, _tokens
+
+
+@pytest.fixture
+def slow_memory(monkeypatch):
+    """Memory updates block until `release` is set."""
+    release = threading.Event()
+
+    def call(prompt, **kwargs):
+        release.wait(5)
+        return None  # model unavailable: the fallback memory is used
+
+    monkeypatch.setattr(conversation, "call_openwebui", call)
+    yield release
+    release.set()
+
+
+@pytest.fixture
+def encoder(slow_memory):
+    encoder = ConversationEncoder()
+    yield encoder
+    slow_memory.set()
+    encoder._pool.shutdown(wait=True)  # no fold may outlive the patched model call
+
+
+def rows(count, start=0, size=400):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} " + "x" * size, "timestamp": str(i)}
+        for i in range(start, start + count)
+    ]
+
+
+def window_tokens(messages):
+    return sum(_tokens(m["content"]) for m in messages if m["role"] != "system")
+
+
+def test_window_stays_within_budget_while_folding(encoder):
+    budget = get_settings().chat_context_tokens
+    history = []
+    for step in range(6):
+        history += rows(20, start=len(history))
+        messages = encoder.encode(1, history)
+        assert window_tokens(messages) <= budget
+        assert messages[-1]["content"] == history[-1]["content"]
+
+
+def test_rebuild_from_tail_is_trimmed_and_folded(encoder, slow_memory):
+    budget = get_settings().chat_context_tokens
+    messages = encoder.encode(1, rows(200))
+    assert window_tokens(messages) <= budget
+    slow_memory.set()
+    encoder._pool.submit(lambda: None).result(5)
+    for _ in range(50):
+        messages = encoder.encode(1, rows(200))
+        if messages[1]["content"].startswith(MEMORY_TAG):
+            break
+    assert messages[1]["content"].startswith(MEMORY_TAG)
+
+
+def test_only_new_rows_of_a_tail_are_encoded(encoder):
+    history = rows(10, size=10)
+    first = encoder.encode(1, history[-4:])
+    second = encoder.encode(1, (history + rows(2, start=10, size=10))[-4:])
+    assert [m["content"] for m in second[1:]] == [m["content"] for m in first[1:]] + [
+        r["content"] for r in rows(2, start=10, size=10)
+    ]
+    assert second[1] is first[1]
@@ -0,0 +1,139 @@
+# tests/test_db_manager.py
+
+import sqlite3
+
+import pytest
+
+from utils import db_manager
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "bot_data.db")
+    monkeypatch.setattr(db_manager, "DB_PATH", path)
+    return path
+
+
+def _create_old_schema(path, rows):
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("""
+            CREATE TABLE group_chat_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id TEXT NOT NULL,
+                user TEXT,
+                text TEXT,
+                timestamp TEXT
+            )
+        """)
+        conn.executemany(
+            "INSERT INTO group_chat_logs (chat_id, user, text, timestamp) VALUES (?, ?, ?, ?)", rows
+        )
+    conn.close()
+
+
+def test_migration_adds_and_backfills_classification_columns(db_path):
+    _create_old_schema(db_path, [
+        ("1", "Alice", "hello", "2026-01-01T10:00:00"),
+        ("1", "Bob", "  /summarize 6", "2026-01-01T10:01:00"),
+        ("1", "Bob", "\t/DEL ", "2026-01-01T10:02:00"),
+        ("1", "MyBot", "a reply", "2026-01-01T10:03:00"),
+        ("1", None, "no author", "2026-01-01T10:04:00"),
+    ])
+    db_manager.init_db()
+
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(
+        "SELECT text, is_command, is_bot, author_norm FROM group_chat_logs ORDER BY id"
+    ).fetchall()
+    conn.close()
+    assert rows == [
+        ("hello", 0, 0, "alice"),
+        ("  /summarize 6", 1, 0, "bob"),
+        ("\t/DEL ", 0, 0, "bob"),
+        ("a reply", 0, 0, "mybot"),
+        ("no author", 0, 0, None),
+    ]
+    # The migrated rows go through the same filtered window query as new ones.
+    db_manager.add_group_message(1, "carol", "new", "2026-01-01T10:05:00")
+    texts = [
+        row["text"]
+        for row in db_manager.iter_group_messages_since(1, "2026-01-01T00:00:00", bot_username="mybot")
+    ]
+    assert texts == ["hello", "\t/DEL ", "no author", "new"]
+
+
+def test_migration_is_a_no_op_on_a_current_schema(db_path):
+    db_manager.init_db()
+    db_manager.add_group_message(1, "Alice", "/find x", "2026-01-01T10:00:00", is_bot=True)
+    db_manager.init_db()
+
+    conn = sqlite3.connect(db_path)
+    row = conn.execute("SELECT is_command, is_bot, author_norm FROM group_chat_logs").fetchone()
+    conn.close()
+    assert row == (1, 1, "alice")
+
+
+def _search(chat_id, query):
+    return [hit["text"] for hit in db_manager.search_group_messages(chat_id, query)]
+
+
+def test_search_index_follows_inserts_updates_and_deletes(db_path):
+    db_manager.init_db()
+    db_manager.add_group_message(1, "alice", "the halving is close", "2026-01-01T10:00:00")
+    assert _search(1, "halving") == ["the halving is close"]
+
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("UPDATE group_chat_logs SET text = 'the merge is close'")
+    assert _search(1, "halving") == []
+    assert _search(1, "merge") == ["the merge is close"]
+    with conn:
+        conn.execute("DELETE FROM group_chat_logs")
+    conn.close()
+    assert _search(1, "merge") == []
+
+
+def test_search_index_is_built_for_rows_stored_before_it(db_path):
+    _create_old_schema(db_path, [("1", "alice", "stored before the index existed", "2026-01-01T10:00:00")])
+    db_manager.init_db()
+    assert _search(1, "index") == ["stored before the index existed"]
+
+
+def test_search_is_limited_to_the_chat_and_skips_commands_and_bots(db_path):
+    db_manager.init_db()
+    db_manager.add_group_message(1, "alice", "wallet tips", "2026-01-01T10:00:00")
+    db_manager.add_group_message(-1, "bob", "wallet secrets", "2026-01-01T10:01:00")
+    db_manager.add_group_message(1, "alice", "/find wallet", "2026-01-01T10:02:00")
+    db_manager.add_group_message(1, "helper", "wallet bot", "2026-01-01T10:03:00", is_bot=True)
+    assert _search(1, "wallet") == ["wallet tips"]
+    # "-1" and "1" share the chat_id token; the join still keeps them apart.
+    assert _search(-1, "wallet") == ["wallet secrets"]
+
+
+@pytest.mark.parametrize("query, terms", [
+    ("halving date", ["halving", "date"]),
+    ('"block reward" cut', ["block reward", "cut"]),
+    ("sol*", ["sol*"]),
+    ('AND OR NOT NEAR(a b)', ["AND", "OR", "NOT", "NEAR a", "b"]),
+    ('text:secret chat_id:2', ["text secret", "chat_id 2"]),
+    ('"unclosed', ["unclosed"]),
+    ("-- ' ; *", []),
+    ("", []),
+])
+def test_search_terms_drop_fts_syntax(query, terms):
+    assert db_manager.search_terms(query) == terms
+
+
+def test_match_expression_quotes_every_term():
+    expression = db_manager._match_expression(-5, ["AND", "block reward", "sol*"])
+    assert expression == 'chat_id : "-5" AND text : ("AND" "block reward" "sol"*)'
+
+
+@pytest.mark.parametrize("query", ["AND", "NEAR(wallet tips)", "text:wallet", '"', "wallet*", "tips OR"])
+def test_fts_syntax_in_queries_never_errors(db_path, query):
+    db_manager.init_db()
+    db_manager.add_group_message(1, "alice", "wallet tips and tricks", "2026-01-01T10:00:00")
+    db_manager.add_group_message(1, "bob", "AND then OR else", "2026-01-01T10:01:00")
+    hits = db_manager.search_group_messages(1, query)
+    assert all(hit["text"] in ("wallet tips and tricks", "AND then OR else") for hit in hits)
@@ -0,0 +1,64 @@
+# tests/test_digest.py
+
+import dataclasses
+
+import pytest
+
+from config import get_settings
+from services import digest
+from services.digest import DigestSchedule
+
+
+@pytest.fixture
+def interval(monkeypatch):
+    """
+    Sets DIGEST_INTERVAL_HOURS as the schedule sees it.
+    """
+    def set_hours(hours):
+        settings = dataclasses.replace(get_settings(), digest_interval_hours=hours)
+        monkeypatch.setattr(digest, "get_settings", lambda: settings)
+    return set_hours
+
+
+def test_schedule_delivers_once_per_interval(interval, monkeypatch):
+    monkeypatch.setattr(digest, "DIGEST_ADMIN_CHAT_ID", -100)
+    delivered = []
+    schedule = DigestSchedule(delivered.append)
+    schedule._last_run = 0.0
+    interval(2)
+    assert not schedule._tick(2 * 3600 - 1)
+    assert schedule._tick(2 * 3600)
+    assert not schedule._tick(3 * 3600)
+    assert schedule._tick(4 * 3600)
+    assert delivered == [-100, -100]
+
+
+def test_schedule_interval_starts_when_switched_on(interval):
+    delivered = []
+    schedule = DigestSchedule(delivered.append)
+    schedule._last_run = 0.0
+    interval(0)
+    assert not schedule._tick(10 * 3600)
+    interval(1)
+    assert not schedule._tick(10 * 3600 + 1)
+    assert schedule._tick(11 * 3600)
+    assert len(delivered) == 1
+
+
+def test_schedule_survives_a_failed_delivery(interval):
+    def deliver(chat_id):
+        raise RuntimeError("no network")
+
+    schedule = DigestSchedule(deliver)
+    schedule._last_run = 0.0
+    interval(1)
+    assert schedule._tick(3600)
+    # The failed run still counts; the next one waits a full interval.
+    assert not schedule._tick(3600 + 60)
+
+
+def test_remembered_sections_are_limited_to_the_digest_chats(monkeypatch):
+    monkeypatch.setattr(digest, "_sections", {1: ("t1", "one"), 2: ("t2", "two"), 3: ("t3", "three")})
+    monkeypatch.setattr(digest, "_window", lambda chat_id, hours, bot_username: [])
+    assert digest.build_digest({2: "two", 4: "four"}) is None
+    assert digest._sections == {2: ("t2", "two")}
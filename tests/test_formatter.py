@@ -0,0 +1,49 @@
+# tests/test_formatter.py
+
+import pytest
+
+from utils.formatter import (
+    add_emoticons_to_summary, clean_model_output, html_to_text, markdown_to_telegram_html, sanitize_html,
+)
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("<b>bold", "<b>bold</b>"),
+    ("<b><i>both</b> after", "<b><i>both</i></b> after"),
+    ("stray </i> close", "stray  close"),
+    ("<div><b>x</b></div>", "<b>x</b>"),
+    ("a < b & c", "a &lt; b &amp; c"),
+    ("&amp; stays", "&amp; stays"),
+    ("<STRONG>x</STRONG>", "<strong>x</strong>"),
+    ("<b/>empty", "empty"),
+    ("line<br>next<br/>end", "line\nnext\nend"),
+    ('<a href="http://e.com?a=1&b=2">link', '<a href="http://e.com?a=1&amp;b=2">link</a>'),
+    ("<a>no href</a>", "no href"),
+])
+def test_sanitize_html_balances_and_filters(raw, expected):
+    assert sanitize_html(raw) == expected
+
+
+def test_markdown_constructs_become_tags():
+    text = "## Title\n**bold** and [site](http://e.com/x)"
+    assert markdown_to_telegram_html(text) == (
+        '<b>Title</b>\n<b>bold</b> and <a href="http://e.com/x">site</a>'
+    )
+
+
+def test_unclosed_markdown_inside_raw_tags_is_balanced():
+    assert markdown_to_telegram_html("<i>**bold** still italic") == "<i><b>bold</b> still italic</i>"
+
+
+def test_clean_model_output_without_tags_only_converts_bold():
+    assert clean_model_output("**a** & b") == "<b>a</b> &amp; b"
+    assert clean_model_output("<u>**a**</u>") == "<b>a</b>"
+
+
+def test_html_to_text():
+    assert html_to_text("<b>Hi</b> &amp;   you<br>there\n\n\n<i>x</i>") == "Hi & you\nthere\nx"
+
+
+def test_emoticons_follow_category_priority():
+    out = add_emoticons_to_summary("New launch and a hot topic\nJust a line")
+    assert out.split("\n") == ["🚀 New launch and a hot topic", "Just a line"]
@@ -0,0 +1,99 @@
+# tests/test_handlers.py
+
+from types import SimpleNamespace
+
+import pytest
+
+import handlers
+from utils.rate_limit import RateLimiter
+
+HIT = {"user": "alice", "timestamp": "2026-01-01T10:00:00", "snippet": "the [[halving]] <soon>"}
+RESULT = {"title": "Halving", "snippet": "Block reward cut", "url": "https://example.com/halving"}
+
+
+def _fail(*args, **kwargs):
+    raise RuntimeError("down")
+
+
+@pytest.fixture
+def sources(monkeypatch):
+    def use(local, bing):
+        monkeypatch.setattr(handlers, "find_group_messages", local)
+        monkeypatch.setattr(handlers, "query_bing_api", bing)
+    return use
+
+
+def test_search_shows_bing_results_then_local_hits(sources, monkeypatch):
+    monkeypatch.setattr(handlers, "MATCH_START", "[[")
+    monkeypatch.setattr(handlers, "MATCH_END", "]]")
+    sources(lambda chat_id, query, limit: [HIT], lambda **kwargs: [RESULT])
+    response = handlers._search_response(1, "halving")
+    assert response.index("<b>Result 1:</b>") < response.index("<b>From this chat:</b>")
+    assert "<i>alice, 2026-01-01 10:00</i>\nthe <b>halving</b> &lt;soon&gt;" in response
+    assert response.endswith("refer to the snippet above.")
+
+
+def test_search_keeps_local_hits_when_bing_fails(sources):
+    sources(lambda chat_id, query, limit: [HIT], _fail)
+    response = handlers._search_response(1, "halving")
+    assert "From this chat" in response
+    assert "Result 1" not in response and "Error" not in response
+
+
+def test_search_keeps_bing_results_when_local_search_fails(sources):
+    sources(_fail, lambda **kwargs: [RESULT])
+    response = handlers._search_response(1, "halving")
+    assert "https://example.com/halving" in response
+    assert "From this chat" not in response
+
+
+def test_search_without_results(sources):
+    sources(lambda chat_id, query, limit: [], lambda **kwargs: [])
+    assert handlers._search_response(1, "halving").startswith("I couldn't find any results")
+
+
+def test_search_reports_bing_error_when_nothing_else_is_found(sources):
+    sources(_fail, _fail)
+    assert handlers._search_response(1, "halving") == "Error calling Bing search: down"
+
+
+class _Outbox:
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(text)
+        return SimpleNamespace(message_id=len(self.sent))
+
+
+@pytest.fixture
+def digest_chat(monkeypatch):
+    """
+    A private admin chat allowed to run /digest, with a one-per-hour cooldown.
+    """
+    outbox = _Outbox()
+    limiter = RateLimiter(limits={"digest": (1, 3600)}, max_entries=100, sweep_interval=3600, persist=False)
+    monkeypatch.setattr(handlers, "DIGEST_CHAT_IDS", [-100])
+    monkeypatch.setattr(handlers, "DIGEST_ADMIN_CHAT_ID", 5)
+    monkeypatch.setattr(handlers, "outbox", outbox)
+    monkeypatch.setattr(handlers, "rate_limiter", limiter)
+    monkeypatch.setattr(handlers, "schedule_cleanup", lambda *args, **kwargs: None)
+    message = SimpleNamespace(chat=SimpleNamespace(id=5, type="private"), from_user=SimpleNamespace(id=7))
+    return message, outbox, limiter
+
+
+def test_digest_keeps_the_cooldown_once_sent(digest_chat, monkeypatch):
+    message, outbox, limiter = digest_chat
+    monkeypatch.setattr(handlers, "send_digest", lambda chat_id, priority: True)
+    handlers.digest_command(message)
+    assert limiter.check("digest", chat_id=5, consume=False) > 0
+
+
+@pytest.mark.parametrize("send_digest", [lambda chat_id, priority: False, _fail])
+def test_digest_refunds_the_cooldown_when_nothing_is_sent(digest_chat, monkeypatch, send_digest):
+    message, outbox, limiter = digest_chat
+    monkeypatch.setattr(handlers, "send_digest", send_digest)
+    handlers.digest_command(message)
+    assert limiter.check("digest", chat_id=5, consume=False) == 0
+    handlers.digest_command(message)
+    assert not any(text.startswith("⏳") for text in outbox.sent)
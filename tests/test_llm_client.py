@@ -0,0 +1,81 @@
+# tests/test_llm_client.py
+
+import threading
+import time
+
+import pytest
+
+from services import llm_client
+from services.llm_client import CircuitBreaker, LLMResult
+
+
+def open_breaker():
+    """A breaker whose open period has just run out."""
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=60)
+    breaker.record_failure()
+    breaker.opened_at -= 60
+    return breaker
+
+
+def test_probe_is_handed_to_exactly_one_caller():
+    breaker = open_breaker()
+    start = threading.Barrier(16)
+    admitted = []
+
+    def caller():
+        start.wait()
+        admitted.append(breaker.acquire())
+
+    threads = [threading.Thread(target=caller) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert admitted.count(CircuitBreaker.HALF_OPEN) == 1
+    assert admitted.count(None) == 15
+
+
+def test_released_probe_can_be_taken_again():
+    breaker = open_breaker()
+    assert breaker.acquire() == CircuitBreaker.HALF_OPEN
+    assert breaker.acquire() is None
+    breaker.release()
+    assert breaker.acquire() == CircuitBreaker.HALF_OPEN
+
+
+@pytest.fixture
+def primary(monkeypatch):
+    breaker = CircuitBreaker("primary", failure_threshold=5, reset_seconds=60)
+    endpoint = llm_client._Endpoint("primary", "http://127.0.0.1:9", "key", breaker)
+    monkeypatch.setattr(llm_client, "_routes", lambda settings: [(endpoint, "model")])
+    timeouts = []
+
+    def timed_out(endpoint, payload, session, timeout, *args):
+        timeouts.append(timeout)
+        return LLMResult.failure("timeout", "read timed out", endpoint.name)
+
+    monkeypatch.setattr(llm_client, "_post", timed_out)
+    return breaker, timeouts
+
+
+def test_timeout_cut_short_by_the_deadline_is_not_a_failure(primary):
+    breaker, timeouts = primary
+    result = llm_client.complete([], timeout=60, deadline=time.monotonic() + 1)
+    assert result.error == "timeout"
+    assert timeouts[0] < 60
+    assert breaker.failures == 0
+
+
+def test_full_timeout_counts_as_a_failure(primary):
+    breaker, timeouts = primary
+    llm_client.complete([], timeout=5, deadline=time.monotonic() + 60)
+    assert timeouts == [5]
+    assert breaker.failures == 1
+
+
+def test_prompt_size_sets_the_cost():
+    assert llm_client.prompt_cost([]) == 1.0
+    assert llm_client.prompt_cost([{"role": "user", "content": "hi"}]) == 1.0
+    unit = llm_client.COST_UNIT_CHARS
+    long_prompt = [{"role": "system", "content": "x" * unit}, {"role": "user", "content": "y" * unit * 2}]
+    assert llm_client.prompt_cost(long_prompt) == 3.0
@@ -0,0 +1,64 @@
+# tests/test_llm_scheduler.py
+
+import threading
+import time
+
+import pytest
+
+from services.llm_scheduler import (
+    DeadlineExceeded, LLMScheduler, PRIORITY_BACKGROUND, PRIORITY_CHAT,
+)
+
+
+def test_slow_background_call_does_not_drop_a_chat_call():
+    scheduler = LLMScheduler()
+    scheduler.run(time.sleep, 0.5, chat_id="digest", priority=PRIORITY_BACKGROUND)
+
+    # Queue idle; 0.3s is plenty for a chat call even though the last
+    # background call took 0.5s.
+    result = scheduler.run(lambda: "ok", chat_id=1, priority=PRIORITY_CHAT, deadline=time.monotonic() + 0.3)
+    assert result == "ok"
+    assert scheduler.stats()["counts"].get("chat.dropped", 0) == 0
+
+
+def test_call_is_dropped_when_its_own_class_is_too_slow():
+    scheduler = LLMScheduler()
+    scheduler.run(time.sleep, 0.3, chat_id=1, priority=PRIORITY_CHAT)
+    with pytest.raises(DeadlineExceeded):
+        scheduler.run(lambda: "late", chat_id=1, priority=PRIORITY_CHAT, deadline=time.monotonic() + 0.1)
+
+
+def _run_queued(scheduler, jobs):
+    """
+    Queues `jobs` ((chat_id, cost) pairs) behind a blocked single worker,
+    then lets them run; returns the chat ids in the order they ran.
+    """
+    scheduler.workers = 1
+    release = threading.Event()
+    blocker = scheduler.submit(release.wait, 5, chat_id="blocker", priority=PRIORITY_BACKGROUND)
+    while scheduler.stats()["running"] == 0:
+        time.sleep(0.001)
+    order = []
+    futures = [
+        scheduler.submit(order.append, chat_id, chat_id=chat_id, priority=PRIORITY_BACKGROUND, cost=cost)
+        for chat_id, cost in jobs
+    ]
+    release.set()
+    blocker.result(timeout=5)
+    for future in futures:
+        future.result(timeout=5)
+    return order
+
+
+def test_weighted_chats_interleave_by_share():
+    scheduler = LLMScheduler()
+    scheduler.set_weight("a", 2)
+    order = _run_queued(scheduler, [("a", 1.0)] * 4 + [("b", 1.0)] * 4)
+    # "a" gets two turns for each of "b"'s while both are waiting.
+    assert order == ["a", "a", "b", "a", "a", "b", "b", "b"]
+
+
+def test_costly_jobs_take_a_larger_share():
+    scheduler = LLMScheduler()
+    order = _run_queued(scheduler, [("big", 3.0)] * 2 + [("small", 1.0)] * 4)
+    assert order == ["small", "small", "big", "small", "small", "big"]
@@ -0,0 +1,96 @@
+# tests/test_logging_conf.py
+
+import json
+import logging
+import queue
+import sys
+import threading
+
+from utils import settings_watch
+from utils.logging_conf import JsonFormatter, NonBlockingQueueHandler, SamplingFilter
+
+
+def _record(name="bot", level=logging.INFO, msg="hello", args=None, **extra):
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def _kept(log_filter, records):
+    return sum(bool(log_filter.filter(record)) for record in records)
+
+
+def test_sampling_keeps_an_exact_fraction_per_category():
+    log_filter = SamplingFilter({"llm": 0.1})
+    assert _kept(log_filter, [_record("llm.client") for _ in range(100)]) == 10
+    assert _kept(log_filter, [_record("handlers") for _ in range(100)]) == 100
+
+
+def test_sampling_prefers_the_category_extra_and_the_longest_prefix():
+    log_filter = SamplingFilter({"llm": 0, "llm.stream": 0.5})
+    assert _kept(log_filter, [_record("llm.stream.chunks") for _ in range(10)]) == 5
+    assert _kept(log_filter, [_record("handlers", category="llm") for _ in range(10)]) == 0
+    # "llmx" is not under "llm".
+    assert _kept(log_filter, [_record("llmx") for _ in range(10)]) == 10
+
+
+def test_sampling_never_drops_warnings():
+    log_filter = SamplingFilter({"llm": 0})
+    assert _kept(log_filter, [_record("llm", level=logging.WARNING) for _ in range(10)]) == 10
+
+
+def test_queue_handler_drops_when_full_and_reports_the_loss():
+    handler = NonBlockingQueueHandler(queue.Queue(1), max_chars=1000)
+    for _ in range(3):
+        handler.emit(_record())
+    assert handler.queue.get_nowait().getMessage() == "hello"
+
+    handler.emit(_record(msg="after"))
+    record = handler.queue.get_nowait()
+    assert record.dropped_before == 2
+    assert handler.dropped == 0
+
+
+def test_queue_handler_renders_and_truncates_the_message():
+    handler = NonBlockingQueueHandler(queue.Queue(), max_chars=5)
+    original = _record(msg="%s-%s", args=("abcdef", "ghi"))
+    handler.emit(original)
+    record = handler.queue.get_nowait()
+    assert record.getMessage() == "abcde... [10 chars]"
+    assert record.args is None
+    # The caller's record is left as it was.
+    assert original.getMessage() == "abcdef-ghi"
+
+
+def test_json_formatter_writes_extras_and_the_traceback():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        exc_info = sys.exc_info()
+    record = _record(msg="done %d", args=(3,), chat_id=7, prompt="x" * 20)
+    record.exc_info = exc_info
+
+    entry = json.loads(JsonFormatter(max_chars=10).format(record))
+    assert entry["msg"] == "done 3"
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "bot"
+    assert entry["chat_id"] == 7
+    assert entry["prompt"] == "xxxxxxxxxx... [20 chars]"
+    assert "ValueError: boom" in entry["exc"]
+
+
+def test_signal_reload_only_starts_a_thread(monkeypatch):
+    started = threading.Event()
+    calls = []
+
+    def reload_settings():
+        calls.append(threading.current_thread().name)
+        started.set()
+
+    monkeypatch.setattr(settings_watch, "reload_settings", reload_settings)
+    monkeypatch.setattr(settings_watch.logger, "info", lambda *args, **kwargs: calls.append("log"))
+
+    settings_watch._reload_async("SIGHUP")
+    assert started.wait(timeout=5)
+    # Nothing was logged from the caller's (signal handler's) thread.
+    assert calls == ["log", "settings-reload"]
@@ -0,0 +1,86 @@
+# tests/test_message_window.py
+
+from datetime import datetime, timedelta
+
+from utils.message_window import MessageWindowCache
+
+START = datetime(2026, 1, 1, 10, 0, 0)
+
+
+def _at(minutes):
+    return START + timedelta(minutes=minutes)
+
+
+def _row(user, text, minutes):
+    return {"user": user, "text": text, "timestamp": _at(minutes).isoformat()}
+
+
+def test_unseen_chat_is_not_covered():
+    cache = MessageWindowCache(max_messages=10, max_chats=4)
+    assert cache.get(1, _at(0)) is None
+
+
+def test_window_covers_from_first_message_and_filters_at_ingest():
+    cache = MessageWindowCache(max_messages=10, max_chats=4)
+    cache.add(1, "alice", "first", _at(1))
+    cache.add(1, "alice", "/summarize", _at(2))
+    cache.add(1, "helper", "from a bot", _at(3), is_bot=True)
+    cache.add(1, "MyBot", "own reply", _at(4))
+    cache.add(1, "bob", "late arrival", _at(1.5))
+
+    assert cache.get(1, _at(0)) is None
+    texts = [entry["text"] for entry in cache.get(1, _at(1), bot_username="mybot")]
+    assert texts == ["first", "late arrival"]
+    assert [entry["text"] for entry in cache.get(1, _at(1.6))] == ["own reply"]
+
+
+def test_trim_moves_coverage_past_dropped_messages():
+    cache = MessageWindowCache(max_messages=2, max_chats=4)
+    for minute in range(4):
+        cache.add(1, "alice", f"m{minute}", _at(minute))
+
+    assert cache.get(1, _at(1)) is None
+    assert [entry["text"] for entry in cache.get(1, _at(2))] == ["m2", "m3"]
+
+
+def test_least_recently_used_chat_is_evicted():
+    cache = MessageWindowCache(max_messages=10, max_chats=2)
+    cache.add(1, "alice", "one", _at(0))
+    cache.add(2, "alice", "two", _at(0))
+    cache.get(1, _at(0))
+    cache.add(3, "alice", "three", _at(0))
+
+    assert cache.get(2, _at(0)) is None
+    assert cache.get(1, _at(0)) is not None
+
+
+def test_resize_trims_existing_windows():
+    cache = MessageWindowCache(max_messages=5, max_chats=4)
+    for minute in range(5):
+        cache.add(1, "alice", f"m{minute}", _at(minute))
+    cache.resize(max_messages=1, max_chats=4)
+
+    assert cache.get(1, _at(3)) is None
+    assert [entry["text"] for entry in cache.get(1, _at(4))] == ["m4"]
+
+
+def test_hydrate_covers_since_and_keeps_messages_ingested_meanwhile():
+    cache = MessageWindowCache(max_messages=10, max_chats=4)
+    # Ingested while the SQLite query ran: one overlaps the rows, one is newer.
+    cache.add(1, "bob", "m2", _at(2))
+    cache.add(1, "bob", "m3", _at(3))
+
+    rows = [_row("alice", "m0", 0), _row("MyBot", "bot says", 1), _row("bob", "m2", 2)]
+    cache.hydrate(1, _at(-5), rows)
+
+    texts = [entry["text"] for entry in cache.get(1, _at(-5), bot_username="mybot")]
+    assert texts == ["m0", "m2", "m3"]
+
+
+def test_hydrate_trims_to_the_newest_messages():
+    cache = MessageWindowCache(max_messages=2, max_chats=4)
+    rows = [_row("alice", f"m{minute}", minute) for minute in range(4)]
+    cache.hydrate(1, _at(0), rows)
+
+    assert cache.get(1, _at(0)) is None
+    assert [entry["text"] for entry in cache.get(1, _at(2))] == ["m2", "m3"]
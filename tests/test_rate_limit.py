@@ -0,0 +1,125 @@
+# tests/test_rate_limit.py
+
+import pytest
+
+from utils.rate_limit import RateLimiter
+from utils.state_store import MemoryStateStore, RedisStateStore, get_state_store, set_state_store
+
+
+def make_limiter():
+    return RateLimiter(limits={"summarize": (1, 60)}, max_entries=100, sweep_interval=3600, persist=False)
+
+
+def test_reserved_token_blocks_concurrent_requests():
+    limiter = make_limiter()
+    assert limiter.check("summarize", chat_id=1, now=0) == 0
+    assert limiter.check("summarize", chat_id=1, now=1) > 0
+
+
+def test_refund_gives_the_token_back():
+    limiter = make_limiter()
+    limiter.check("summarize", chat_id=1, now=0)
+    limiter.refund("summarize", chat_id=1, now=1)
+    assert limiter.check("summarize", chat_id=1, now=2) == 0
+    assert len(limiter) == 1
+
+
+def test_refund_never_exceeds_capacity():
+    limiter = make_limiter()
+    limiter.refund("summarize", chat_id=1, now=0)
+    limiter.check("summarize", chat_id=1, now=0)
+    limiter.refund("summarize", chat_id=1, now=1)
+    limiter.refund("summarize", chat_id=1, now=1)
+    assert limiter.check("summarize", chat_id=1, now=2) == 0
+    assert limiter.check("summarize", chat_id=1, now=3) > 0
+
+
+class _StubRedis:
+    """The few Redis commands the cooldowns use, on a manual clock (ms)."""
+
+    def __init__(self):
+        self.clock = 0
+        self.expiry = {}
+        self.hashes = {}
+
+    def _live(self, name):
+        if name in self.expiry and self.expiry[name] <= self.clock:
+            del self.expiry[name]
+        return name in self.expiry
+
+    def set(self, name, value, nx=False, px=None):
+        if nx and self._live(name):
+            return None
+        self.expiry[name] = self.clock + px
+        return True
+
+    def pttl(self, name):
+        return self.expiry[name] - self.clock if self._live(name) else -2
+
+    def delete(self, *names):
+        return sum(self.expiry.pop(name, None) is not None for name in names)
+
+    def hvals(self, name):
+        return list(self.hashes.get(name, {}).values())
+
+
+@pytest.fixture
+def redis_store():
+    previous = get_state_store()
+    store = RedisStateStore.__new__(RedisStateStore)
+    store._redis = _StubRedis()
+    set_state_store(store)
+    yield store
+    set_state_store(previous)
+
+
+def make_worker():
+    return RateLimiter(limits={"sentiment": (1, 60)}, max_entries=100, sweep_interval=3600)
+
+
+def test_cooldown_is_reserved_across_workers(redis_store):
+    first, second = make_worker(), make_worker()
+    assert first.check("sentiment", user_id=5, now=0) == 0
+
+    redis_store._redis.clock = 20_000
+    assert second.check("sentiment", user_id=5, now=20) == pytest.approx(40)
+    # The refused worker now waits locally, without asking the store again.
+    assert second.check("sentiment", user_id=5, now=30) == pytest.approx(30)
+    assert second.check("sentiment", user_id=6, now=30) == 0
+
+
+def test_refund_releases_the_shared_cooldown(redis_store):
+    first, second = make_worker(), make_worker()
+    first.check("sentiment", user_id=5, now=0)
+    first.refund("sentiment", user_id=5, now=1)
+    assert second.check("sentiment", user_id=5, now=2) == 0
+
+
+def test_unshared_store_keeps_cooldowns_per_worker():
+    previous = get_state_store()
+    set_state_store(MemoryStateStore())
+    try:
+        first, second = make_worker(), make_worker()
+        assert first.check("sentiment", user_id=5, now=0) == 0
+        assert second.check("sentiment", user_id=5, now=1) == 0
+    finally:
+        set_state_store(previous)
+
+
+def test_snapshot_is_written_after_the_lock_is_released():
+    store = MemoryStateStore()
+    limiter = RateLimiter(limits={"summarize": (1, 60)}, max_entries=100, sweep_interval=0)
+    saved = []
+
+    def save_rate_limits(rows):
+        assert not limiter._lock.locked()
+        saved.append(rows)
+
+    store.save_rate_limits = save_rate_limits
+    previous = get_state_store()
+    set_state_store(store)
+    try:
+        assert limiter.check("summarize", chat_id=1) == 0
+    finally:
+        set_state_store(previous)
+    assert [row[:3] for row in saved[-1]] == [("summarize", 1, 0)]
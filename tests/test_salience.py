@@ -0,0 +1,85 @@
+# tests/test_salience.py
+
+from utils.salience import estimate_tokens, select_salient
+
+
+def _msgs(*rows):
+    return [
+        {"user": user, "text": text, "timestamp": f"2026-01-01T10:{minute:02d}:00"}
+        for minute, (user, text) in enumerate(rows)
+    ]
+
+
+def test_zero_budget_keeps_everything():
+    messages = _msgs(("alice", "gm"), ("bob", "gm"))
+    assert select_salient(messages, 0) is messages
+
+
+def test_chatter_runs_collapse_into_one_line():
+    messages = _msgs(
+        ("alice", "gm"), ("bob", "gm"), ("carol", "lol"), ("dave", "🚀"),
+        ("erin", "the halving is in april, expect volatility before it"),
+        ("frank", "gm"),
+    )
+    texts = [m["text"] for m in select_salient(messages, 10_000)]
+    assert texts == [
+        "(4 short messages: gm x2, lol, 🚀)",
+        "the halving is in april, expect volatility before it",
+        "gm",
+    ]
+
+
+def test_short_messages_with_substance_are_not_chatter():
+    messages = _msgs(("alice", "BTC 70k"), ("bob", "gm"), ("carol", "https://example.com"))
+    texts = [m["text"] for m in select_salient(messages, 10_000)]
+    assert texts == ["BTC 70k", "gm", "https://example.com"]
+
+
+def test_non_latin_messages_are_content_not_chatter():
+    messages = _msgs(
+        ("алиса", "халвинг будет в апреле, ждём волатильность"),
+        ("боб", "биткоин снова растёт после новостей"),
+    )
+    assert select_salient(messages, 10_000) == messages
+
+
+def test_near_duplicates_merge_into_the_first_with_a_count():
+    messages = _msgs(
+        ("alice", "the exchange paused all withdrawals for everyone this morning after the outage"),
+        ("bob", "The exchange paused all withdrawals for everyone this morning after the outage!"),
+        ("carol", "the exchange paused all withdrawals for everyone this morning after the outage lol"),
+        ("dave", "unrelated question about staking rewards and lockups?"),
+    )
+    texts = [m["text"] for m in select_salient(messages, 10_000)]
+    assert texts == [
+        "the exchange paused all withdrawals for everyone this morning after the outage (x3)",
+        "unrelated question about staking rewards and lockups?",
+    ]
+
+
+def test_accented_near_duplicates_merge():
+    messages = _msgs(
+        ("alice", "le marché réagit très mal à la décision de la banque"),
+        ("bob", "Le marché réagit très mal à la décision de la banque."),
+        ("carol", "le marche reagit tres mal a la decision de la banque"),
+    )
+    texts = [m["text"] for m in select_salient(messages, 10_000)]
+    # Accents are part of the word, so the unaccented copy is a different text.
+    assert texts == [
+        "le marché réagit très mal à la décision de la banque (x2)",
+        "le marche reagit tres mal a la decision de la banque",
+    ]
+
+
+def test_budget_cut_keeps_order_and_fits():
+    messages = _msgs(*[
+        (f"user{i}", f"message number {i} discusses topic{i} with some detail about it")
+        for i in range(20)
+    ])
+    budget = estimate_tokens(messages) // 3
+    selected = select_salient(messages, budget)
+
+    assert 0 < len(selected) < len(messages)
+    assert sum(estimate_tokens([m]) for m in selected) <= budget
+    positions = [messages.index(m) for m in selected]
+    assert positions == sorted(positions)
@@ -0,0 +1,58 @@
+# tests/test_send_queue.py
+
+import threading
+from concurrent.futures import Future
+
+from utils import message_cleanup, send_queue
+from utils.send_queue import OutboundScheduler
+
+
+class _SingleDeleteBot:
+    """A bot without the batched deleteMessages call."""
+
+    def __init__(self, expected):
+        self.deleted = []
+        self.done = threading.Event()
+        self.expected = expected
+
+    def delete_message(self, chat_id, message_id):
+        self.deleted.append((chat_id, message_id))
+        if len(self.deleted) == self.expected:
+            self.done.set()
+
+
+def test_fallback_deletes_take_one_token_each(monkeypatch):
+    taken = []
+    original_take = send_queue.TokenBucket.take
+
+    def counting_take(bucket, now):
+        taken.append(bucket)
+        original_take(bucket, now)
+
+    monkeypatch.setattr(send_queue.TokenBucket, "take", counting_take)
+    bot = _SingleDeleteBot(expected=3)
+    outbox = OutboundScheduler(bot)
+
+    assert outbox.delete_messages(7, [3, 1, 2, 2]).result(timeout=5) == 3
+    assert bot.done.wait(timeout=5)
+
+    assert sorted(mid for _, mid in bot.deleted) == [1, 2, 3]
+    chat_bucket = outbox._chats[7]
+    # One global and one chat token for the batch job, then per message.
+    assert taken.count(outbox._global) == 4
+    assert taken.count(chat_bucket) == 4
+
+
+def test_cancelled_cleanup_is_counted_as_failed():
+    future = Future()
+
+    class _Outbox:
+        def delete_messages(self, chat_id, ids, priority):
+            return future
+
+    before = dict(message_cleanup.cleanup_stats)
+    message_cleanup.schedule_cleanup(_Outbox(), 1, [10, 11], "test")
+    assert future.cancel()
+
+    assert message_cleanup.cleanup_stats["failed"] == before["failed"] + 2
+    assert message_cleanup.cleanup_stats["deleted"] == before["deleted"]
@@ -0,0 +1,96 @@
+# tests/test_sentiment_score.py
+
+import pytest
+
+from utils.sentiment_score import (
+    aggregate_sentiment, format_digest, label_of, percentages, score_text, score_texts, topic_keywords,
+)
+
+
+def _msg(user, text, minute):
+    return {"user": user, "text": text, "timestamp": f"2026-01-01T10:{minute:02d}:00"}
+
+
+@pytest.mark.parametrize("text, label", [
+    ("bullish on this, lfg", "positive"),
+    ("total scam, got rekt", "negative"),
+    ("meeting at noon", "neutral"),
+    ("🚀🚀", "positive"),
+    ("📉", "negative"),
+    ("not bullish", "negative"),
+    # The comma ends the negation's reach.
+    ("not sure, but bullish", "positive"),
+    # Negations only flip words; an emoji states the mood.
+    ("never selling 🚀", "positive"),
+])
+def test_score_labels(text, label):
+    assert label_of(score_text(text)) == label
+
+
+def test_intensifier_strengthens_the_next_word():
+    assert score_text("very bullish") > score_text("bullish") > 0
+
+
+def test_scores_stay_in_range():
+    assert 0 < score_text("moon " * 50) < 1
+    assert -1 < score_text("scam " * 50) < 0
+
+
+def test_non_latin_words_are_whole_tokens():
+    # Accented words are not split into a Latin word plus leftovers ("gain" + "é").
+    assert score_text("gainé") == 0
+    assert score_text("bullé rugé") == 0
+    assert score_text("рынок bullish") == score_text("bullish")
+
+
+def test_batch_matches_single_scores():
+    texts = ["gm", "lfg 🚀", "gm", "dump it", ""]
+    assert score_texts(texts) == [score_text(t) for t in texts]
+
+
+@pytest.mark.parametrize("counts, expected", [
+    ([1, 1, 1], [34, 33, 33]),
+    ([2, 1, 0], [67, 33, 0]),
+    ([0, 0, 0], [0, 0, 0]),
+    ([5, 0, 0], [100, 0, 0]),
+])
+def test_percentages_add_up_to_100(counts, expected):
+    assert percentages(counts) == expected
+
+
+def test_topic_keywords_count_tickers_and_words_in_any_script():
+    texts = ["$BTC halving soon", "BTC and ETH", "халвинг близко", "халвинг уже", "BTC halving"]
+    keywords = dict(topic_keywords(texts))
+    assert keywords["BTC"] == 3
+    assert keywords["halving"] == 2
+    assert keywords["халвинг"] == 2
+    assert "ETH" not in keywords
+
+
+def test_aggregate_and_digest():
+    messages = [
+        _msg("alice", "bullish, lfg 🚀", 0),
+        _msg("alice", "great breakout", 5),
+        _msg("bob", "scam, got rekt", 10),
+        _msg("carol", "meeting at noon", 12),
+    ]
+    agg = aggregate_sentiment(messages, bucket_minutes=5)
+    assert (agg.total, agg.authors) == (4, 3)
+    assert (agg.positive, agg.neutral, agg.negative) == (2, 1, 1)
+    assert agg.percentages == [50, 25, 25]
+    assert agg.users[0][:2] == ("alice", 2)
+    assert [key for key, _, _ in agg.buckets] == ["2026-01-01T10:00", "2026-01-01T10:05", "2026-01-01T10:10"]
+    assert agg.examples["negative"] == ["scam, got rekt"]
+
+    digest = format_digest(agg)
+    assert digest.splitlines()[0] == "Messages: 4 from 3 users."
+    assert "positive 50%, neutral 25%, negative 25%" in digest
+    assert "Mean score by time (count): 10:00:" in digest
+    assert "- great breakout" in digest
+
+
+def test_empty_aggregate():
+    agg = aggregate_sentiment([])
+    assert agg.total == 0
+    assert agg.percentages == [0, 0, 0]
+    assert agg.label == "Neutral 🤔"
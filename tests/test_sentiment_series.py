@@ -0,0 +1,96 @@
+# tests/test_sentiment_series.py
+
+import threading
+import time
+
+import pytest
+
+from utils.sentiment_series import SentimentSeries
+from utils.state_store import MemoryStateStore, get_state_store, set_state_store
+
+
+@pytest.fixture
+def store():
+    previous = get_state_store()
+    store = MemoryStateStore()
+    set_state_store(store)
+    yield store
+    set_state_store(previous)
+
+
+class BlockingStore(MemoryStateStore):
+    """Holds every load and save until `release` is set."""
+
+    def __init__(self):
+        super().__init__()
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def _block(self):
+        self.entered.set()
+        assert self.release.wait(timeout=5)
+
+    def load_sentiment_buckets(self, chat_id, since):
+        self._block()
+        return super().load_sentiment_buckets(chat_id, since)
+
+    def save_sentiment_buckets(self, rows, older_than):
+        self._block()
+        super().save_sentiment_buckets(rows, older_than)
+
+
+def test_scores_are_written_behind(store):
+    series = SentimentSeries(bucket_seconds=60, retention_hours=1, flush_interval=0.05)
+    now = time.time()
+    series.add_score(1, 0.5, now)
+    series.add_score(1, -0.5, now)
+    for _ in range(100):
+        if store.load_sentiment_buckets(1, 0):
+            break
+        time.sleep(0.02)
+    [(_, count, positive, negative, _)] = store.load_sentiment_buckets(1, 0)
+    assert (count, positive, negative) == (2, 1, 1)
+
+
+def test_adding_never_waits_for_the_store():
+    previous = get_state_store()
+    store = BlockingStore()
+    set_state_store(store)
+    try:
+        series = SentimentSeries(bucket_seconds=60, retention_hours=1, flush_interval=0.01)
+        series.add_score(1, 0.5)
+        # The writer is now stuck in the store, loading or saving chat 1.
+        assert store.entered.wait(timeout=5)
+        for _ in range(49):
+            series.add_score(1, 0.5)
+        series.add_score(2, 0.5)
+        store.release.set()
+        assert series.aggregate(1, 60).total == 50
+    finally:
+        set_state_store(previous)
+
+
+def test_stored_history_is_merged_with_new_scores(store):
+    now = time.time()
+    start = int(now) - int(now) % 60
+    store.save_sentiment_buckets([(1, start, 3, 2, 0, 0.9), (1, start - 60, 1, 0, 1, -0.4)], older_than=0)
+
+    series = SentimentSeries(bucket_seconds=60, retention_hours=1, flush_interval=3600)
+    series.add_score(1, -0.5, now)
+    series.flush(now)
+
+    agg = series.aggregate(1, 300, now)
+    assert (agg.total, agg.positive, agg.negative) == (5, 2, 2)
+    # The merged bucket, not just the new score, was written back.
+    saved = dict((row[0], row[1:]) for row in store.load_sentiment_buckets(1, 0))
+    assert saved[start][:3] == (4, 2, 1)
+
+
+def test_read_of_a_cold_chat_loads_its_history(store):
+    now = time.time()
+    start = int(now) - int(now) % 60
+    store.save_sentiment_buckets([(7, start, 2, 1, 1, 0.0)], older_than=0)
+
+    series = SentimentSeries(bucket_seconds=60, retention_hours=1, flush_interval=3600)
+    assert series.aggregate(7, 60, now).total == 2
+    assert series.aggregate(7, 60, now).total == 2
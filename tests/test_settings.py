@@ -0,0 +1,81 @@
+# tests/test_settings.py
+
+import pytest
+
+import config
+from config import Settings
+
+
+@pytest.fixture
+def dotenv(tmp_path, monkeypatch):
+    """Points reloads at a temporary .env; settings and listeners are restored afterwards."""
+    path = tmp_path / ".env"
+    path.write_text("")
+    monkeypatch.setattr(config, "DOTENV_PATH", str(path))
+    monkeypatch.setattr(config, "_PROCESS_ENV", {})
+    monkeypatch.setattr(config, "_settings", Settings.from_env({}))
+    monkeypatch.setattr(config, "_settings_listeners", [])
+    return path
+
+
+def test_defaults_validate():
+    settings = Settings.from_env({})
+    assert settings.max_tokens == 500
+    assert settings.log_level == "INFO"
+
+
+def test_values_are_parsed_and_normalised():
+    settings = Settings.from_env({"TEMPERATURE": "1.5", "LOG_LEVEL": "debug", "CHUNK_WORKERS": ""})
+    assert settings.temperature == 1.5
+    assert settings.log_level == "DEBUG"
+    assert settings.chunk_workers == 2
+
+
+def test_every_problem_is_reported_at_once():
+    with pytest.raises(ValueError) as excinfo:
+        Settings.from_env({"MAX_TOKENS": "many", "TEMPERATURE": "3", "LOG_SAMPLING": "llm=2"})
+    message = str(excinfo.value)
+    assert "MAX_TOKENS='many' is not a valid int" in message
+    assert "TEMPERATURE=3.0 must be between 0 and 2" in message
+    assert "LOG_SAMPLING=" in message
+
+
+def test_reload_swaps_settings_and_notifies_listeners(dotenv):
+    seen = []
+
+    def broken(old, new):
+        raise RuntimeError("listener bug")
+
+    config.on_settings_change(broken)
+    config.on_settings_change(lambda old, new: seen.append((old.max_tokens, new.max_tokens)))
+    dotenv.write_text("MAX_TOKENS=900\n")
+
+    assert config.reload_settings() == ["max_tokens"]
+    assert config.get_settings().max_tokens == 900
+    # A failing listener does not keep the others from running.
+    assert seen == [(500, 900)]
+
+
+def test_unchanged_reload_notifies_nobody(dotenv):
+    seen = []
+    config.on_settings_change(lambda old, new: seen.append(new))
+    assert config.reload_settings() == []
+    assert seen == []
+
+
+def test_invalid_reload_keeps_the_running_settings(dotenv, caplog):
+    dotenv.write_text("MAX_TOKENS=900\n")
+    config.reload_settings()
+    dotenv.write_text("MAX_TOKENS=0\nTEMPERATURE=0.1\n")
+
+    assert config.reload_settings() == []
+    assert config.get_settings().max_tokens == 900
+    assert config.get_settings().temperature == 0.7
+    assert "Settings reload rejected" in caplog.text
+
+
+def test_process_environment_wins_over_dotenv(dotenv, monkeypatch):
+    monkeypatch.setattr(config, "_PROCESS_ENV", {"MAX_TOKENS": "700"})
+    dotenv.write_text("MAX_TOKENS=900\n")
+    config.reload_settings()
+    assert config.get_settings().max_tokens == 700
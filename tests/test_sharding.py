@@ -0,0 +1,49 @@
+# tests/test_sharding.py
+
+import pytest
+
+from utils import sharding
+from utils.sharding import shard_for, update_chat_id
+from utils.state_store import MemoryStateStore
+
+
+def test_shard_for_is_stable_and_in_range():
+    shards = [shard_for(chat_id, 4) for chat_id in range(-1000, 1000)]
+    assert all(0 <= shard < 4 for shard in shards)
+    assert set(shards) == {0, 1, 2, 3}
+    assert shard_for(-100123, 4) == shard_for("-100123", 4)
+    assert shard_for(-100123, 1) == 0
+
+
+def test_update_chat_id_finds_the_chat():
+    assert update_chat_id({"update_id": 1, "message": {"chat": {"id": -5}}}) == -5
+    assert update_chat_id({"update_id": 2, "callback_query": {"message": {"chat": {"id": 7}}}}) == 7
+    assert update_chat_id({"update_id": 3, "inline_query": {"query": "x"}}) is None
+
+
+def test_updates_reach_the_owning_shard_in_order():
+    store = MemoryStateStore()
+    updates = [{"update_id": i, "message": {"chat": {"id": i % 5}}} for i in range(20)]
+    for update in updates:
+        store.push_update(shard_for(update_chat_id(update), 3), update)
+
+    received = {shard: store.pop_updates(shard, timeout=0.1, limit=100) for shard in range(3)}
+    assert sum(len(batch) for batch in received.values()) == len(updates)
+    for shard, batch in received.items():
+        assert all(shard_for(u["message"]["chat"]["id"], 3) == shard for u in batch)
+        assert [u["update_id"] for u in batch] == sorted(u["update_id"] for u in batch)
+
+
+def test_pop_updates_respects_limit_and_timeout():
+    store = MemoryStateStore()
+    for i in range(5):
+        store.push_update(0, {"update_id": i})
+    assert len(store.pop_updates(0, timeout=0.1, limit=3)) == 3
+    assert len(store.pop_updates(0, timeout=0.1, limit=3)) == 2
+    assert store.pop_updates(0, timeout=0.05) == []
+
+
+def test_run_sharded_refuses_a_store_other_workers_cannot_see(monkeypatch):
+    monkeypatch.setattr(sharding, "get_state_store", MemoryStateStore)
+    with pytest.raises(RuntimeError):
+        sharding.run_sharded(bot=None)
@@ -0,0 +1,76 @@
+# tests/test_state_store.py
+
+import time
+
+import pytest
+
+from utils import db_manager
+from utils.state_store import MemoryStateStore, SQLiteStateStore, StateStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path, monkeypatch):
+    if request.param == "memory":
+        return MemoryStateStore()
+    monkeypatch.setattr(db_manager, "DB_PATH", str(tmp_path / "bot_data.db"))
+    store = SQLiteStateStore()
+    store.init()
+    return store
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        StateStore()
+
+
+def test_group_messages_are_filtered_and_ordered(store):
+    store.add_group_message(1, "bob", "second", "2026-01-01T10:05:00")
+    store.add_group_message(1, "alice", "first", "2026-01-01T10:00:00")
+    store.add_group_message(1, "alice", "too old", "2026-01-01T09:00:00")
+    store.add_group_message(1, "alice", "/summarize", "2026-01-01T10:06:00")
+    store.add_group_message(1, "alice", "/del", "2026-01-01T10:07:00")
+    store.add_group_message(1, "MyBot", "from the bot", "2026-01-01T10:08:00")
+    store.add_group_message(1, "helper", "other bot", "2026-01-01T10:09:00", is_bot=True)
+    store.add_group_message(2, "carol", "other chat", "2026-01-01T10:10:00")
+
+    rows = list(store.iter_group_messages_since(1, "2026-01-01T09:30:00", bot_username="mybot"))
+    assert [row["text"] for row in rows] == ["first", "second", "/del"]
+    assert rows[0] == {"user": "alice", "text": "first", "timestamp": "2026-01-01T10:00:00"}
+
+
+def test_search_marks_matches(store):
+    store.add_group_message(1, "alice", "the bitcoin halving is close", "2026-01-01T10:00:00")
+    store.add_group_message(1, "bob", "nothing here", "2026-01-01T10:01:00")
+    hits = store.search_group_messages(1, "halving")
+    assert [hit["user"] for hit in hits] == ["alice"]
+    assert db_manager.MATCH_START + "halving" + db_manager.MATCH_END in hits[0]["snippet"]
+
+
+def test_chat_history_keeps_order(store):
+    store.add_chat_history_message(1, "user", "hi", "2026-01-01T10:00:00")
+    store.add_chat_history_message(1, "assistant", "hello", "2026-01-01T10:00:01")
+    assert [(row["role"], row["content"]) for row in store.get_chat_history(1)] == [
+        ("user", "hi"), ("assistant", "hello")
+    ]
+    assert store.get_chat_history(2) == []
+
+
+def test_summary_metadata_upsert_merges(store):
+    assert store.get_summary_metadata(1) == {}
+    store.upsert_summary_metadata(1, {"last_summary_result": "done", "last_summary_message_ids": [3, 4]})
+    store.upsert_summary_metadata(1, {"last_warning_message_ids": [5]})
+    meta = store.get_summary_metadata(1)
+    assert meta["last_summary_result"] == "done"
+    assert meta["last_summary_message_ids"] == [3, 4]
+    assert meta["last_warning_message_ids"] == [5]
+
+
+def test_rate_limits_drop_expired_rows(store):
+    now = time.time()
+    store.save_rate_limits([("summarize", 1, 0, 0.0, now, now + 600), ("search", 1, 0, 0.0, now - 10, now - 1)])
+    assert [row[0] for row in store.load_rate_limits()] == ["summarize"]
+
+
+def test_sentiment_buckets_prune_old(store):
+    store.save_sentiment_buckets([(1, 100, 2, 1, 0, 0.5), (1, 200, 3, 2, 1, 0.25)], older_than=150)
+    assert store.load_sentiment_buckets(1, since=0) == [(200, 3, 2, 1, 0.25)]
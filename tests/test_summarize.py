@@ -0,0 +1,137 @@
+# tests/test_summarize.py
+
+import threading
+import time
+
+import pytest
+
+from services import chunk_processor, summarize
+from services.chunk_processor import DeadlineRetry, run_prompts
+from services.llm_client import LLMResult
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """
+    Fake chunk calls: `replies` maps a prompt to an LLMResult, or to an Event
+    the call waits on (like a request still running at the deadline).
+    """
+    replies = {}
+    calls = []
+
+    def call_openwebui(prompt, session=None, timeout=60, chat_id=None, priority=None, deadline=None):
+        calls.append(prompt)
+        reply = replies.get(prompt, LLMResult.success(f"summary of {prompt[:20]}"))
+        if isinstance(reply, threading.Event):
+            reply.wait(timeout=5)
+            return LLMResult.failure("deadline", "too late")
+        return reply
+
+    monkeypatch.setattr(chunk_processor, "call_openwebui", call_openwebui)
+    return replies, calls
+
+
+def test_retry_stops_when_the_backoff_would_pass_the_deadline():
+    retry = DeadlineRetry(total=3, backoff_factor=1, deadline=time.monotonic() + 0.5).new()
+    assert retry.deadline is not None
+    assert not retry.is_exhausted()
+    retry.get_backoff_time = lambda: 1.0
+    assert retry.is_exhausted()
+    assert not DeadlineRetry(total=3, backoff_factor=1).is_exhausted()
+
+
+def test_retryable_failure_is_tried_once_more(llm):
+    replies, calls = llm
+    replies["flaky"] = LLMResult.failure("timeout", "read timed out")
+    replies["bad"] = LLMResult.failure("http", "HTTP 400")
+
+    assert run_prompts(["flaky", "bad", "fine"]) == [None, None, "summary of fine"]
+    assert calls.count("flaky") == 2
+    assert calls.count("bad") == 1
+
+
+def test_parallel_run_returns_what_finished_by_the_deadline(llm):
+    replies, _ = llm
+    stuck = threading.Event()
+    replies["slow"] = stuck
+    try:
+        started = time.monotonic()
+        results = run_prompts(
+            ["a", "slow", "b"], parallel=True, max_workers=3, deadline=time.monotonic() + 0.3
+        )
+        assert time.monotonic() - started < 2
+        assert results == ["summary of a", None, "summary of b"]
+    finally:
+        stuck.set()
+
+
+def test_sequential_run_sends_nothing_after_the_deadline(llm):
+    _, calls = llm
+    assert run_prompts(["a", "b"], deadline=time.monotonic() - 1) == [None, None]
+    assert calls == []
+
+
+def _chat(count=30):
+    # Distinct messages, long enough to need several chunks.
+    return [
+        {"user": f"user{i % 5}", "text": " ".join(f"w{i}x{j}" for j in range(40)) + " BTC ETF",
+         "timestamp": f"2026-01-01T10:{i:02d}:00"}
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def chat(monkeypatch):
+    monkeypatch.setattr(summarize, "get_last_6h_raw_messages", lambda *args, **kwargs: _chat())
+    merges = []
+
+    def merge(prompt, **kwargs):
+        merges.append(prompt)
+        return LLMResult.success("merged summary")
+
+    monkeypatch.setattr(summarize, "call_openwebui", merge)
+    return merges
+
+
+def test_full_summary_has_no_coverage_note(llm, chat):
+    result = summarize.summarize_categorized(1, deadline=time.monotonic() + 60)
+    assert "merged summary" in result
+    assert "Partial summary" not in result
+    assert len(chat) == 1
+
+
+def test_missing_chunks_give_a_partial_summary_with_a_note(llm, chat, monkeypatch):
+    _, calls = llm
+    chunk_call = chunk_processor.call_openwebui
+    lock = threading.Lock()
+
+    def first_chunk_fails(prompt, *args, **kwargs):
+        with lock:
+            first = not calls
+            if first:
+                calls.append(prompt)
+        if first:
+            return LLMResult.failure("http", "HTTP 400")
+        return chunk_call(prompt, *args, **kwargs)
+
+    monkeypatch.setattr(chunk_processor, "call_openwebui", first_chunk_fails)
+    monkeypatch.setattr(summarize, "call_openwebui", lambda prompt, **kwargs: LLMResult.failure("deadline", "late"))
+    result = summarize.summarize_categorized(1, deadline=time.monotonic() + 60)
+
+    total = len(calls)
+    assert total > 2
+    assert summarize.partial_note(total - 1, total) in result
+    # The merge failed too, so the partial summaries are sent as they are.
+    assert result.count("summary of") == total - 1
+
+
+def test_no_chunk_in_time_falls_back_to_topics(chat, monkeypatch):
+    monkeypatch.setattr(
+        chunk_processor, "call_openwebui", lambda prompt, *args, **kwargs: LLMResult.failure("deadline", "late")
+    )
+    result = summarize.summarize_categorized(1, deadline=time.monotonic() + 60)
+    assert result.startswith(summarize.OUT_OF_TIME)
+    assert "BTC" in result
+    assert chat == []
+    # Without a deadline, the same failure means no summary at all.
+    assert summarize.summarize_categorized(1) is None
@@ -0,0 +1,107 @@
+# tests/test_summary_state.py
+
+import sqlite3
+from collections import OrderedDict
+from datetime import datetime
+
+import pytest
+
+from utils import db_manager, summary_state
+from utils.state_store import MemoryStateStore, get_state_store, set_state_store
+from utils.summary_state import load_summary_state, save_summary_state
+
+
+@pytest.fixture
+def store(monkeypatch):
+    previous = get_state_store()
+    store = MemoryStateStore()
+    set_state_store(store)
+    monkeypatch.setattr(summary_state, "_cache", OrderedDict())
+    yield store
+    set_state_store(previous)
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "bot_data.db")
+    monkeypatch.setattr(db_manager, "DB_PATH", path)
+    db_manager.init_db()
+    return path
+
+
+def test_unknown_chat_loads_empty_state(store):
+    state = load_summary_state(1)
+    assert state.last_summary_time is None
+    assert state.last_summary_message_ids == []
+
+
+def test_save_writes_through_and_leaves_other_fields(store):
+    when = datetime(2026, 1, 1, 12, 0)
+    save_summary_state(1, last_summary_time=when, last_summary_message_ids=[5, 6])
+    save_summary_state(1, last_summary_result="done")
+
+    state = load_summary_state(1)
+    assert state.last_summary_time == when
+    assert state.last_summary_result == "done"
+    assert state.last_summary_message_ids == [5, 6]
+    # Dates are stored as ISO strings, id lists as they are.
+    meta = store.get_summary_metadata(1)
+    assert meta["last_summary_time"] == when.isoformat()
+    assert meta["last_summary_message_ids"] == [5, 6]
+
+
+def test_loaded_state_is_a_copy(store):
+    save_summary_state(1, last_warning_message_ids=[1])
+    state = load_summary_state(1)
+    state.last_warning_message_ids.append(2)
+    assert load_summary_state(1).last_warning_message_ids == [1]
+
+
+def test_unknown_fields_are_rejected(store):
+    with pytest.raises(ValueError):
+        save_summary_state(1, last_summary_colour="blue")
+
+
+def test_upsert_updates_only_the_given_columns(db_path):
+    db_manager.upsert_summary_metadata(1, {
+        "last_summary_time": "2026-01-01T10:00:00", "last_summary_message_ids": [1, 2],
+    })
+    db_manager.upsert_summary_metadata(1, {"last_summary_result": "done", "last_summary_message_ids": []})
+    db_manager.upsert_summary_metadata(1, {})
+
+    conn = sqlite3.connect(db_path)
+    row = conn.execute(
+        "SELECT last_summary_time, last_summary_result, last_summary_message_ids FROM summary_metadata"
+    ).fetchone()
+    conn.close()
+    assert row == ("2026-01-01T10:00:00", "done", "[]")
+
+
+@pytest.mark.parametrize("stored, expected", [
+    ("[3, 4]", [3, 4]),
+    ("3,4", [3, 4]),
+    ("7", [7]),
+    ("3, 4,", [3, 4]),
+    ("", []),
+    (None, []),
+])
+def test_id_lists_decode_json_and_legacy_comma_lists(db_path, stored, expected):
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute(
+            "INSERT INTO summary_metadata (chat_id, last_summary_message_ids) VALUES (?, ?)", ("1", stored)
+        )
+    conn.close()
+    assert db_manager.get_summary_metadata(1)["last_summary_message_ids"] == expected
+
+
+def test_cache_keeps_only_the_most_recently_used_chats(store, monkeypatch):
+    monkeypatch.setattr(summary_state, "CACHE_MAX_CHATS", 2)
+    save_summary_state(1, last_summary_result="one")
+    for chat_id in (1, 2, 1, 3):
+        load_summary_state(chat_id)
+
+    assert list(summary_state._cache) == [1, 3]
+    # An evicted chat is read back from the store.
+    store.upsert_summary_metadata(2, {"last_summary_result": "two"})
+    assert load_summary_state(2).last_summary_result == "two"
@@ -0,0 +1,77 @@
+# tests/test_telegram_utils.py
+
+import random
+import re
+import threading
+
+import pytest
+
+from utils.telegram_utils import split_html_message, utf16_len
+
+_TAG = re.compile(r'<(/?)([A-Za-z][\w-]*)[^<>]*>')
+
+
+def assert_balanced(part):
+    stack = []
+    for m in _TAG.finditer(part):
+        if m.group(1):
+            assert stack and stack[-1] == m.group(2), f"unbalanced: {part!r}"
+            stack.pop()
+        else:
+            stack.append(m.group(2))
+    assert not stack, f"unclosed {stack}: {part!r}"
+
+
+def split_in_time(text, limit, seconds=5):
+    result = []
+    worker = threading.Thread(target=lambda: result.append(split_html_message(text, limit)), daemon=True)
+    worker.start()
+    worker.join(seconds)
+    assert result, f"split_html_message did not finish for limit={limit}: {text[:80]!r}"
+    return result[0]
+
+
+def check_parts(parts, limit):
+    assert parts
+    for part in parts:
+        assert utf16_len(part) <= limit, part
+        assert_balanced(part)
+
+
+def test_reopened_tags_stay_balanced():
+    text = (
+        '<b></b>world world <a href="http://e.com/xx"><a href="http://e.com/xx"></a></a>'
+        '<a href="http://e.com/xx"><b></b><i></i><b></b><b></b>\n ok </a>'
+    )
+    parts = split_in_time(text, 100)
+    check_parts(parts, 100)
+    assert "ok" in "".join(parts)
+
+
+def test_terminates_when_reopened_tags_exceed_limit():
+    link = '<a href="http://example.com/a/long/path">'
+    text = link + "<b>" + link + "word " * 40 + "</a></b></a>"
+    parts = split_in_time(text, 50)
+    check_parts(parts, 50)
+    assert "".join(parts).count("word") == 40
+
+
+def test_long_word_and_surrogates_are_cut_safely():
+    text = "<i>" + "😀" * 300 + "</i>"
+    parts = split_in_time(text, 64)
+    check_parts(parts, 64)
+    assert "".join(p.replace("<i>", "").replace("</i>", "") for p in parts) == "😀" * 300
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_random_html_is_split_balanced_and_terminates(seed):
+    rnd = random.Random(seed)
+    pieces = [
+        "<b>", "</b>", "<i>", "</i>", '<a href="http://e.com/xx">', "</a>",
+        "word", "world", "&amp;", " ", "\n", "\n\n", "x" * 30,
+    ]
+    text = "".join(rnd.choice(pieces) for _ in range(rnd.randint(20, 120)))
+    limit = rnd.choice([20, 50, 100, 200])
+    parts = split_in_time(text, limit)
+    if utf16_len(text) > limit:
+        check_parts(parts, limit)
@@ -0,0 +1,115 @@
+# tests/test_vector_memory.py
+
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from utils.vector_memory import DIM, VectorMemory
+
+
+def text(i, topic="bitcoin halving"):
+    return f"message {i} about the {topic} and what happens next"
+
+
+@pytest.fixture
+def memory(tmp_path):
+    return VectorMemory(directory=str(tmp_path), max_items=50)
+
+
+def test_search_finds_the_related_item(memory):
+    memory.add(1, "the bitcoin halving cuts the block reward in half", "group", "alice")
+    memory.add(1, "lunch today is pizza with extra cheese and olives", "group", "bob")
+    [hit] = memory.search(1, "when is the next bitcoin halving", k=1)
+    assert hit["who"] == "alice"
+
+
+def test_words_outside_ascii_are_indexed(memory):
+    memory.add(1, "завтра обсуждаем халвинг биткоина вечером", "group", "ivan")
+    memory.add(1, "lunch today is pizza with extra cheese and olives", "group", "bob")
+    [hit] = memory.search(1, "халвинг биткоина", k=1)
+    assert hit["who"] == "ivan"
+
+
+def test_add_does_no_io_and_flush_persists(memory, tmp_path):
+    for i in range(10):
+        memory.add(1, text(i), "group", "alice")
+    assert not os.listdir(tmp_path)
+    memory.flush()
+    reloaded = VectorMemory(directory=str(tmp_path), max_items=50)
+    assert len(reloaded.search(1, "bitcoin halving", k=20)) == 10
+
+
+def test_growth_keeps_all_items(memory):
+    for i in range(300):
+        memory.add(2, text(i, topic=f"topic{i} subject{i}"), "group", str(i))
+    [hit] = memory.search(2, "topic123 subject123", k=1)
+    assert hit["who"] == "123"
+
+
+def test_torn_write_is_cut_back_to_aligned_files(memory, tmp_path):
+    for i in range(5):
+        memory.add(1, text(i), "group", str(i))
+    memory.flush()
+    vectors_path, items_path = memory._paths(1)
+    with open(vectors_path, "ab") as f:  # vectors of a batch whose items never made it
+        f.write(np.ones((3, DIM), dtype=np.float16).tobytes())
+    with open(items_path, "a", encoding="utf-8") as f:
+        f.write('{"ts": 1, "source": "gr')
+
+    reloaded = VectorMemory(directory=str(tmp_path), max_items=50)
+    reloaded.add(1, "a completely different note about solana fees", "group", "new")
+    reloaded.flush()
+    assert os.path.getsize(vectors_path) == 6 * DIM * 2
+    with open(items_path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 6
+
+    again = VectorMemory(directory=str(tmp_path), max_items=50)
+    [hit] = again.search(1, "solana fees", k=1)
+    assert hit["who"] == "new"
+
+
+def test_compaction_keeps_the_newest_items(memory, tmp_path):
+    for i in range(70):
+        memory.add(1, text(i, topic=f"topic{i}"), "group", str(i))
+    memory.flush()
+    vectors_path, items_path = memory._paths(1)
+    assert os.path.getsize(vectors_path) == 50 * DIM * 2
+    reloaded = VectorMemory(directory=str(tmp_path), max_items=50)
+    assert reloaded.search(1, "topic69", k=1)[0]["who"] == "69"
+    assert not any(hit["who"] == "5" for hit in reloaded.search(1, "topic5", k=50))
+
+
+def test_stored_index_is_read_by_the_writer_and_merged(memory, tmp_path, monkeypatch):
+    for i in range(5):
+        memory.add(1, text(i), "group", "old")
+    memory.flush()
+
+    restarted = VectorMemory(directory=str(tmp_path), max_items=50)
+    loads = []
+    load = restarted._load
+    monkeypatch.setattr(restarted, "_load", lambda chat_id: loads.append(chat_id) or load(chat_id))
+    restarted.add(1, "a completely different note about solana fees", "group", "new")
+    assert loads == []
+
+    restarted.flush()
+    assert loads == [1]
+    # The stored items come first and nothing is written twice.
+    with open(restarted._paths(1)[1], encoding="utf-8") as f:
+        assert [line.count('"who": "new"') for line in f] == [0] * 5 + [1]
+    assert restarted.search(1, "solana fees", k=1)[0]["who"] == "new"
+    assert len(restarted.search(1, "bitcoin halving", k=20)) == 5
+
+
+def test_search_of_a_cold_chat_reads_its_files(memory, tmp_path):
+    memory.add(3, text(0), "group", "alice")
+    memory.flush()
+    restarted = VectorMemory(directory=str(tmp_path), max_items=50)
+    assert restarted.search(3, "bitcoin halving", k=1)[0]["who"] == "alice"
+
+
+def test_default_directory_is_next_to_the_database(monkeypatch, tmp_path):
+    from utils import db_manager
+    monkeypatch.setattr(db_manager, "DB_PATH", str(tmp_path / "bot_data.db"))
+    assert VectorMemory(directory="").directory == str(tmp_path / "memory_index")
@@ -2,10 +2,20 @@
 
 import sqlite3
 import os
+import json
+import logging
+import re
+import time
+from datetime import datetime, timedelta
 
 # Path to your new SQLite DB inside the container
 DB_PATH = "/apps/tgbot/bot_data.db"  # We'll mount this file via Docker volume
 
+logger = logging.getLogger(__name__)
+
+# Search hits come back with the matched words between these markers.
+MATCH_START, MATCH_END = "\x02", "\x03"
+
 def init_db():
     """
     Create the database file if it doesn't exist, and create tables.
@@ -45,52 +55,234 @@ def init_db():
                 last_summarized_timestamp TEXT
             );
         """)
+
+        # RATE LIMITS (snapshot of live cooldown buckets)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                scope TEXT NOT NULL,
+                chat_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (scope, chat_id, user_id)
+            );
+        """)
+
+        # SENTIMENT BUCKETS (per-chat sentiment time series, see utils/sentiment_series.py)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sentiment_buckets (
+                chat_id TEXT NOT NULL,
+                bucket_start INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                positive INTEGER NOT NULL,
+                negative INTEGER NOT NULL,
+                score_sum REAL NOT NULL,
+                PRIMARY KEY (chat_id, bucket_start)
+            );
+        """)
+
+        _migrate_group_chat_logs(conn)
+        # Serves the window query's WHERE and ORDER BY, so only matching rows are
+        # visited, in timestamp order. Not covering: user and text are still read
+        # from the table, since indexing the text would store every message twice.
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_group_chat_logs_window
+            ON group_chat_logs (chat_id, is_command, is_bot, timestamp, author_norm)
+        """)
+        _create_search_index(conn)
+        # Chat history is read as the newest rows of one chat.
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_chat_histories_chat
+            ON chat_histories (chat_id, id)
+        """)
     conn.close()
 
-def add_group_message(chat_id, user, text, timestamp):
+def _create_search_index(conn):
+    """
+    Full-text index over group_chat_logs: an FTS5 table that reads the text
+    from group_chat_logs itself and is kept in step by triggers. chat_id is
+    indexed too, so a search only walks that chat's matches. Built from the
+    stored rows when first created; skipped (with /find disabled) if this
+    SQLite lacks FTS5.
+    """
+    existed = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'group_chat_logs_fts'"
+    ).fetchone()
+    try:
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS group_chat_logs_fts USING fts5(
+                text,
+                chat_id,
+                content = 'group_chat_logs',
+                content_rowid = 'id',
+                tokenize = 'unicode61 remove_diacritics 2'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        logger.warning(f"No full-text search index (FTS5 unavailable: {e}).")
+        return
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS group_chat_logs_fts_insert AFTER INSERT ON group_chat_logs BEGIN
+            INSERT INTO group_chat_logs_fts (rowid, text, chat_id) VALUES (new.id, new.text, new.chat_id);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS group_chat_logs_fts_delete AFTER DELETE ON group_chat_logs BEGIN
+            INSERT INTO group_chat_logs_fts (group_chat_logs_fts, rowid, text, chat_id)
+            VALUES ('delete', old.id, old.text, old.chat_id);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS group_chat_logs_fts_update AFTER UPDATE OF text, chat_id ON group_chat_logs BEGIN
+            INSERT INTO group_chat_logs_fts (group_chat_logs_fts, rowid, text, chat_id)
+            VALUES ('delete', old.id, old.text, old.chat_id);
+            INSERT INTO group_chat_logs_fts (rowid, text, chat_id) VALUES (new.id, new.text, new.chat_id);
+        END
+    """)
+    if not existed:
+        conn.execute("INSERT INTO group_chat_logs_fts (group_chat_logs_fts) VALUES ('rebuild')")
+
+def _migrate_group_chat_logs(conn):
+    """
+    Adds the ingest-time classification columns to databases created before
+    they existed, and backfills them for the rows already stored.
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(group_chat_logs)")}
+    added = False
+    for name, ddl in (
+        ("is_command", "INTEGER NOT NULL DEFAULT 0"),
+        ("is_bot", "INTEGER NOT NULL DEFAULT 0"),
+        ("author_norm", "TEXT"),
+    ):
+        if name not in columns:
+            conn.execute(f"ALTER TABLE group_chat_logs ADD COLUMN {name} {ddl}")
+            added = True
+    if added:
+        conn.execute("""
+            UPDATE group_chat_logs
+            SET author_norm = lower(user),
+                is_command = (
+                    ltrim(text, ' ' || char(9, 10, 13)) LIKE '/%'
+                    AND lower(trim(text, ' ' || char(9, 10, 13))) != '/del'
+                )
+        """)
+
+def is_command_text(text):
+    """
+    Commands are excluded from summaries, except '/del'.
+    """
+    if not text:
+        return False
+    stripped = text.strip()
+    return stripped.startswith('/') and stripped.lower() != '/del'
+
+def add_group_message(chat_id, user, text, timestamp, is_bot=False):
     conn = sqlite3.connect(DB_PATH)
     with conn:
         conn.execute("""
-            INSERT INTO group_chat_logs (chat_id, user, text, timestamp)
-            VALUES (?, ?, ?, ?)
-        """, (str(chat_id), user, text, timestamp))
+            INSERT INTO group_chat_logs (chat_id, user, text, timestamp, is_command, is_bot, author_norm)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (
+            str(chat_id), user, text, timestamp,
+            int(is_command_text(text)), int(bool(is_bot)), user.lower() if user else None
+        ))
     conn.close()
 
-def get_group_messages_in_last_x_hours(chat_id, hours=6, bot_username=None):
+def iter_group_messages_since(chat_id, since, bot_username=None):
     """
-    Fetch messages from group_chat_logs in the last `hours` hours,
-    exclude bot's own messages and exclude messages starting with '/' 
-    (except '/del' if you want).
+    Yields messages from group_chat_logs at or after `since` (ISO timestamp),
+    oldest first. Bot messages, `bot_username`'s own and commands (except
+    '/del') are filtered out by SQL using the columns set at ingest.
     """
     conn = sqlite3.connect(DB_PATH)
-    cutoff_str = f"-{hours} hours"
     query = """
-        SELECT user, text, timestamp 
+        SELECT user, text, timestamp
         FROM group_chat_logs
         WHERE chat_id = ?
-          AND timestamp >= DATETIME('now', ?)
+          AND is_command = 0
+          AND is_bot = 0
+          AND timestamp >= ?
+          AND (? IS NULL OR author_norm IS NULL OR author_norm != ?)
         ORDER BY timestamp ASC
     """
-    rows = []
-    with conn:
-        rows = conn.execute(query, (str(chat_id), cutoff_str)).fetchall()
-    conn.close()
+    bot = bot_username.lower() if bot_username else None
+    try:
+        for (u, txt, ts) in conn.execute(query, (str(chat_id), since, bot, bot)):
+            yield {
+                "user": u,
+                "text": txt,
+                "timestamp": ts
+            }
+    finally:
+        conn.close()
 
-    filtered = []
-    for (u, txt, ts) in rows:
-        if bot_username and u and u.lower() == bot_username.lower():
-            # Exclude bot messages
-            continue
-        if txt and txt.strip().startswith('/') and txt.strip().lower() != '/del':
-            # Exclude commands except /del
+def get_group_messages_in_last_x_hours(chat_id, hours=6, bot_username=None):
+    """
+    Fetch messages from group_chat_logs in the last `hours` hours,
+    exclude bot's own messages and exclude messages starting with '/'
+    (except '/del').
+    """
+    since = (datetime.now() - timedelta(hours=hours)).isoformat()
+    return list(iter_group_messages_since(chat_id, since, bot_username=bot_username))
+
+def search_terms(query):
+    """
+    Splits a /find query into terms: "quoted phrases" and words, where a
+    trailing '*' matches any word starting with it. Everything else that
+    would be FTS5 syntax is dropped.
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', query or ""):
+        if phrase:
+            words = re.findall(r"\w+", phrase)
+            if words:
+                terms.append(" ".join(words))
             continue
+        prefix = word.endswith("*")
+        words = re.findall(r"\w+", word)
+        if words:
+            terms.append(" ".join(words) + ("*" if prefix else ""))
+    return terms
 
-        filtered.append({
-            "user": u,
-            "text": txt,
-            "timestamp": ts
-        })
-    return filtered
+def _match_expression(chat_id, terms):
+    # The chat's rows whose text has every term; each term is quoted so it is
+    # never read as an operator. (The chat_id token drops the sign, so the
+    # query still checks chat_id itself.)
+    quoted = " ".join(f'"{t.rstrip("*")}"' + ("*" if t.endswith("*") else "") for t in terms)
+    return f'chat_id : "{chat_id}" AND text : ({quoted})'
+
+def search_group_messages(chat_id, query, limit=10):
+    """
+    Best matches for `query` (see search_terms) among the chat's logged
+    messages, ranked by BM25, as {"user", "text", "timestamp", "snippet"}
+    dicts; the snippet marks matches with MATCH_START/MATCH_END. Bot
+    messages and commands are left out, as in the window query.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    conn = sqlite3.connect(DB_PATH)
+    sql = """
+        SELECT g.user, g.text, g.timestamp,
+               snippet(group_chat_logs_fts, 0, ?, ?, '…', 16)
+        FROM group_chat_logs_fts
+        JOIN group_chat_logs AS g ON g.id = group_chat_logs_fts.rowid
+        WHERE group_chat_logs_fts MATCH ?
+          AND g.chat_id = ?
+          AND g.is_command = 0
+          AND g.is_bot = 0
+        ORDER BY bm25(group_chat_logs_fts, 1.0, 0.0)
+        LIMIT ?
+    """
+    try:
+        rows = conn.execute(sql, (MATCH_START, MATCH_END, _match_expression(chat_id, terms), str(chat_id), limit)).fetchall()
+    except sqlite3.OperationalError as e:
+        logger.error(f"Full-text search failed for chat {chat_id}: {e}")
+        rows = []
+    finally:
+        conn.close()
+    return [{"user": u, "text": txt, "timestamp": ts, "snippet": snip} for (u, txt, ts, snip) in rows]
 
 def add_chat_history_message(chat_id, role, content, timestamp):
     conn = sqlite3.connect(DB_PATH)
@@ -101,21 +293,24 @@ def add_chat_history_message(chat_id, role, content, timestamp):
         """, (str(chat_id), role, content, timestamp))
     conn.close()
 
-def get_chat_history(chat_id):
+def get_chat_history(chat_id, limit=None):
     """
-    Returns all messages from chat_histories (ordered by ID).
+    Returns messages from chat_histories (ordered by ID): all of them, or
+    only the newest `limit`, read backwards through the chat's index.
     """
     conn = sqlite3.connect(DB_PATH)
     query = """
         SELECT role, content, timestamp
         FROM chat_histories
         WHERE chat_id = ?
-        ORDER BY id ASC
+        ORDER BY id DESC
+        LIMIT ?
     """
     rows = []
     with conn:
-        rows = conn.execute(query, (str(chat_id),)).fetchall()
+        rows = conn.execute(query, (str(chat_id), limit or -1)).fetchall()
     conn.close()
+    rows.reverse()
 
     result = []
     for (role, content, ts) in rows:
@@ -126,6 +321,49 @@ def get_chat_history(chat_id):
         })
     return result
 
+# Columns of summary_metadata besides chat_id; id lists are stored as JSON arrays.
+SUMMARY_COLUMNS = (
+    "last_summary_time",
+    "last_summary_result",
+    "last_summary_message_ids",
+    "last_warning_message_ids",
+    "last_summarized_timestamp",
+)
+_SUMMARY_ID_COLUMNS = ("last_summary_message_ids", "last_warning_message_ids")
+
+def _decode_ids(value):
+    """
+    Reads an id list column: JSON array, or the older comma-joined format.
+    """
+    if not value:
+        return []
+    if value.startswith('['):
+        return [int(mid) for mid in json.loads(value)]
+    return [int(mid) for mid in value.split(',') if mid.strip()]
+
+def upsert_summary_metadata(chat_id, fields):
+    """
+    Writes the given summary_metadata columns for `chat_id` in one
+    INSERT ... ON CONFLICT DO UPDATE; columns not in `fields` are left as they are.
+    """
+    columns = [name for name in SUMMARY_COLUMNS if name in fields]
+    if not columns:
+        return
+    values = [
+        json.dumps([int(mid) for mid in fields[name]]) if name in _SUMMARY_ID_COLUMNS else fields[name]
+        for name in columns
+    ]
+    query = f"""
+        INSERT INTO summary_metadata (chat_id, {", ".join(columns)})
+        VALUES (?, {", ".join("?" for _ in columns)})
+        ON CONFLICT(chat_id) DO UPDATE SET
+            {", ".join(f"{name} = excluded.{name}" for name in columns)}
+    """
+    conn = sqlite3.connect(DB_PATH)
+    with conn:
+        conn.execute(query, (str(chat_id), *values))
+    conn.close()
+
 def set_summary_metadata(
     chat_id,
     last_summary_time=None,
@@ -134,56 +372,22 @@ def set_summary_metadata(
     last_warning_message_ids=None,
     last_summarized_timestamp=None
 ):
-    conn = sqlite3.connect(DB_PATH)
-    with conn:
-        # Check if row exists
-        existing = conn.execute("""
-            SELECT chat_id FROM summary_metadata WHERE chat_id = ?
-        """, (str(chat_id),)).fetchone()
-
-        if existing:
-            # Update
-            conn.execute("""
-                UPDATE summary_metadata
-                SET last_summary_time = COALESCE(?, last_summary_time),
-                    last_summary_result = COALESCE(?, last_summary_result),
-                    last_summary_message_ids = COALESCE(?, last_summary_message_ids),
-                    last_warning_message_ids = COALESCE(?, last_warning_message_ids),
-                    last_summarized_timestamp = COALESCE(?, last_summarized_timestamp)
-                WHERE chat_id = ?
-            """, (
-                last_summary_time,
-                last_summary_result,
-                ",".join(map(str, last_summary_message_ids)) if last_summary_message_ids else None,
-                ",".join(map(str, last_warning_message_ids)) if last_warning_message_ids else None,
-                last_summarized_timestamp,
-                str(chat_id)
-            ))
-        else:
-            # Insert
-            conn.execute("""
-                INSERT INTO summary_metadata (
-                    chat_id,
-                    last_summary_time,
-                    last_summary_result,
-                    last_summary_message_ids,
-                    last_warning_message_ids,
-                    last_summarized_timestamp
-                )
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (
-                str(chat_id),
-                last_summary_time,
-                last_summary_result,
-                ",".join(map(str, last_summary_message_ids)) if last_summary_message_ids else None,
-                ",".join(map(str, last_warning_message_ids)) if last_warning_message_ids else None,
-                last_summarized_timestamp
-            ))
-    conn.close()
+    """
+    Updates the non-empty fields given; the others keep their stored value.
+    """
+    fields = {
+        "last_summary_time": last_summary_time,
+        "last_summary_result": last_summary_result,
+        "last_summary_message_ids": last_summary_message_ids,
+        "last_warning_message_ids": last_warning_message_ids,
+        "last_summarized_timestamp": last_summarized_timestamp,
+    }
+    upsert_summary_metadata(chat_id, {name: value for name, value in fields.items() if value})
 
 def get_summary_metadata(chat_id):
     """
     Return the summary metadata row as a dict, or {} if none found.
+    Id lists are returned as lists of ints.
     """
     conn = sqlite3.connect(DB_PATH)
     query = """
@@ -206,8 +410,75 @@ def get_summary_metadata(chat_id):
     return {
         "last_summary_time": row[1],
         "last_summary_result": row[2],
-        "last_summary_message_ids": row[3].split(',') if row[3] else [],
-        "last_warning_message_ids": row[4].split(',') if row[4] else [],
+        "last_summary_message_ids": _decode_ids(row[3]),
+        "last_warning_message_ids": _decode_ids(row[4]),
         "last_summarized_timestamp": row[5]
     }
 
+def load_rate_limits():
+    """
+    Returns the rate-limit snapshot as
+    (scope, chat_id, user_id, tokens, updated_at, expires_at) tuples.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    rows = []
+    with conn:
+        rows = conn.execute("""
+            SELECT scope, chat_id, user_id, tokens, updated_at, expires_at
+            FROM rate_limits
+        """).fetchall()
+    conn.close()
+    return rows
+
+def save_rate_limits(rows):
+    """
+    Upserts `rows` (same shape as load_rate_limits) and drops expired entries.
+    Rows written by other bot workers are left alone.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    with conn:
+        conn.executemany("""
+            INSERT INTO rate_limits (scope, chat_id, user_id, tokens, updated_at, expires_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(scope, chat_id, user_id) DO UPDATE SET
+                tokens = excluded.tokens,
+                updated_at = excluded.updated_at,
+                expires_at = excluded.expires_at
+        """, rows)
+        conn.execute("DELETE FROM rate_limits WHERE expires_at <= ?", (time.time(),))
+    conn.close()
+
+def load_sentiment_buckets(chat_id, since):
+    """
+    Returns the chat's sentiment buckets starting at or after `since` (epoch
+    seconds) as (bucket_start, count, positive, negative, score_sum) tuples.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    rows = []
+    with conn:
+        rows = conn.execute("""
+            SELECT bucket_start, count, positive, negative, score_sum
+            FROM sentiment_buckets
+            WHERE chat_id = ? AND bucket_start >= ?
+        """, (str(chat_id), int(since))).fetchall()
+    conn.close()
+    return rows
+
+def save_sentiment_buckets(rows, older_than):
+    """
+    Upserts (chat_id, bucket_start, count, positive, negative, score_sum) rows
+    and drops buckets that started before `older_than` (epoch seconds).
+    """
+    conn = sqlite3.connect(DB_PATH)
+    with conn:
+        conn.executemany("""
+            INSERT INTO sentiment_buckets (chat_id, bucket_start, count, positive, negative, score_sum)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(chat_id, bucket_start) DO UPDATE SET
+                count = excluded.count,
+                positive = excluded.positive,
+                negative = excluded.negative,
+                score_sum = excluded.score_sum
+        """, [(str(row[0]),) + tuple(row[1:]) for row in rows])
+        conn.execute("DELETE FROM sentiment_buckets WHERE bucket_start < ?", (int(older_than),))
+    conn.close()
@@ -1,61 +1,183 @@
 # utils/formatter.py
 
+import html
 import re
 
+# Tags Telegram accepts that we let through; everything else is stripped.
+ALLOWED_TAGS = frozenset({'b', 'strong', 'i', 'em', 'a'})
+
+# --- Precompiled patterns (built once at import) ---
+_TAG = r'<(?P<close>/?)(?P<tag>[A-Za-z][\w-]*)(?P<attrs>(?:\s[^<>]*)?)/?>'
+_STRAY_LT = r'(?P<lt><)'
+_HEADING = r'^#{1,6}[ \t]*(?P<heading>.*)'
+_BOLD = r'\*\*(?P<bold>.*?)\*\*'
+_LINK = r'\[(?P<ltext>.*?)\]\((?P<lurl>.*?)\)'
+
+
+def _tokens(*parts, flags=0):
+    # The leading lookahead lets the regex engine skip plain text quickly
+    # instead of trying every alternative at every position.
+    return re.compile(r'(?=[<*\[#])(?:' + '|'.join(parts) + ')', flags)
+
+
+_MARKDOWN_TOKENS = _tokens(_HEADING, _TAG, _STRAY_LT, _BOLD, _LINK, flags=re.MULTILINE)
+_INLINE_TOKENS = _tokens(_TAG, _STRAY_LT, _BOLD, _LINK)
+_BOLD_TOKENS = _tokens(_TAG, _STRAY_LT, _BOLD)
+_HTML_TOKENS = _tokens(_TAG, _STRAY_LT)
+
+_BOLD_PATTERN = re.compile(r'\*\*(.*?)\*\*')
+_MARKUP_CHARS = re.compile(r'[<*\[#]')
+_BARE_AMP = re.compile(r'&(?!#?\w+;)')
+_ANY_TAG = re.compile(r'<[^<>]*>')
+_BR_TAG = re.compile(r'<br\s*/?>', re.IGNORECASE)
+_SPACES = re.compile(r'[ \t]+')
+_HREF = re.compile(r'''\bhref\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))''', re.IGNORECASE)
+
+
+def _escape_attr(value):
+    return value.replace('<', '&lt;').replace('"', '&quot;')
+
+
+def _render(text, pattern):
+    """
+    Single tokenizing pass over `text` with the precompiled `pattern`.
+    Plain text is copied by re.sub in C; only markup tokens reach Python.
+    Markdown constructs become tags, allowed raw tags are normalized,
+    unsupported tags are dropped (<br> becomes a newline), stray '<' is
+    escaped, and every opened tag is closed so the output is always balanced.
+    Expects bare '&' to be escaped already.
+    """
+    if not _MARKUP_CHARS.search(text):
+        return text
+
+    stack = []  # open raw tags: (name, emitted)
+
+    def token(m):
+        kind = m.lastgroup
+        if kind == 'lt':
+            return '&lt;'
+        if kind == 'heading':
+            return '<b>' + _render(m.group('heading'), _INLINE_TOKENS) + '</b>'
+        if kind == 'bold':
+            inner = _INLINE_TOKENS if pattern is _MARKDOWN_TOKENS else pattern
+            return '<b>' + _render(m.group('bold'), inner) + '</b>'
+        if kind == 'lurl':
+            return (
+                f'<a href="{_escape_attr(m.group("lurl"))}">'
+                + _render(m.group('ltext'), _BOLD_TOKENS)
+                + '</a>'
+            )
+
+        # Raw HTML tag; self-closing forms like <b/> carry no content
+        name = m.group('tag').lower()
+        if name == 'br':
+            return '\n'  # Telegram has no <br>; keep the line break
+        if name not in ALLOWED_TAGS or m.group(0).endswith('/>'):
+            return ''
+        if m.group('close'):
+            # Close the nearest matching open tag (and anything opened inside it)
+            for i in range(len(stack) - 1, -1, -1):
+                if stack[i][0] == name:
+                    closing = ''.join(f'</{n}>' for n, emitted in reversed(stack[i:]) if emitted)
+                    del stack[i:]
+                    return closing
+            return ''
+        if name == 'a':
+            href = _HREF.search(m.group('attrs'))
+            if not href:
+                stack.append((name, False))
+                return ''
+            url = next(g for g in href.groups() if g is not None)
+            stack.append((name, True))
+            return f'<a href="{_escape_attr(url)}">'
+        stack.append((name, True))
+        return f'<{name}>'
+
+    text = pattern.sub(token, text)
+    if stack:
+        text += ''.join(f'</{n}>' for n, emitted in reversed(stack) if emitted)
+    return text
+
+
+def _format(text, pattern):
+    if '&' in text:
+        text = _BARE_AMP.sub('&amp;', text)
+    return _render(text, pattern)
+
+
 def sanitize_html(summary):
     """
     Removes unsupported HTML tags and ensures only allowed tags are present.
     Allowed tags: <b>, <strong>, <i>, <em>, <a href="...">.
+    Stray '<' and '&' are escaped and unclosed tags are closed.
     """
-    # Define allowed tags
-    allowed_tags = ['b', 'strong', 'i', 'em', 'a']
+    return _format(summary, _HTML_TOKENS)
 
-    # Regex pattern to match all HTML tags not in the allowed list
-    pattern = r'</?(?!(' + '|'.join(allowed_tags) + r'))\w+[^>]*>'
 
-    # Remove all tags not in the allowed list
-    sanitized_summary = re.sub(pattern, '', summary, flags=re.IGNORECASE)
-
-    return sanitized_summary
+def html_to_text(text):
+    """
+    Plain text from Telegram-style HTML: tags removed, entities decoded,
+    runs of spaces and blank lines collapsed.
+    """
+    text = html.unescape(_ANY_TAG.sub('', _BR_TAG.sub('\n', text)))
+    lines = (_SPACES.sub(' ', line).strip() for line in text.split('\n'))
+    return '\n'.join(line for line in lines if line)
 
 
 def replace_markdown_bold(summary):
     """
     Replaces Markdown bold syntax **text** with HTML <b>text</b>.
     """
-    return re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', summary)
+    return _BOLD_PATTERN.sub(r'<b>\1</b>', summary)
+
+
+def clean_model_output(content):
+    """
+    Sanitizes raw model output and converts **bold** in the same pass.
+    Used on every OpenWebUI completion instead of sanitize_html + replace_markdown_bold.
+    """
+    if '<' not in content:
+        # No raw tags to police: the only markup is **bold**, which cannot nest.
+        if '&' in content:
+            content = _BARE_AMP.sub('&amp;', content)
+        return _BOLD_PATTERN.sub(r'<b>\1</b>', content)
+    return _format(content, _BOLD_TOKENS)
+
+
+# --- Emoticon classification ---
+# Categories in priority order: the first category with any keyword in the line wins.
+_EMOTICON_CATEGORIES = (
+    ("🚀", ("growth", "launch", "new feature")),
+    ("🔥", ("trend", "buzz", "hot topic")),
+    ("🌱", ("progress", "develop", "update")),
+    ("🤔", ("discuss", "question", "debate")),
+    ("⚠️", ("warn", "critical", "issue")),
+    ("📈", ("success", "positive", "gain")),
+)
+
+
+def classify_line(line_lower):
+    """
+    Returns the emoticon for the highest-priority category found in an
+    already lowercased line, or None.
+    """
+    for emoji, keywords in _EMOTICON_CATEGORIES:
+        for keyword in keywords:
+            if keyword in line_lower:
+                return emoji
+    return None
 
 
 def add_emoticons_to_summary(summary):
     """
     Enhances a plain text summary by adding category-specific emoticons.
     """
-    topic_emojis = {
-        "growth": "🚀",
-        "trending": "🔥",
-        "progress": "🌱",
-        "debate": "🤔",
-        "warning": "⚠️",
-        "positive": "📈",
-    }
-
-    enhanced_summary = ""
-    for line in summary.split("\n"):
-        if any(keyword in line.lower() for keyword in ["growth", "launch", "new feature"]):
-            line = f"{topic_emojis['growth']} {line}"
-        elif any(keyword in line.lower() for keyword in ["trend", "buzz", "hot topic"]):
-            line = f"{topic_emojis['trending']} {line}"
-        elif any(keyword in line.lower() for keyword in ["progress", "develop", "update"]):
-            line = f"{topic_emojis['progress']} {line}"
-        elif any(keyword in line.lower() for keyword in ["discuss", "question", "debate"]):
-            line = f"{topic_emojis['debate']} {line}"
-        elif any(keyword in line.lower() for keyword in ["warn", "critical", "issue"]):
-            line = f"{topic_emojis['warning']} {line}"
-        elif any(keyword in line.lower() for keyword in ["success", "positive", "gain"]):
-            line = f"{topic_emojis['positive']} {line}"
-        enhanced_summary += line + "\n"
-
-    return enhanced_summary.strip()
+    # Lowercase once for the whole summary; lower() never adds or removes newlines.
+    lines = []
+    for line, line_lower in zip(summary.split("\n"), summary.lower().split("\n")):
+        emoji = classify_line(line_lower)
+        lines.append(f"{emoji} {line}" if emoji else line)
+    return "\n".join(lines).strip()
 
 
 def markdown_to_telegram_html(text: str) -> str:
@@ -64,20 +186,6 @@ def markdown_to_telegram_html(text: str) -> str:
       - ### or any heading => <b>heading text</b>
       - **bold** => <b>bold</b>
       - [text](url) => <a href="url">text</a>
-    Then sanitizes to remove any unsupported HTML.
+    Unsupported HTML is removed and tags are balanced in the same pass.
     """
-
-    # Headings (e.g. ### Step 1:) => <b>Step 1:</b>
-    text = re.sub(r'^(#{1,6})\s*(.*)', r'<b>\2</b>', text, flags=re.MULTILINE)
-
-    # Bold: **text** => <b>text</b>
-    text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', text)
-
-    # Links: [text](url) => <a href="url">text</a>
-    text = re.sub(r'\[(.*?)\]\((.*?)\)', r'<a href="\2">\1</a>', text)
-
-    # Finally, sanitize
-    text = sanitize_html(text)
-
-    return text
-
+    return _format(text, _MARKDOWN_TOKENS)
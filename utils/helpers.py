@@ -15,9 +15,7 @@ def is_group_chat(message):
     Returns:
         bool: True if the message is from a group or supergroup chat, False otherwise.
     """
-    chat_type = message.chat.type
-    logger.debug(f"is_group_chat check: chat_type={chat_type}")
-    return chat_type in ["group", "supergroup"]
+    return message.chat.type in ["group", "supergroup"]
 
 def is_trusted_user(bot_instance, chat_id, user_id, attempt=1, max_attempts=3):
     """
@@ -2,19 +2,21 @@
 
 import logging
 import time
-from datetime import datetime
-from config import HISTORY_LENGTH, ROTATION_THRESHOLD_HOURS, SUMMARIZATION_HOURS
-
-# Import your new DB manager functions
-from utils.db_manager import (
-    init_db,
-    add_group_message,
-    get_group_messages_in_last_x_hours,
-    add_chat_history_message,
-    get_chat_history,
-    set_summary_metadata,
-    get_summary_metadata
+from datetime import datetime, timedelta
+from config import (
+    HISTORY_LENGTH,
+    ROTATION_THRESHOLD_HOURS,
+    get_settings,
+    on_settings_change,
 )
+from utils.message_window import MessageWindowCache
+from utils.db_manager import is_command_text
+from utils.sentiment_series import sentiment_series
+from utils.vector_memory import vector_memory
+
+# Storage goes through the configured state backend (SQLite by default).
+from utils.state_store import get_state_store
+from utils.summary_state import load_summary_state, save_summary_state
 
 logger = logging.getLogger(__name__)
 
@@ -24,8 +26,13 @@ _persist_interval = 30  # seconds
 _changes_since_last_persist = 0
 _max_changes_before_persist = 5
 
-# Initialize the database (creates tables if not present)
-init_db()
+# Recent group messages per active chat, so window reads skip SQLite.
+_hot_window = MessageWindowCache(get_settings().max_group_messages, get_settings().hot_window_max_chats)
+
+@on_settings_change
+def _resize_hot_window(old, new):
+    if (old.max_group_messages, old.hot_window_max_chats) != (new.max_group_messages, new.hot_window_max_chats):
+        _hot_window.resize(new.max_group_messages, new.hot_window_max_chats)
 
 def persist_data(force=False):
     """
@@ -46,12 +53,23 @@ def add_to_chat_history(chat_id, role, content, max_length=HISTORY_LENGTH):
     Inserts a new message into the chat_histories table.
     """
     timestamp = datetime.now().isoformat()
-    add_chat_history_message(chat_id, role, content, timestamp)
+    get_state_store().add_chat_history_message(chat_id, role, content, timestamp)
+    vector_memory.add(chat_id, content, "chat", role)
     global _changes_since_last_persist
     _changes_since_last_persist += 1
     persist_data()
     # Note: if you want to limit the number of messages, you can add deletion logic here.
 
+def get_chat_history(chat_id, limit=None):
+    """
+    Returns the stored user/assistant conversation for `chat_id`, oldest
+    first; with `limit`, only its newest rows.
+    """
+    return get_state_store().get_chat_history(chat_id, limit=limit)
+
+def get_summary_metadata(chat_id):
+    return get_state_store().get_summary_metadata(chat_id)
+
 def log_group_message(message):
     """
     Inserts a group message into the group_chat_logs table.
@@ -59,18 +77,45 @@ def log_group_message(message):
     cid = message.chat.id
     user = message.from_user.username or message.from_user.first_name
     text = message.text
-    timestamp = datetime.now().isoformat()
-    add_group_message(cid, user, text, timestamp)
+    now = datetime.now()
+    is_bot = bool(message.from_user.is_bot)
+    get_state_store().add_group_message(cid, user, text, now.isoformat(), is_bot=is_bot)
+    _hot_window.add(cid, user, text, now, is_bot=is_bot)
+    if not is_bot and not is_command_text(text):
+        sentiment_series.add(cid, text)
+        vector_memory.add(cid, text, "group", user)
     global _changes_since_last_persist
     _changes_since_last_persist += 1
     persist_data()
-    logger.debug(f"Logged message in cid={cid}, user={user}, text={text}")
+    logger.debug("Logged group message", extra={"category": "ingest", "chat_id": cid, "chars": len(text or "")})
 
-def get_last_6h_raw_messages(chat_id, bot_username="Chat Summary", hours=SUMMARIZATION_HOURS):
+def find_group_messages(chat_id, query, limit=10):
     """
-    Returns messages from the last X hours from the DB.
+    Logged group messages of `chat_id` best matching `query`, best first
+    (see StateStore.search_group_messages).
     """
-    return get_group_messages_in_last_x_hours(chat_id, hours=hours, bot_username=bot_username)
+    return get_state_store().search_group_messages(chat_id, query, limit=limit)
+
+def get_last_6h_raw_messages(chat_id, bot_username="Chat Summary", hours=None):
+    """
+    Returns messages from the last X hours (default: SUMMARIZATION_HOURS), from
+    the in-memory window when it covers them, otherwise from the DB (which then
+    refills the window).
+    """
+    if hours is None:
+        hours = get_settings().summarization_hours
+    since = datetime.now() - timedelta(hours=hours)
+    messages = _hot_window.get(chat_id, since, bot_username=bot_username)
+    if messages is not None:
+        return messages
+
+    logger.debug(f"Hot window miss for cid={chat_id}; loading last {hours}h from DB.")
+    _hot_window.hydrate(chat_id, since, get_state_store().iter_group_messages_since(chat_id, since.isoformat()))
+    messages = _hot_window.get(chat_id, since, bot_username=bot_username)
+    if messages is not None:
+        return messages
+    # More messages in the window than the buffer holds: read them straight from the DB.
+    return list(get_state_store().iter_group_messages_since(chat_id, since.isoformat(), bot_username=bot_username))
 
 def update_summary_metadata(
     chat_id,
@@ -80,30 +125,27 @@ def update_summary_metadata(
     last_warning_message_ids=None,
     last_summarized_timestamp=None
 ):
-    set_summary_metadata(
-        chat_id,
-        last_summary_time=last_summary_time.isoformat() if last_summary_time else None,
-        last_summary_result=last_summary_result,
-        last_summary_message_ids=last_summary_message_ids,
-        last_warning_message_ids=last_warning_message_ids,
-        last_summarized_timestamp=last_summarized_timestamp.isoformat() if last_summarized_timestamp else None
-    )
+    """
+    Saves the fields given (None/empty ones keep their stored value) with a
+    single upsert, keeping the cached summary state in sync.
+    """
+    changes = {
+        "last_summary_time": last_summary_time,
+        "last_summary_result": last_summary_result,
+        "last_summary_message_ids": last_summary_message_ids,
+        "last_warning_message_ids": last_warning_message_ids,
+        "last_summarized_timestamp": last_summarized_timestamp,
+    }
+    save_summary_state(chat_id, **{name: value for name, value in changes.items() if value})
     global _changes_since_last_persist
     _changes_since_last_persist += 1
     persist_data()
 
 def get_last_summary_message_ids(chat_id):
-    meta = get_summary_metadata(chat_id)
-    return meta.get("last_summary_message_ids", [])
+    return load_summary_state(chat_id).last_summary_message_ids
 
 def get_last_warning_message_ids(chat_id):
-    meta = get_summary_metadata(chat_id)
-    return meta.get("last_warning_message_ids", [])
+    return load_summary_state(chat_id).last_warning_message_ids
 
 def get_last_summarized_timestamp(chat_id):
-    meta = get_summary_metadata(chat_id)
-    ts_str = meta.get("last_summarized_timestamp")
-    if ts_str:
-        return datetime.fromisoformat(ts_str)
-    return None
-
+    return load_summary_state(chat_id).last_summarized_timestamp
@@ -0,0 +1,76 @@
+# utils/kb_matcher.py
+
+import re
+import logging
+
+from config import KB_MAPPINGS
+
+logger = logging.getLogger(__name__)
+
+
+def build_kb_pattern(mappings):
+    """
+    Compiles every keyword in `mappings` into a single case-insensitive
+    alternation regex with word boundaries, inside a lookahead so a scan
+    tries every start position (overlapping keywords are all found).
+    Longer keywords come first, so each position yields its longest keyword;
+    shorter ones inside it come from build_contained().
+    Returns None if there are no keywords.
+    """
+    keywords = sorted({kw.lower() for kw in mappings if kw}, key=len, reverse=True)
+    if not keywords:
+        return None
+    alternation = '|'.join(re.escape(kw) for kw in keywords)
+    return re.compile(r'(?=\b(' + alternation + r')\b)', re.IGNORECASE)
+
+
+def build_contained(mappings):
+    """
+    {keyword: other keywords that occur in it as whole words}, lowercased,
+    e.g. "bitcoin cash" -> ["bitcoin", "cash"] when those are keywords too.
+    """
+    keywords = {kw.lower() for kw in mappings if kw}
+    return {
+        kw: [other for other in keywords if other != kw and re.search(r'\b' + re.escape(other) + r'\b', kw)]
+        for kw in keywords
+    }
+
+
+def _build_index(mappings):
+    # lowercased keyword -> (configured keyword, kb_id)
+    lookup = {kw.lower(): (kw, kb_id) for kw, kb_id in mappings.items() if kw}
+    return lookup, build_kb_pattern(mappings), build_contained(mappings)
+
+
+# Compiled once at import time; rebuild with reload_kb_index() if KB_MAPPINGS changes.
+_kb_lookup, _kb_pattern, _kb_contained = _build_index(KB_MAPPINGS)
+
+
+def reload_kb_index(mappings=None):
+    """
+    Rebuilds the keyword index from `mappings` (defaults to config.KB_MAPPINGS).
+    """
+    global _kb_lookup, _kb_pattern, _kb_contained
+    mappings = KB_MAPPINGS if mappings is None else mappings
+    _kb_lookup, _kb_pattern, _kb_contained = _build_index(mappings)
+    logger.debug(f"KB keyword index rebuilt with {len(_kb_lookup)} keywords.")
+
+
+def match_knowledge_bases(text):
+    """
+    Scans `text` once and returns a dict {keyword: kb_id} of every
+    knowledge base whose keyword appears in it as a whole word, overlapping
+    keywords included (as the per-keyword search did), in order of first
+    appearance. Keys are the keywords as configured in KB_MAPPINGS.
+    """
+    if not text or _kb_pattern is None:
+        return {}
+
+    matched = {}
+    for m in _kb_pattern.finditer(text):
+        found = m.group(1).lower()
+        for kw in (found, *_kb_contained.get(found, ())):
+            entry = _kb_lookup.get(kw)
+            if entry is not None and entry[0] not in matched:
+                matched[entry[0]] = entry[1]
+    return matched
@@ -1,31 +1,189 @@
 # utils/logging_conf.py
 
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
-from config import LOG_LEVEL
+import queue
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from config import LOG_FILE, LOG_FORMAT, LOG_QUEUE_SIZE, get_settings, on_settings_change, parse_log_sampling
+
+# Handlers run on the bot's dispatch threads, so logging there must stay
+# cheap: records are sampled, truncated and put on a bounded queue; a single
+# listener thread formats them and does the console/file I/O. If the writer
+# falls behind, records are dropped (and counted) rather than blocking.
+
+# Attributes every LogRecord has; anything else came in through `extra=`.
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener = None
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fraction of the records per category (the `category` extra, or
+    else the logger name; rules match name prefixes, longest first).
+    WARNING and above are always kept. Sampling is deterministic: a rate of
+    0.1 keeps exactly every tenth record of that category.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self._lock = threading.Lock()
+        self.set_rates(rates or {})
+
+    def set_rates(self, rates):
+        with self._lock:
+            self._rules = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+            self._resolved = {}
+            self._credit = {}
+
+    def _rate(self, category):
+        rate = self._resolved.get(category)
+        if rate is None:
+            rate = 1.0
+            for prefix, value in self._rules:
+                if category == prefix or category.startswith(prefix + "."):
+                    rate = value
+                    break
+            self._resolved[category] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self._rules:
+            return True
+        category = getattr(record, "category", None) or record.name
+        with self._lock:
+            rate = self._rate(category)
+            if rate >= 1:
+                return True
+            credit = self._credit.get(category, 0.0) + rate
+            keep = credit >= 1 - 1e-9  # float sums like 10 * 0.1 fall just short of 1
+            self._credit[category] = credit - 1 if keep else credit
+        return keep
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler that never waits: when the queue is full the record is
+    dropped, and the next record that gets through reports how many were lost.
+    Messages longer than `max_chars` are cut before queueing.
+    """
+
+    def __init__(self, log_queue, max_chars):
+        super().__init__(log_queue)
+        self.max_chars = max_chars
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Render the message now (args may change after the call returns), but
+        # leave formatting and the traceback text to the listener thread.
+        record = logging.makeLogRecord(record.__dict__)
+        message = record.getMessage()
+        if len(message) > self.max_chars:
+            message = f"{message[:self.max_chars]}... [{len(message)} chars]"
+        record.msg, record.args = message, None
+        if self.dropped:
+            record.dropped_before, self.dropped = self.dropped, 0
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Keep the count this record was carrying for the next one.
+            self.dropped += 1 + getattr(record, "dropped_before", 0)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: ts, level, logger, msg, any `extra=` fields
+    (string values cut to `max_chars`) and the traceback as `exc`.
+    """
+
+    def __init__(self, max_chars=1000):
+        super().__init__()
+        self.max_chars = max_chars
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key in _RECORD_FIELDS or key in entry:
+                continue
+            if isinstance(value, str) and len(value) > self.max_chars:
+                value = f"{value[:self.max_chars]}... [{len(value)} chars]"
+            entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
 
 def setup_logging():
+    """
+    Routes the root logger through a sampling, non-blocking queue to a
+    listener thread writing text to the console and JSON lines to LOG_FILE.
+    """
+    global _listener
     logger = logging.getLogger()
-    
+    settings = get_settings()
+    level = getattr(logging, settings.log_level, logging.INFO)
+    logger.setLevel(level)
+
     # Prevent adding multiple handlers if setup_logging is called multiple times
     if not logger.handlers:
+        # Print logs to console
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
         # Create a rotating file handler that rotates at 5 MB and keeps 5 backups.
         rotating_handler = RotatingFileHandler(
-            "bot.log",
+            LOG_FILE,
             maxBytes=5 * 1024 * 1024,
             backupCount=5,
             encoding='utf-8'
         )
-    
-        # Set the level of the rotating handler
-        rotating_handler.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
-    
-        # Create a formatter and set it for the handler
-        formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
-        rotating_handler.setFormatter(formatter)
-    
-        # Add handlers to the logger
-        logger.addHandler(rotating_handler)
-    
+        rotating_handler.setFormatter(JsonFormatter(settings.log_max_chars))
+
+        for handler in (console_handler, rotating_handler):
+            handler.setLevel(level)
+
+        queue_handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE), settings.log_max_chars)
+        queue_handler.addFilter(SamplingFilter(parse_log_sampling(settings.log_sampling)))
+        logger.addHandler(queue_handler)
+
+        _listener = QueueListener(queue_handler.queue, console_handler, rotating_handler, respect_handler_level=True)
+        _listener.start()
+        # Flush what is still queued on a normal exit.
+        atexit.register(_listener.stop)
+
     return logger
 
+
+def _output_handlers():
+    root = logging.getLogger()
+    return list(_listener.handlers) if _listener else list(root.handlers)
+
+
+@on_settings_change
+def _apply_log_level(old, new):
+    root = logging.getLogger()
+    if old.log_level != new.log_level:
+        level = getattr(logging, new.log_level, logging.INFO)
+        root.setLevel(level)
+        for handler in _output_handlers():
+            handler.setLevel(level)
+    for handler in root.handlers:
+        if isinstance(handler, NonBlockingQueueHandler):
+            handler.max_chars = new.log_max_chars
+            for log_filter in handler.filters:
+                if isinstance(log_filter, SamplingFilter) and old.log_sampling != new.log_sampling:
+                    log_filter.set_rates(parse_log_sampling(new.log_sampling))
+    for handler in _output_handlers():
+        if isinstance(handler.formatter, JsonFormatter):
+            handler.formatter.max_chars = new.log_max_chars
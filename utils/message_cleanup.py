@@ -0,0 +1,63 @@
+# utils/message_cleanup.py
+
+import logging
+import threading
+from concurrent.futures import CancelledError
+
+from utils.send_queue import PRIORITY_CLEANUP
+
+logger = logging.getLogger(__name__)
+
+# Running totals of background cleanups, for logs/diagnostics.
+cleanup_stats = {"scheduled": 0, "deleted": 0, "failed": 0}
+_stats_lock = threading.Lock()
+
+
+def message_ids_from(*id_lists):
+    """
+    Merges message id lists (e.g. from a SummaryState) into one deduplicated
+    list of ints, in order.
+    """
+    ids = []
+    seen = set()
+    for id_list in id_lists:
+        for mid in id_list or []:
+            try:
+                mid = int(mid)
+            except (TypeError, ValueError):
+                continue
+            if mid not in seen:
+                seen.add(mid)
+                ids.append(mid)
+    return ids
+
+
+def schedule_cleanup(outbox, chat_id, message_ids, reason, priority=PRIORITY_CLEANUP):
+    """
+    Deletes `message_ids` in `chat_id` with one batched, queued call and
+    returns immediately. The outcome is logged and counted once the delete
+    has run, so the caller's reply is never held up by cleanup.
+    """
+    ids = [mid for mid in message_ids if mid]
+    if not ids:
+        return None
+
+    with _stats_lock:
+        cleanup_stats["scheduled"] += 1
+
+    def _record(future):
+        # exception() raises on a cancelled future instead of returning it.
+        exc = CancelledError() if future.cancelled() else future.exception()
+        with _stats_lock:
+            if exc is None:
+                cleanup_stats["deleted"] += len(ids)
+            else:
+                cleanup_stats["failed"] += len(ids)
+        if exc is None:
+            logger.debug(f"Cleanup ({reason}) in chat {chat_id}: deleted {len(ids)} message(s).")
+        else:
+            logger.warning(f"Cleanup ({reason}) in chat {chat_id} failed for {len(ids)} message(s): {exc!r}")
+
+    future = outbox.delete_messages(chat_id, ids, priority=priority)
+    future.add_done_callback(_record)
+    return future
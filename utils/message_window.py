@@ -0,0 +1,138 @@
+# utils/message_window.py
+
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime
+
+from utils.db_manager import is_command_text
+
+
+class _ChatWindow:
+    """
+    Time-ordered messages for one chat, bounded to `max_messages`.
+    `covered_from` is the earliest epoch time from which the window is known
+    to hold every (non-command) message; older reads must go to SQLite.
+    """
+    __slots__ = ("times", "entries", "authors", "covered_from")
+
+    def __init__(self, covered_from):
+        self.times = []     # epoch seconds, ascending
+        self.entries = []   # {"user", "text", "timestamp"} dicts, same order
+        self.authors = []   # lowercased author, same order
+        self.covered_from = covered_from
+
+
+class MessageWindowCache:
+    """
+    In-memory per-chat ring buffers of recent group messages, fed at ingest
+    and read by bisecting on timestamps. Only the `max_chats` most recently
+    used chats are kept; evicted or unseen chats are rebuilt from SQLite.
+    """
+
+    def __init__(self, max_messages, max_chats):
+        self.max_messages = max_messages
+        self.max_chats = max_chats
+        self._chats = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _touch(self, chat_id):
+        window = self._chats.get(chat_id)
+        if window is not None:
+            self._chats.move_to_end(chat_id)
+        return window
+
+    def _trim(self, window):
+        excess = len(window.times) - self.max_messages
+        if excess > 0:
+            # Everything up to the newest dropped message is no longer covered.
+            window.covered_from = max(window.covered_from, window.times[excess - 1] + 1e-6)
+            del window.times[:excess]
+            del window.entries[:excess]
+            del window.authors[:excess]
+
+    def _insert_chat(self, chat_id, window):
+        self._chats[chat_id] = window
+        self._chats.move_to_end(chat_id)
+        while len(self._chats) > self.max_chats:
+            self._chats.popitem(last=False)
+
+    def resize(self, max_messages, max_chats):
+        """
+        Applies new bounds; shrinking trims/evicts right away.
+        """
+        with self._lock:
+            self.max_messages = max_messages
+            self.max_chats = max_chats
+            for window in self._chats.values():
+                self._trim(window)
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+
+    def add(self, chat_id, user, text, timestamp, is_bot=False):
+        """
+        Records one message. Commands and bot messages are filtered out here,
+        once, at ingest. `timestamp` is a datetime.
+        """
+        if is_bot or is_command_text(text):
+            return
+        ts = timestamp.timestamp()
+        entry = {"user": user, "text": text, "timestamp": timestamp.isoformat()}
+        author = (user or "").lower()
+        with self._lock:
+            window = self._touch(chat_id)
+            if window is None:
+                # First message seen for this chat: complete from this moment on.
+                window = _ChatWindow(covered_from=ts)
+                self._insert_chat(chat_id, window)
+            if window.times and ts < window.times[-1]:
+                idx = bisect_left(window.times, ts)
+            else:
+                idx = len(window.times)
+            window.times.insert(idx, ts)
+            window.entries.insert(idx, entry)
+            window.authors.insert(idx, author)
+            self._trim(window)
+
+    def get(self, chat_id, since, bot_username=None):
+        """
+        Returns the messages at or after `since` (datetime), excluding
+        `bot_username`'s own, or None if the window does not cover `since`.
+        """
+        cutoff = since.timestamp()
+        bot = bot_username.lower() if bot_username else None
+        with self._lock:
+            window = self._touch(chat_id)
+            if window is None or cutoff < window.covered_from:
+                return None
+            start = bisect_left(window.times, cutoff)
+            if bot is None:
+                return window.entries[start:]
+            return [
+                entry for entry, author in zip(window.entries[start:], window.authors[start:])
+                if author != bot
+            ]
+
+    def hydrate(self, chat_id, since, rows):
+        """
+        Rebuilds a chat's window from SQLite rows covering everything since `since`.
+        `rows` come already filtered and oldest first (see iter_group_messages_since),
+        for all authors. Messages ingested while the query ran are kept.
+        """
+        window = _ChatWindow(covered_from=since.timestamp())
+        for row in rows:
+            window.times.append(datetime.fromisoformat(row["timestamp"]).timestamp())
+            window.entries.append({"user": row["user"], "text": row["text"], "timestamp": row["timestamp"]})
+            window.authors.append((row["user"] or "").lower())
+
+        with self._lock:
+            current = self._chats.get(chat_id)
+            if current is not None:
+                newest = window.times[-1] if window.times else window.covered_from
+                for ts, entry, author in zip(current.times, current.entries, current.authors):
+                    if ts > newest:
+                        window.times.append(ts)
+                        window.entries.append(entry)
+                        window.authors.append(author)
+            self._trim(window)
+            self._insert_chat(chat_id, window)
@@ -0,0 +1,260 @@
+# utils/rate_limit.py
+
+import heapq
+import logging
+import threading
+import time
+
+from config import get_settings, on_settings_change
+from utils.state_store import get_state_store
+
+logger = logging.getLogger(__name__)
+
+
+def limits_from_settings(settings):
+    """
+    scope -> (capacity, period in seconds). Capacity 1 is a plain cooldown.
+    """
+    return {
+        "search": (1, settings.search_cooldown_seconds),      # per chat
+        "summarize": (1, settings.cooldown_minutes * 60),     # per chat
+        "sentiment": (1, settings.cooldown_minutes * 60),     # per user
+        "digest": (1, settings.cooldown_minutes * 60),        # per chat
+    }
+
+
+class RateLimiter:
+    """
+    Token-bucket limits keyed by (scope, chat_id, user_id).
+
+    Only buckets that are not yet full again are stored, each as
+    [tokens, updated_at, expires_at]; an expiry heap lets a periodic sweep
+    drop refilled ones, and `max_entries` caps memory by evicting the
+    buckets closest to refilling. Live buckets are snapshotted to the state
+    store on each sweep and restored on first use, so cooldowns survive restarts.
+    Times are wall-clock (time.time()) for that reason.
+
+    Buckets live in this process. With a shared store (several workers),
+    cooldowns (capacity 1) are also reserved in the store, so a per-user
+    scope holds whichever worker owns the chat; larger buckets stay per worker.
+    """
+
+    def __init__(self, limits=None, max_entries=None, sweep_interval=None, persist=True):
+        settings = get_settings()
+        self.limits = dict(limits_from_settings(settings) if limits is None else limits)
+        self.max_entries = settings.rate_limit_max_entries if max_entries is None else max_entries
+        self.sweep_interval = settings.rate_limit_sweep_seconds if sweep_interval is None else sweep_interval
+        self.persist = persist
+        self._entries = {}
+        self._expiry = []   # (expires_at, key); stale items are skipped lazily
+        self._lock = threading.Lock()
+        self._loaded = not persist
+        self._dirty = False
+        self._last_sweep = time.time()
+        # Snapshots are written outside _lock; the sequence number keeps an
+        # older snapshot from overwriting a newer one.
+        self._save_lock = threading.Lock()
+        self._snapshot_seq = 0
+        self._saved_seq = 0
+
+    # --- Public API ---
+
+    def check(self, scope, chat_id=None, user_id=None, consume=True, now=None):
+        """
+        Returns 0 if the action is allowed (taking a token when `consume`),
+        otherwise the seconds to wait before it will be.
+        """
+        capacity, period = self.limits[scope]
+        rate = capacity / period
+        key = (scope, chat_id, user_id)
+        now = time.time() if now is None else now
+        snapshot = None
+        with self._lock:
+            self._maybe_load()
+            entry = self._entries.get(key)
+            if entry is None:
+                tokens = capacity
+            else:
+                tokens = min(capacity, entry[0] + (now - entry[1]) * rate)
+            if tokens < 1:
+                return (1 - tokens) / rate
+            if consume:
+                tokens -= 1
+                expires_at = now + (capacity - tokens) / rate
+                self._entries[key] = [tokens, now, expires_at]
+                heapq.heappush(self._expiry, (expires_at, key))
+                self._dirty = True
+                if len(self._entries) > self.max_entries:
+                    snapshot = self._sweep(now)
+                    self._evict()
+            if now - self._last_sweep >= self.sweep_interval:
+                snapshot = self._sweep(now) or snapshot
+        self._save(snapshot)
+        if consume and capacity == 1:
+            return self._reserve_shared(key, period, now)
+        return 0.0
+
+    def apply_settings(self, settings):
+        """
+        Switches to new limits and bounds. Running cooldowns keep their state;
+        the new periods apply from the next check.
+        """
+        with self._lock:
+            self.limits.update(limits_from_settings(settings))
+            self.max_entries = settings.rate_limit_max_entries
+            self.sweep_interval = settings.rate_limit_sweep_seconds
+            self._evict()
+
+    def refund(self, scope, chat_id=None, user_id=None, now=None):
+        """
+        Gives back a token taken by check(), e.g. when the action it was
+        reserved for failed. Never fills a bucket beyond its capacity.
+        """
+        capacity, period = self.limits[scope]
+        rate = capacity / period
+        key = (scope, chat_id, user_id)
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            tokens = min(capacity, entry[0] + (now - entry[1]) * rate + 1)
+            if tokens >= capacity:
+                del self._entries[key]
+            else:
+                expires_at = now + (capacity - tokens) / rate
+                self._entries[key] = [tokens, now, expires_at]
+                heapq.heappush(self._expiry, (expires_at, key))
+            self._dirty = True
+        if capacity == 1:
+            self._release_shared(key)
+
+    def reset(self, scope, chat_id=None, user_id=None):
+        key = (scope, chat_id, user_id)
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._dirty = True
+        if self.limits.get(scope, (0,))[0] == 1:
+            self._release_shared(key)
+
+    def sweep(self, now=None):
+        with self._lock:
+            snapshot = self._sweep(time.time() if now is None else now)
+        self._save(snapshot)
+
+    def __len__(self):
+        return len(self._entries)
+
+    # --- Internals ---
+
+    def _maybe_load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        now = time.time()
+        try:
+            rows = get_state_store().load_rate_limits()
+        except Exception as e:
+            logger.error(f"Could not restore rate limits: {e}")
+            return
+        for scope, chat_id, user_id, tokens, updated_at, expires_at in rows:
+            if expires_at > now and scope in self.limits:
+                key = (scope, chat_id or None, user_id or None)
+                self._entries[key] = [tokens, updated_at, expires_at]
+                heapq.heappush(self._expiry, (expires_at, key))
+        logger.debug(f"Restored {len(self._entries)} rate-limit entries.")
+
+    def _sweep(self, now):
+        """
+        Drops refilled buckets. Returns a snapshot to pass to _save() once
+        the lock is released, or None if there is nothing to persist.
+        """
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, key = heapq.heappop(self._expiry)
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] == expires_at:
+                del self._entries[key]
+                self._dirty = True
+        if len(self._expiry) > 2 * len(self._entries) + 64:
+            # Too many stale heap items from repeated hits: rebuild.
+            self._expiry = [(entry[2], key) for key, entry in self._entries.items()]
+            heapq.heapify(self._expiry)
+        self._last_sweep = now
+        if self.persist and self._dirty:
+            self._dirty = False
+            self._snapshot_seq += 1
+            # Unused key parts are stored as 0 so they can be part of the primary key.
+            rows = [
+                (scope, chat_id or 0, user_id or 0, entry[0], entry[1], entry[2])
+                for (scope, chat_id, user_id), entry in self._entries.items()
+            ]
+            return self._snapshot_seq, rows
+        return None
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries and self._expiry:
+            expires_at, key = heapq.heappop(self._expiry)
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] == expires_at:
+                del self._entries[key]
+
+    def _save(self, snapshot):
+        if snapshot is None:
+            return
+        seq, rows = snapshot
+        with self._save_lock:
+            if seq <= self._saved_seq:
+                return
+            try:
+                get_state_store().save_rate_limits(rows)
+                self._saved_seq = seq
+            except Exception as e:
+                logger.error(f"Could not snapshot rate limits: {e}")
+                with self._lock:
+                    self._dirty = True
+
+    def _shared_store(self):
+        if not self.persist:
+            return None
+        store = get_state_store()
+        return store if store.shared else None
+
+    @staticmethod
+    def _shared_key(key):
+        scope, chat_id, user_id = key
+        return f"{scope}|{chat_id or 0}|{user_id or 0}"
+
+    def _reserve_shared(self, key, period, now):
+        """
+        Reserves a cooldown just taken locally in the shared store too.
+        If another worker holds it, the local bucket is set to wait as long
+        and that wait is returned; store errors leave the local decision.
+        """
+        store = self._shared_store()
+        if store is None:
+            return 0.0
+        try:
+            wait = store.reserve_cooldown(self._shared_key(key), period)
+        except Exception as e:
+            logger.error(f"Could not reserve shared cooldown {key}: {e}")
+            return 0.0
+        if wait > 0:
+            with self._lock:
+                expires_at = now + wait
+                self._entries[key] = [1 - wait / period, now, expires_at]
+                heapq.heappush(self._expiry, (expires_at, key))
+                self._dirty = True
+        return wait
+
+    def _release_shared(self, key):
+        store = self._shared_store()
+        if store is None:
+            return
+        try:
+            store.release_cooldown(self._shared_key(key))
+        except Exception as e:
+            logger.error(f"Could not release shared cooldown {key}: {e}")
+
+
+rate_limiter = RateLimiter()
+on_settings_change(lambda old, new: rate_limiter.apply_settings(new))
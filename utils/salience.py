@@ -0,0 +1,181 @@
+# utils/salience.py
+
+import logging
+import math
+import random
+import re
+import zlib
+from collections import Counter, defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Reduces a chat window to the messages worth summarizing before any prompt
+# is built: near-duplicates are merged (MinHash over word shingles), runs of
+# short chatter ("gm", "lol", "🚀") collapse into one line, and what is left
+# is ranked by salience and cut to a token budget. Output keeps the input
+# shape ({"user", "text", "timestamp"}) and chronological order.
+
+CHARS_PER_TOKEN = 4          # rough estimate for mixed English/emoji chat text
+CHATTER_MAX_WORDS = 2        # messages this short are chatter unless they carry a ticker, number or link
+DUPLICATE_SIMILARITY = 0.8   # estimated Jaccard similarity at which two messages count as the same
+
+# Words in any script (as in utils/vector_memory.py), and emoji.
+_WORDS = re.compile(r"[\w$@']+|[\U0001F300-\U0001FAFF☀-➿]")
+_SUBSTANCE = re.compile(r"https?://|\d|\$?\b[A-Z]{2,6}\b")
+_MENTION = re.compile(r"@\w+")
+
+# MinHash: NUM_PERM hash functions, split into LSH bands of BAND_ROWS rows.
+NUM_PERM = 16
+BAND_ROWS = 4
+_PRIME = (1 << 61) - 1
+_rng = random.Random(1)
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def estimate_tokens(messages):
+    return sum(len(m["user"] or "") + len(m["text"] or "") + 3 for m in messages) // CHARS_PER_TOKEN
+
+
+def _shingles(words):
+    if len(words) < 3:
+        return set(words)
+    return {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+def minhash(shingles):
+    hashes = [zlib.crc32(s.encode()) for s in shingles] or [0]
+    return tuple(min((a * x + b) % _PRIME for x in hashes) for a, b in _PERMS)
+
+
+def _similarity(sig_a, sig_b):
+    return sum(x == y for x, y in zip(sig_a, sig_b)) / NUM_PERM
+
+
+def _is_chatter(text, words):
+    return len(words) <= CHATTER_MAX_WORDS and not _SUBSTANCE.search(text)
+
+
+def select_salient(messages, token_budget):
+    """
+    Returns the subset of `messages` (oldest first) to summarize, within
+    about `token_budget` tokens. A budget of 0 disables the reduction.
+    """
+    if not token_budget or not messages:
+        return messages
+    before = estimate_tokens(messages)
+
+    # 1) Tokenize; split chatter from content, collapsing chatter runs.
+    items = []          # [position, message, words, duplicates]
+    chatter_run = []
+    collapsed = 0
+
+    def close_run():
+        nonlocal collapsed
+        if not chatter_run:
+            return
+        if len(chatter_run) == 1:
+            position, message, words = chatter_run[0]
+            items.append([position, message, words, 0])
+        else:
+            top = Counter(m["text"].strip().lower() for _, m, _ in chatter_run).most_common(3)
+            summary = ", ".join(f"{text} x{n}" if n > 1 else text for text, n in top)
+            first = chatter_run[0][1]
+            text = f"({len(chatter_run)} short messages: {summary})"
+            items.append([chatter_run[0][0], {"user": "chat", "text": text, "timestamp": first["timestamp"]}, [], 0])
+            collapsed += len(chatter_run) - 1
+        chatter_run.clear()
+
+    for position, message in enumerate(messages):
+        text = (message["text"] or "").strip()
+        if not text:
+            continue
+        words = _WORDS.findall(text.lower())
+        if _is_chatter(text, words):
+            chatter_run.append((position, message, words))
+            continue
+        close_run()
+        items.append([position, message, words, 0])
+    close_run()
+
+    # 2) Near-duplicate merge: exact normalized text first, then MinHash/LSH.
+    kept = []
+    exact = {}
+    bands = defaultdict(list)
+    signatures = {}
+    duplicates = 0
+    for item in items:
+        words = item[2]
+        if not words:
+            kept.append(item)
+            continue
+        key = " ".join(words)
+        original = exact.get(key)
+        if original is None:
+            signature = minhash(_shingles(words))
+            for band in range(0, NUM_PERM, BAND_ROWS):
+                for candidate in bands[(band, signature[band:band + BAND_ROWS])]:
+                    if _similarity(signature, signatures[id(candidate)]) >= DUPLICATE_SIMILARITY:
+                        original = candidate
+                        break
+                if original is not None:
+                    break
+        if original is not None:
+            original[3] += 1
+            duplicates += 1
+            continue
+        exact[key] = item
+        signatures[id(item)] = signature
+        for band in range(0, NUM_PERM, BAND_ROWS):
+            bands[(band, signature[band:band + BAND_ROWS])].append(item)
+        kept.append(item)
+
+    # 3) Salience: length, rare terms, questions/mentions/links (conversation
+    # anchors; replies are not stored), repeats, and quieter authors.
+    document_frequency = Counter()
+    for item in kept:
+        document_frequency.update(set(item[2]))
+    author_counts = Counter(item[1]["user"] for item in kept)
+    total = len(kept)
+
+    def salience(item):
+        position, message, words, repeats = item
+        if not words:
+            return 0.5 + 0.1 * math.log1p(len(message["text"]))  # collapsed chatter line
+        text = message["text"]
+        rarity = sum(math.log(total / document_frequency[w]) for w in set(words)) / (len(set(words)) + 1)
+        score = math.log1p(len(words)) + rarity
+        if "?" in text or _MENTION.search(text) or "http" in text:
+            score += 1.0
+        score += 0.7 * math.log1p(repeats)
+        return score / author_counts[message["user"]] ** 0.25
+
+    ranked = sorted(kept, key=salience, reverse=True)
+
+    # 4) Fill the budget, then restore chronological order.
+    chosen = []
+    used = 0
+    for item in ranked:
+        message = item[1]
+        if item[3]:
+            message = {**message, "text": f"{message['text']} (x{item[3] + 1})"}
+        cost = estimate_tokens([message])
+        if used + cost > token_budget:
+            continue
+        chosen.append((item[0], message))
+        used += cost
+    chosen.sort(key=lambda pair: pair[0])
+    selected = [message for _, message in chosen]
+
+    logger.debug(
+        "Salience selection",
+        extra={
+            "category": "summarize",
+            "messages_in": len(messages),
+            "messages_out": len(selected),
+            "duplicates": duplicates,
+            "chatter_collapsed": collapsed,
+            "tokens_in": before,
+            "tokens_out": used,
+        },
+    )
+    return selected
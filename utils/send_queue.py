@@ -0,0 +1,341 @@
+# utils/send_queue.py
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+from telebot.apihelper import ApiTelegramException
+
+from config import get_settings, on_settings_change
+
+logger = logging.getLogger(__name__)
+
+# Priority classes: lower runs first.
+PRIORITY_ANSWER = 0    # replies to the user's request
+PRIORITY_STATUS = 1    # progress notes, warnings
+PRIORITY_CLEANUP = 2   # deleting old summaries/warnings
+
+# Telegram accepts at most 100 ids per deleteMessages call.
+DELETE_BATCH_SIZE = 100
+MAX_RETRIES = 5
+# Idle per-chat buckets are dropped after this many seconds.
+BUCKET_IDLE_SECONDS = 600
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, holding at most `capacity`.
+    Not thread-safe on its own; the scheduler guards it with its lock.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def configure(self, rate, capacity, now):
+        """
+        Changes rate/capacity, keeping the tokens earned so far.
+        """
+        self._refill(now)
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = min(self.tokens, capacity)
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now):
+        """
+        Seconds until one token is available (0 if available now).
+        """
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, until):
+        """
+        Holds the bucket empty until `until` (monotonic), e.g. after a 429.
+        """
+        self.blocked_until = max(self.blocked_until, until)
+        self.tokens = 0
+
+
+class _Job:
+    __slots__ = ("fn", "args", "kwargs", "chat_id", "priority", "future", "not_before", "attempts", "description")
+
+    def __init__(self, fn, args, kwargs, chat_id, priority, description):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.chat_id = chat_id
+        self.priority = priority
+        self.future = Future()
+        self.not_before = 0.0
+        self.attempts = 0
+        self.description = description
+
+
+def _retry_after(exc):
+    """
+    Returns the retry_after seconds from a Telegram 429 error, or None.
+    """
+    if getattr(exc, "error_code", None) != 429:
+        return None
+    params = (getattr(exc, "result_json", None) or {}).get("parameters") or {}
+    return float(params.get("retry_after", 1))
+
+
+class OutboundScheduler:
+    """
+    Queues outbound Bot API calls and runs them on a few worker threads,
+    highest priority first, under a global and a per-chat token bucket.
+    Calls rejected with 429 are requeued after Telegram's retry_after and
+    the chat (or the whole bot, for global limits) is paused meanwhile.
+    Rates and the worker count follow settings reloads; `rate_share` is this
+    process's fraction of the bot-wide global rate (1/SHARD_COUNT).
+    """
+
+    def __init__(self, bot, rate_share=1.0):
+        settings = get_settings()
+        self.bot = bot
+        self.rate_share = rate_share
+        self.chat_rate = settings.telegram_chat_rate
+        self.chat_burst = settings.telegram_chat_burst
+        self.workers = settings.telegram_send_workers
+        global_rate = settings.telegram_global_rate * rate_share
+        self._global = TokenBucket(global_rate, max(1, int(global_rate)))
+        self._chats = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._last_prune = time.monotonic()
+        on_settings_change(lambda old, new: self.apply_settings(new))
+
+    # --- Public API ---
+
+    def apply_settings(self, settings):
+        """
+        Retunes the buckets and resizes the worker pool. Queued and running
+        calls are kept; surplus workers exit once they are idle.
+        """
+        with self._cond:
+            now = time.monotonic()
+            global_rate = settings.telegram_global_rate * self.rate_share
+            self._global.configure(global_rate, max(1, int(global_rate)), now)
+            self.chat_rate = settings.telegram_chat_rate
+            self.chat_burst = settings.telegram_chat_burst
+            for bucket in self._chats.values():
+                bucket.configure(self.chat_rate, self.chat_burst, now)
+            self.workers = settings.telegram_send_workers
+            if self._threads:
+                self._ensure_workers()
+            self._cond.notify_all()
+
+    def submit(self, fn, *args, chat_id=None, priority=PRIORITY_ANSWER, description=None, **kwargs):
+        """
+        Queues fn(*args, **kwargs) and returns a Future with its result.
+        """
+        job = _Job(fn, args, kwargs, chat_id, priority, description or getattr(fn, "__name__", "call"))
+        with self._cond:
+            self._ensure_workers()
+            heapq.heappush(self._heap, (priority, next(self._seq), job))
+            self._cond.notify()
+        return job.future
+
+    def send_message(self, chat_id, text, priority=PRIORITY_ANSWER, **kwargs):
+        """
+        Drop-in for bot.send_message: queues the send and waits for the Message.
+        """
+        return self.submit(
+            self.bot.send_message, chat_id, text,
+            chat_id=chat_id, priority=priority, description="send_message", **kwargs
+        ).result()
+
+    def send_photo(self, chat_id, photo, priority=PRIORITY_ANSWER, **kwargs):
+        """
+        Drop-in for bot.send_photo: queues the send and waits for the Message.
+        A file-like `photo` is rewound before each attempt, so a send retried
+        after a 429 uploads the whole image again.
+        """
+        def send():
+            if hasattr(photo, "seek"):
+                photo.seek(0)
+            return self.bot.send_photo(chat_id, photo, **kwargs)
+
+        return self.submit(send, chat_id=chat_id, priority=priority, description="send_photo").result()
+
+    def delete_messages(self, chat_id, message_ids, priority=PRIORITY_CLEANUP):
+        """
+        Queues deletion of `message_ids` without waiting. Uses the batched
+        deleteMessages call where the library supports it.
+        Returns a Future resolving to the number of ids submitted.
+        """
+        ids = sorted({int(mid) for mid in message_ids if mid})
+        if not ids:
+            done = Future()
+            done.set_result(0)
+            return done
+        return self.submit(
+            self._delete_batch, chat_id, ids, priority,
+            chat_id=chat_id, priority=priority, description="delete_messages"
+        )
+
+    def queue_depth(self):
+        with self._cond:
+            return len(self._heap)
+
+    # --- Internals ---
+
+    def _delete_batch(self, chat_id, ids, priority):
+        batch_delete = getattr(self.bot, "delete_messages", None)
+        for start in range(0, len(ids), DELETE_BATCH_SIZE):
+            batch = ids[start:start + DELETE_BATCH_SIZE]
+            if batch_delete is not None:
+                try:
+                    batch_delete(chat_id, batch)
+                    continue
+                except ApiTelegramException as exc:
+                    if _retry_after(exc) is not None:
+                        raise
+                    # Nobody waits on cleanup futures, so log and retry one by one.
+                    logger.warning(f"Batch delete failed in chat {chat_id}: {exc}; deleting one by one.")
+            # One queued call per message, so each pays for its own tokens.
+            for mid in batch:
+                self.submit(
+                    self._delete_one, chat_id, mid,
+                    chat_id=chat_id, priority=priority, description="delete_message"
+                )
+        return len(ids)
+
+    def _delete_one(self, chat_id, mid):
+        try:
+            self.bot.delete_message(chat_id, mid)
+        except ApiTelegramException as exc:
+            if _retry_after(exc) is not None:
+                raise
+            if "message to delete not found" in str(exc):
+                logger.debug(f"Message {mid} in chat {chat_id} already deleted.")
+            else:
+                logger.warning(f"Could not delete message_id={mid} in chat {chat_id}: {exc}")
+
+    def _ensure_workers(self):
+        while len(self._threads) < self.workers:
+            index = len(self._threads)
+            t = threading.Thread(target=self._worker, args=(index,), name=f"tg-send-{index}", daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def _chat_bucket(self, chat_id, now):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        if now - self._last_prune > BUCKET_IDLE_SECONDS:
+            self._prune(now)
+        return bucket
+
+    def _prune(self, now):
+        idle = [
+            cid for cid, b in self._chats.items()
+            if now - b.updated > BUCKET_IDLE_SECONDS and now >= b.blocked_until
+        ]
+        for cid in idle:
+            del self._chats[cid]
+        self._last_prune = now
+
+    def _next_job(self, index):
+        """
+        Blocks until a job may run; returns None if worker `index` should exit.
+        """
+        with self._cond:
+            while True:
+                if index >= self.workers:
+                    # The pool shrank: retire the highest-numbered workers.
+                    if index == len(self._threads) - 1:
+                        self._threads.pop()
+                        self._cond.notify_all()
+                        return None
+                    self._cond.wait(timeout=1.0)
+                    continue
+                now = time.monotonic()
+                wait = None
+                deferred = []
+                chosen = None
+                while self._heap:
+                    item = heapq.heappop(self._heap)
+                    job = item[2]
+                    delay = job.not_before - now
+                    if delay <= 0 and job.chat_id is not None:
+                        delay = self._chat_bucket(job.chat_id, now).delay(now)
+                    if delay > 0:
+                        deferred.append(item)
+                        wait = delay if wait is None else min(wait, delay)
+                        continue
+                    delay = self._global.delay(now)
+                    if delay > 0:
+                        # Nothing can go out until the global bucket refills.
+                        deferred.append(item)
+                        wait = delay if wait is None else min(wait, delay)
+                        break
+                    chosen = job
+                    break
+                for item in deferred:
+                    heapq.heappush(self._heap, item)
+                if chosen is not None:
+                    self._global.take(now)
+                    if chosen.chat_id is not None:
+                        self._chat_bucket(chosen.chat_id, now).take(now)
+                    return chosen
+                self._cond.wait(timeout=wait)
+
+    def _worker(self, index):
+        while True:
+            job = self._next_job(index)
+            if job is None:
+                return
+            # Requeued jobs (after a 429) are already marked running.
+            if job.attempts == 0 and not job.future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = job.fn(*job.args, **job.kwargs)
+            except ApiTelegramException as exc:
+                retry_after = _retry_after(exc)
+                if retry_after is not None and job.attempts < MAX_RETRIES:
+                    self._requeue(job, retry_after)
+                    continue
+                job.future.set_exception(exc)
+            except Exception as exc:
+                job.future.set_exception(exc)
+            else:
+                job.future.set_result(result)
+
+    def _requeue(self, job, retry_after):
+        job.attempts += 1
+        logger.warning(
+            f"Telegram flood limit on {job.description} (chat {job.chat_id}); "
+            f"retrying in {retry_after:.0f}s (attempt {job.attempts}/{MAX_RETRIES})."
+        )
+        with self._cond:
+            now = time.monotonic()
+            job.not_before = now + retry_after
+            if job.chat_id is not None:
+                self._chat_bucket(job.chat_id, now).block(job.not_before)
+            else:
+                self._global.block(job.not_before)
+            heapq.heappush(self._heap, (job.priority, next(self._seq), job))
+            self._cond.notify()
@@ -0,0 +1,271 @@
+# utils/sentiment_score.py
+
+import math
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import lru_cache
+
+# Lexicon-based scoring tuned for crypto chat: slang and emoji carry most of
+# the signal, so a word list plus negation/intensifier handling gets the
+# positive/neutral/negative split without a model. Scores are in -1..1.
+
+LEXICON = {
+    # Bullish / positive
+    "moon": 0.8, "mooning": 0.8, "moonshot": 0.7, "bullish": 0.8, "bull": 0.5, "bullrun": 0.8,
+    "pump": 0.5, "pumping": 0.6, "wagmi": 0.7, "lfg": 0.7, "hodl": 0.4, "hodling": 0.4,
+    "ath": 0.6, "breakout": 0.6, "rally": 0.6, "green": 0.4, "gains": 0.6, "gain": 0.5,
+    "profit": 0.5, "profits": 0.5, "diamond": 0.5, "strong": 0.5, "undervalued": 0.5,
+    "accumulate": 0.4, "accumulating": 0.4, "rocket": 0.6, "gem": 0.5, "10x": 0.7, "100x": 0.8,
+    "win": 0.5, "winning": 0.5, "love": 0.5, "great": 0.5, "good": 0.4, "nice": 0.3,
+    "gm": 0.2, "buy": 0.2, "buying": 0.2, "long": 0.2, "upgrade": 0.3, "recovery": 0.5,
+    "bounce": 0.4, "support": 0.2, "adoption": 0.4, "partnership": 0.4, "wen": 0.1,
+    # Bearish / negative
+    "dump": -0.6, "dumping": -0.7, "dumped": -0.6, "bearish": -0.8, "bear": -0.5,
+    "rekt": -0.8, "fud": -0.4, "ngmi": -0.7, "scam": -0.9, "scammer": -0.9, "rug": -0.9,
+    "rugged": -0.9, "rugpull": -0.9, "crash": -0.8, "crashing": -0.8, "red": -0.4,
+    "loss": -0.6, "losses": -0.6, "liquidated": -0.8, "liquidation": -0.6, "capitulation": -0.7,
+    "overheated": -0.4, "overvalued": -0.5, "sell": -0.3, "selling": -0.4, "sold": -0.2,
+    "short": -0.2, "panic": -0.7, "fear": -0.6, "worried": -0.5, "careful": -0.3,
+    "dead": -0.6, "bad": -0.5, "hack": -0.8, "hacked": -0.9, "exploit": -0.7, "ponzi": -0.9,
+    "bagholder": -0.6, "bags": -0.2, "shitcoin": -0.5, "weak": -0.4, "ugly": -0.5,
+    "bleeding": -0.6, "delisted": -0.7, "delay": -0.3, "delayed": -0.3, "risky": -0.3,
+    # Emoji
+    "🚀": 0.8, "🌕": 0.7, "🌙": 0.5, "📈": 0.7, "🔥": 0.5, "💎": 0.5, "🙌": 0.4, "💰": 0.5,
+    "🤑": 0.6, "🟢": 0.5, "✅": 0.3, "🎉": 0.6, "😎": 0.4, "😀": 0.5, "😃": 0.5, "😄": 0.5,
+    "😁": 0.5, "😂": 0.2, "🐂": 0.6, "💪": 0.5, "👍": 0.4,
+    "📉": -0.7, "😭": -0.6, "😱": -0.6, "💀": -0.5, "🤡": -0.5, "🛑": -0.5, "🔴": -0.5,
+    "🩸": -0.6, "⚠": -0.4, "😡": -0.7, "😢": -0.5, "🐻": -0.6, "🐋": -0.1, "👎": -0.4, "😬": -0.3,
+}
+
+NEGATIONS = frozenset({
+    "not", "no", "never", "dont", "don't", "isnt", "isn't", "cant", "can't", "wont", "won't",
+    "aint", "ain't", "without", "nobody", "nothing",
+})
+INTENSIFIERS = {"very": 1.5, "so": 1.3, "super": 1.5, "really": 1.3, "extremely": 1.7, "mega": 1.5, "insanely": 1.7}
+
+# Common words that say nothing about the topic.
+STOPWORDS = frozenset("""
+a an and are as at be been but by can could did do does for from had has have he her here his how i if in
+into is it its just like me more my of on or our out she should so some than that the their them then there
+these they this to too up us was we were what when where which who why will with would you your all any also
+about after again anyone been being both each few get got going gonna im it's i'm i've let lol now one only
+other over own same see still such think today week what's yes yeah anyone someone everyone guys plan next
+""".split())
+
+NEUTRAL_BAND = 0.05  # |score| below this counts as neutral
+
+# Words in any script (accented letters stay inside the word), and emoji.
+_TOKENS = re.compile(r"[\w$']+|[\U0001F300-\U0001FAFF☀-➿]")
+# Same, plus the punctuation that ends a negation's reach.
+_SCORING_TOKENS = re.compile(r"[\w$']+|[\U0001F300-\U0001FAFF☀-➿]|[,.!?;]")
+_WORD_START = re.compile(r"[\w$']")
+_TICKER = re.compile(r"(?<![\w$])\$?([A-Z]{2,6})\b")
+# Negations flip (and soften) the next few word tokens.
+_NEGATION_SPAN = 3
+
+
+@lru_cache(maxsize=20000)
+def score_text(text):
+    """
+    Sentiment of one message in -1..1 (0 = neutral or unknown words).
+    Cached, since chats repeat themselves ("gm", "lfg 🚀").
+    """
+    total = 0.0
+    negate = 0
+    boost = 1.0
+    for token in _SCORING_TOKENS.findall(text.lower()):
+        if token in NEGATIONS:
+            negate = _NEGATION_SPAN
+            continue
+        if token in INTENSIFIERS:
+            boost = INTENSIFIERS[token]
+            continue
+        word = _WORD_START.match(token) is not None
+        if not word and token in ",.!?;":
+            negate = 0
+            continue
+        value = LEXICON.get(token)
+        if value is not None:
+            value *= boost
+            # Negations apply to words only; an emoji states the writer's mood.
+            if negate and word:
+                value *= -0.7
+            total += value
+        boost = 1.0
+        if negate and word:
+            negate -= 1
+    # Squash the sum into -1..1; a single strong word lands around +/-0.6.
+    return total / math.sqrt(total * total + 1)
+
+
+def score_texts(texts):
+    """
+    Scores a batch of messages. Identical texts are scored once per batch,
+    without a cache lookup for every repeat.
+    """
+    scores = {}
+    for text in texts:
+        if text not in scores:
+            scores[text] = score_text(text)
+    return [scores[t] for t in texts]
+
+
+def bucket_start(timestamp, bucket_seconds):
+    """
+    Start of the fixed time bucket holding an ISO `timestamp`, as "YYYY-MM-DDTHH:MM".
+    """
+    epoch = datetime.fromisoformat(timestamp).timestamp()
+    return datetime.fromtimestamp(epoch - epoch % bucket_seconds).isoformat(timespec="minutes")
+
+
+def label_of(score):
+    if score > NEUTRAL_BAND:
+        return "positive"
+    if score < -NEUTRAL_BAND:
+        return "negative"
+    return "neutral"
+
+
+def percentages(counts):
+    """
+    Integer percentages for `counts` that add up to exactly 100 (largest remainder).
+    """
+    total = sum(counts)
+    if not total:
+        return [0] * len(counts)
+    exact = [c * 100 / total for c in counts]
+    result = [int(x) for x in exact]
+    by_remainder = sorted(range(len(counts)), key=lambda i: exact[i] - result[i], reverse=True)
+    for i in by_remainder[:100 - sum(result)]:
+        result[i] += 1
+    return result
+
+
+def overall_label(positive, negative, mean):
+    """
+    Chat-level verdict in the wording /sentiment has always used.
+    """
+    if mean > NEUTRAL_BAND and positive > negative:
+        return "Bullish 🚀"
+    if mean < -NEUTRAL_BAND and negative > positive:
+        return "Bearish 🛑"
+    return "Neutral 🤔"
+
+
+def topic_keywords(texts, limit=8):
+    """
+    Most mentioned tickers (upper-case symbols, $TAGs), then other frequent
+    non-sentiment words, as (keyword, count) pairs.
+    """
+    tickers = Counter()
+    words = Counter()
+    for text in texts:
+        tickers.update(set(_TICKER.findall(text)))
+        words.update({
+            t for t in _TOKENS.findall(text.lower())
+            if len(t) > 3 and t[0].isalpha() and t not in STOPWORDS and t not in LEXICON
+        })
+    keywords = [(t, n) for t, n in tickers.most_common(limit) if n > 1]
+    seen = {t.lower() for t, _ in keywords}
+    keywords += [(w, n) for w, n in words.most_common(limit * 2) if w not in seen and n > 1]
+    return keywords[:limit]
+
+
+@dataclass
+class SentimentAggregate:
+    """
+    Locally computed sentiment of a set of messages.
+    `buckets` are (bucket start, count, mean score), oldest first; `users`
+    are (user, count, mean score), most active first; `examples` maps each
+    label to a few of its strongest messages.
+    """
+    total: int = 0
+    authors: int = 0
+    positive: int = 0
+    neutral: int = 0
+    negative: int = 0
+    mean: float = 0.0
+    users: list = field(default_factory=list)
+    buckets: list = field(default_factory=list)
+    keywords: list = field(default_factory=list)
+    examples: dict = field(default_factory=dict)
+
+    @property
+    def percentages(self):
+        return percentages([self.positive, self.neutral, self.negative])
+
+    @property
+    def label(self):
+        return overall_label(self.positive, self.negative, self.mean)
+
+
+def aggregate_sentiment(messages, bucket_minutes=60, top_users=5, examples=3, example_chars=160):
+    """
+    Scores `messages` ({"user", "text", "timestamp"} dicts, oldest first) and
+    aggregates them overall, per user and per time bucket.
+    """
+    texts = [m["text"] or "" for m in messages]
+    scores = score_texts(texts)
+    agg = SentimentAggregate(total=len(messages))
+    if not messages:
+        return agg
+
+    labels = [label_of(s) for s in scores]
+    counts = Counter(labels)
+    agg.positive, agg.neutral, agg.negative = counts["positive"], counts["neutral"], counts["negative"]
+    agg.mean = sum(scores) / len(scores)
+
+    per_user = defaultdict(list)
+    per_bucket = defaultdict(list)
+    bucket_seconds = bucket_minutes * 60
+    for message, score in zip(messages, scores):
+        per_user[message["user"]].append(score)
+        per_bucket[bucket_start(message["timestamp"], bucket_seconds)].append(score)
+    agg.authors = len(per_user)
+    agg.users = sorted(
+        ((user, len(s), sum(s) / len(s)) for user, s in per_user.items()),
+        key=lambda row: row[1], reverse=True,
+    )[:top_users]
+    agg.buckets = [(key, len(s), sum(s) / len(s)) for key, s in sorted(per_bucket.items())]
+    agg.keywords = topic_keywords(texts)
+
+    for label in ("positive", "negative", "neutral"):
+        ranked = sorted(
+            (i for i, lab in enumerate(labels) if lab == label),
+            key=lambda i: (abs(scores[i]), len(texts[i])), reverse=True,
+        )
+        picked, seen = [], set()
+        for i in ranked:
+            text = texts[i].strip()
+            if text.lower() in seen or text.startswith("/"):
+                continue
+            seen.add(text.lower())
+            picked.append(text[:example_chars])
+            if len(picked) == examples:
+                break
+        agg.examples[label] = picked
+    return agg
+
+
+def format_digest(agg):
+    """
+    Compact text description of an aggregate for the model: numbers, trend,
+    topics and a handful of representative messages instead of the transcript.
+    """
+    pos, neu, neg = agg.percentages
+    lines = [
+        f"Messages: {agg.total} from {agg.authors} users.",
+        f"Local score: {agg.label}, mean {agg.mean:+.2f}; positive {pos}%, neutral {neu}%, negative {neg}%.",
+    ]
+    if len(agg.buckets) > 1:
+        trend = ", ".join(f"{key[11:]}: {mean:+.2f} ({n})" for key, n, mean in agg.buckets[-6:])
+        lines.append(f"Mean score by time (count): {trend}.")
+    if agg.keywords:
+        lines.append("Top topics: " + ", ".join(f"{k} ({n})" for k, n in agg.keywords) + ".")
+    for label in ("positive", "negative", "neutral"):
+        if agg.examples.get(label):
+            lines.append(f"Representative {label} messages:")
+            lines.extend(f"- {text}" for text in agg.examples[label])
+    return "\n".join(lines)
@@ -0,0 +1,222 @@
+# utils/sentiment_series.py
+
+import atexit
+import logging
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+
+from config import SENTIMENT_BUCKET_SECONDS, SENTIMENT_RETENTION_HOURS, SENTIMENT_FLUSH_SECONDS
+from utils.sentiment_score import NEUTRAL_BAND, SentimentAggregate, score_text
+from utils.state_store import get_state_store
+
+logger = logging.getLogger(__name__)
+
+
+class _ChatSeries:
+    """
+    Ring of fixed time buckets for one chat, one slot per bucket of the
+    retention period, held in typed arrays (a few KB per chat). A slot whose
+    stored start differs from the bucket being written is stale and reset.
+    """
+
+    __slots__ = ("starts", "counts", "positive", "negative", "sums", "dirty")
+
+    def __init__(self, slots):
+        self.starts = array("q", [-1]) * slots
+        self.counts = array("l", [0]) * slots
+        self.positive = array("l", [0]) * slots
+        self.negative = array("l", [0]) * slots
+        self.sums = array("d", [0.0]) * slots
+        self.dirty = set()
+
+    def slot(self, start, bucket_seconds):
+        index = (start // bucket_seconds) % len(self.starts)
+        if self.starts[index] != start:
+            self.starts[index] = start
+            self.counts[index] = self.positive[index] = self.negative[index] = 0
+            self.sums[index] = 0.0
+        return index
+
+
+class SentimentSeries:
+    """
+    Per-chat sentiment in fixed time buckets, updated as messages are logged,
+    so /sentiment reads counts and trends without scoring the transcript.
+    Changed buckets are written behind to the state store every
+    `flush_interval` seconds by a background thread started with the first
+    score, so handlers never wait on the store. A chat's stored history is
+    loaded when the chat is first seen, by that thread (or by a read, outside
+    the lock), and merged with what was counted meanwhile, so the series
+    survives restarts. At most `max_chats` loaded chats stay in memory
+    (least recently used ones are dropped after saving).
+    """
+
+    def __init__(self, bucket_seconds=SENTIMENT_BUCKET_SECONDS, retention_hours=SENTIMENT_RETENTION_HOURS,
+                 flush_interval=SENTIMENT_FLUSH_SECONDS, max_chats=1000, persist=True):
+        self.bucket_seconds = bucket_seconds
+        self.retention = retention_hours * 3600
+        self.slots = max(1, self.retention // bucket_seconds)
+        self.flush_interval = flush_interval
+        self.max_chats = max_chats
+        self.persist = persist
+        self._chats = OrderedDict()
+        self._pending = []  # dirty rows of evicted chats, saved with the next flush
+        self._cold = set()  # chats whose stored buckets are not loaded yet
+        self._lock = threading.Lock()
+        # Serializes loads, so a chat is never merged twice; ingest never takes it.
+        self._load_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._writer = None
+
+    # --- Public API ---
+
+    def add(self, chat_id, text, now=None):
+        """
+        Scores `text` and counts it in the bucket for `now`.
+        """
+        self.add_score(chat_id, score_text(text or ""), now)
+
+    def add_score(self, chat_id, score, now=None):
+        now = time.time() if now is None else now
+        start = int(now) - int(now) % self.bucket_seconds
+        with self._lock:
+            series = self._series(chat_id, now)
+            i = series.slot(start, self.bucket_seconds)
+            series.counts[i] += 1
+            series.sums[i] += score
+            if score > NEUTRAL_BAND:
+                series.positive[i] += 1
+            elif score < -NEUTRAL_BAND:
+                series.negative[i] += 1
+            series.dirty.add(i)
+            if self.persist and self._writer is None:
+                self._writer = threading.Thread(target=self._write_behind, name="sentiment-flush", daemon=True)
+                self._writer.start()
+            if chat_id in self._cold:
+                self._wake.set()
+
+    def aggregate(self, chat_id, seconds, now=None):
+        """
+        Totals for the buckets overlapping the last `seconds`, as a
+        SentimentAggregate (counts, mean, per-bucket means oldest first).
+        """
+        now = time.time() if now is None else now
+        since = now - seconds
+        with self._lock:
+            self._series(chat_id, now)
+            cold = chat_id in self._cold
+        if cold:
+            self._load_cold(now, [chat_id])
+        with self._lock:
+            series = self._series(chat_id, now)
+            rows = sorted(
+                (series.starts[i], series.counts[i], series.positive[i], series.negative[i], series.sums[i])
+                for i in range(self.slots)
+                if series.counts[i] and series.starts[i] + self.bucket_seconds > since and series.starts[i] <= now
+            )
+        agg = SentimentAggregate()
+        for start, count, positive, negative, score_sum in rows:
+            agg.total += count
+            agg.positive += positive
+            agg.negative += negative
+            agg.mean += score_sum
+            agg.buckets.append((datetime.fromtimestamp(start).isoformat(timespec="minutes"), count, score_sum / count))
+        agg.neutral = agg.total - agg.positive - agg.negative
+        agg.mean = agg.mean / agg.total if agg.total else 0.0
+        return agg
+
+    def trend(self, chat_id, short_seconds=3600, long_seconds=6 * 3600, now=None):
+        """
+        (short-window aggregate, long-window aggregate), e.g. last hour vs last 6 hours.
+        """
+        return self.aggregate(chat_id, short_seconds, now), self.aggregate(chat_id, long_seconds, now)
+
+    def flush(self, now=None):
+        """
+        Writes changed buckets to the state store and prunes expired ones there.
+        """
+        now = time.time() if now is None else now
+        # Stored history first: a chat's buckets must be merged before its
+        # fresh counts are written over them.
+        self._load_cold(now)
+        with self._lock:
+            rows, self._pending = self._pending, []
+            for chat_id, series in self._chats.items():
+                rows.extend(self._dirty_rows(chat_id, series))
+        if not rows:
+            return
+        try:
+            get_state_store().save_sentiment_buckets(rows, now - self.retention)
+        except Exception as e:
+            logger.error(f"Could not save sentiment buckets: {e}")
+
+    # --- Internals ---
+
+    def _write_behind(self):
+        while True:
+            # Woken early when a chat needs loading.
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def _series(self, chat_id, now):
+        # Caller holds the lock.
+        series = self._chats.get(chat_id)
+        if series is not None:
+            self._chats.move_to_end(chat_id)
+            return series
+        series = self._chats[chat_id] = _ChatSeries(self.slots)
+        if self.persist:
+            self._cold.add(chat_id)
+        while len(self._chats) > self.max_chats:
+            # Chats still waiting for their history stay until it is merged.
+            old_id = next((cid for cid in self._chats if cid not in self._cold), None)
+            if old_id is None:
+                break
+            old = self._chats.pop(old_id)
+            if self.persist:
+                self._pending.extend(self._dirty_rows(old_id, old))
+        return series
+
+    @staticmethod
+    def _dirty_rows(chat_id, series):
+        rows = [
+            (chat_id, series.starts[i], series.counts[i], series.positive[i], series.negative[i], series.sums[i])
+            for i in series.dirty
+        ]
+        series.dirty.clear()
+        return rows
+
+    def _load_cold(self, now, chat_ids=None):
+        """
+        Reads the stored buckets of cold chats (all, or `chat_ids`) without
+        holding the lock, then adds them to the counts taken since.
+        """
+        with self._load_lock:
+            with self._lock:
+                cold = list(self._cold if chat_ids is None else self._cold.intersection(chat_ids))
+            for chat_id in cold:
+                try:
+                    rows = get_state_store().load_sentiment_buckets(chat_id, now - self.retention)
+                except Exception as e:
+                    logger.error(f"Could not load sentiment buckets for chat {chat_id}: {e}")
+                    rows = []
+                with self._lock:
+                    self._cold.discard(chat_id)
+                    series = self._chats.get(chat_id)
+                    if series is None:
+                        continue
+                    for start, count, positive, negative, score_sum in rows:
+                        i = series.slot(int(start), self.bucket_seconds)
+                        series.counts[i] += count
+                        series.positive[i] += positive
+                        series.negative[i] += negative
+                        series.sums[i] += score_sum
+
+
+sentiment_series = SentimentSeries()
+# Save the last few seconds of buckets on a normal shutdown.
+atexit.register(sentiment_series.flush)
@@ -0,0 +1,61 @@
+# utils/settings_watch.py
+
+import logging
+import os
+import signal
+import threading
+import time
+
+from config import DOTENV_PATH, get_settings, reload_settings
+
+logger = logging.getLogger(__name__)
+
+_watcher = None
+
+
+def _reload(reason):
+    logger.info(f"Reloading settings ({reason}).")
+    reload_settings()
+
+
+def _reload_async(reason):
+    # Runs inside the signal handler: logging (the queue handler's lock) and
+    # the listeners take locks the interrupted thread may hold, so only start
+    # the thread here and do everything else on it.
+    threading.Thread(target=_reload, args=(reason,), name="settings-reload", daemon=True).start()
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _watch(path):
+    last = _mtime(path)
+    while True:
+        # Re-read each time so SETTINGS_WATCH_SECONDS itself can be tuned live.
+        interval = get_settings().settings_watch_seconds
+        time.sleep(interval or 5)
+        if not get_settings().settings_watch_seconds:
+            continue
+        current = _mtime(path)
+        if current != last:
+            last = current
+            logger.info(f"{path} changed; reloading settings.")
+            reload_settings()
+
+
+def install_reload_triggers():
+    """
+    Reloads settings on SIGHUP (where available, main thread only) and, when
+    SETTINGS_WATCH_SECONDS > 0, whenever the .env file's mtime changes.
+    """
+    global _watcher
+    if hasattr(signal, "SIGHUP") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGHUP, lambda signum, frame: _reload_async("SIGHUP"))
+
+    if DOTENV_PATH and _watcher is None:
+        _watcher = threading.Thread(target=_watch, args=(DOTENV_PATH,), name="settings-watch", daemon=True)
+        _watcher.start()
@@ -0,0 +1,91 @@
+# utils/sharding.py
+
+import logging
+import threading
+import time
+import zlib
+
+from telebot import apihelper, types
+
+from config import SHARD_COUNT, SHARD_INDEX, SHARD_ROUTER
+from utils.state_store import get_state_store
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows only one getUpdates consumer per bot token, so with several
+# workers one of them (the router) polls and queues each update for the shard
+# that owns its chat. Every chat is handled by exactly one worker, which keeps
+# per-chat in-process state (hot window, summary cache, send buckets) valid.
+
+
+def shard_for(chat_id, shard_count=SHARD_COUNT):
+    """
+    Stable shard number for a chat (same on every worker and across restarts).
+    """
+    return zlib.crc32(str(chat_id).encode()) % shard_count
+
+
+def owns_chat(chat_id):
+    return shard_for(chat_id) == SHARD_INDEX
+
+
+def update_chat_id(update):
+    """
+    Finds the chat id in a raw Telegram update dict, or None (e.g. inline queries).
+    """
+    for key, value in update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat.get("id")
+    return None
+
+
+def route_updates(bot, store, shard_count=SHARD_COUNT, poll_timeout=60):
+    """
+    Router loop: long-polls Telegram and pushes each raw update onto its
+    shard's queue in the shared store. Updates without a chat go to shard 0.
+    """
+    offset = None
+    while True:
+        try:
+            updates = apihelper.get_updates(
+                bot.token, offset=offset, timeout=poll_timeout, long_polling_timeout=poll_timeout
+            )
+            for update in updates:
+                chat_id = update_chat_id(update)
+                shard = shard_for(chat_id, shard_count) if chat_id is not None else 0
+                store.push_update(shard, update)
+                offset = update["update_id"] + 1
+        except Exception as e:
+            logger.error(f"Update routing error: {e}. Retrying in 5 seconds...")
+            time.sleep(5)
+
+
+def consume_updates(bot, store, shard_index=SHARD_INDEX):
+    """
+    Worker loop: handles the updates queued for `shard_index`.
+    """
+    while True:
+        try:
+            raw = store.pop_updates(shard_index, timeout=5)
+            if raw:
+                bot.process_new_updates([types.Update.de_json(u) for u in raw])
+        except Exception as e:
+            logger.error(f"Shard {shard_index} update error: {e}. Retrying in 5 seconds...")
+            time.sleep(5)
+
+
+def run_sharded(bot):
+    """
+    Runs this process as worker SHARD_INDEX of SHARD_COUNT, plus the router
+    if SHARD_ROUTER is set. Needs a shared state backend.
+    """
+    store = get_state_store()
+    if not store.shared:
+        raise RuntimeError("SHARD_COUNT > 1 needs a shared state backend (STATE_BACKEND=redis).")
+    if SHARD_ROUTER:
+        threading.Thread(target=route_updates, args=(bot, store), name="update-router", daemon=True).start()
+    logger.info(f"Worker for shard {SHARD_INDEX}/{SHARD_COUNT} started (router={SHARD_ROUTER}).")
+    consume_updates(bot, store)
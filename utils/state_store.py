@@ -0,0 +1,497 @@
+# utils/state_store.py
+
+import json
+import logging
+import queue
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+from config import STATE_BACKEND, REDIS_URL
+from utils import db_manager
+from utils.db_manager import SUMMARY_COLUMNS, MATCH_START, MATCH_END, is_command_text, search_terms
+
+logger = logging.getLogger(__name__)
+
+
+class StateStore(ABC):
+    """
+    Storage interface for everything the bot persists. The SQLite store is
+    the default; the Redis store lets several bot workers share state; the
+    memory store is an in-process stand-in for local runs and tests.
+
+    Message/history rows are dicts shaped like the SQLite results:
+    {"user", "text", "timestamp"} and {"role", "content", "timestamp"}
+    (chat history oldest first; with a `limit`, only the newest rows);
+    search hits add a "snippet" with the matches marked.
+    Rate-limit rows are (scope, chat_id, user_id, tokens, updated_at, expires_at).
+    Sentiment buckets are saved as (chat_id, bucket_start, count, positive,
+    negative, score_sum) and loaded per chat without the chat_id.
+    `shared` stores can be used by several worker processes (SHARD_COUNT > 1).
+    """
+
+    shared = False
+
+    def init(self):
+        pass
+
+    @abstractmethod
+    def add_group_message(self, chat_id, user, text, timestamp, is_bot=False):
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_group_messages_since(self, chat_id, since, bot_username=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def search_group_messages(self, chat_id, query, limit=10):
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_chat_history_message(self, chat_id, role, content, timestamp):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_chat_history(self, chat_id, limit=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_summary_metadata(self, chat_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def upsert_summary_metadata(self, chat_id, fields):
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_rate_limits(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_rate_limits(self, rows):
+        raise NotImplementedError
+
+    # Cooldowns shared between workers (see utils/rate_limit.py). Only
+    # `shared` stores are asked; a single worker's own limiter is enough otherwise.
+
+    def reserve_cooldown(self, key, seconds):
+        """
+        Starts a `seconds` cooldown on `key` unless one is running.
+        Returns 0 if it was started, else the seconds left on the running one.
+        """
+        return 0.0
+
+    def release_cooldown(self, key):
+        pass
+
+    @abstractmethod
+    def load_sentiment_buckets(self, chat_id, since):
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_sentiment_buckets(self, rows, older_than):
+        raise NotImplementedError
+
+    # Work distribution between shards (see utils/sharding.py).
+
+    @abstractmethod
+    def push_update(self, shard, update):
+        raise NotImplementedError
+
+    @abstractmethod
+    def pop_updates(self, shard, timeout=1.0, limit=100):
+        raise NotImplementedError
+
+
+class SQLiteStateStore(StateStore):
+    """
+    The local SQLite file (utils/db_manager.py). Single host only; it has no
+    update queue, so it cannot be used with SHARD_COUNT > 1.
+    """
+
+    def init(self):
+        db_manager.init_db()
+
+    def add_group_message(self, chat_id, user, text, timestamp, is_bot=False):
+        db_manager.add_group_message(chat_id, user, text, timestamp, is_bot=is_bot)
+
+    def iter_group_messages_since(self, chat_id, since, bot_username=None):
+        return db_manager.iter_group_messages_since(chat_id, since, bot_username=bot_username)
+
+    def search_group_messages(self, chat_id, query, limit=10):
+        return db_manager.search_group_messages(chat_id, query, limit=limit)
+
+    def add_chat_history_message(self, chat_id, role, content, timestamp):
+        db_manager.add_chat_history_message(chat_id, role, content, timestamp)
+
+    def get_chat_history(self, chat_id, limit=None):
+        return db_manager.get_chat_history(chat_id, limit=limit)
+
+    def get_summary_metadata(self, chat_id):
+        return db_manager.get_summary_metadata(chat_id)
+
+    def upsert_summary_metadata(self, chat_id, fields):
+        db_manager.upsert_summary_metadata(chat_id, fields)
+
+    def load_rate_limits(self):
+        return db_manager.load_rate_limits()
+
+    def save_rate_limits(self, rows):
+        db_manager.save_rate_limits(rows)
+
+    def load_sentiment_buckets(self, chat_id, since):
+        return db_manager.load_sentiment_buckets(chat_id, since)
+
+    def save_sentiment_buckets(self, rows, older_than):
+        db_manager.save_sentiment_buckets(rows, older_than)
+
+    def push_update(self, shard, update):
+        raise RuntimeError("The SQLite state backend cannot distribute updates; use STATE_BACKEND=redis.")
+
+    pop_updates = push_update
+
+
+def _filter_messages(rows, since, bot_username):
+    """
+    Applies the window query's filters to stored message dicts (which carry
+    the ingest-time is_command/is_bot/author_norm flags).
+    """
+    bot = bot_username.lower() if bot_username else None
+    for row in rows:
+        if row["is_command"] or row["is_bot"] or row["timestamp"] < since:
+            continue
+        if bot and row["author_norm"] == bot:
+            continue
+        yield {"user": row["user"], "text": row["text"], "timestamp": row["timestamp"]}
+
+
+def _search_records(rows, query, limit):
+    """
+    search_group_messages for stores without a full-text index: scans the
+    records, keeps those containing every term and ranks them by how often
+    the terms occur (newest first on ties).
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    patterns = [
+        re.compile(r"\b" + re.escape(t.rstrip("*").lower()) + ("" if t.endswith("*") else r"\b"))
+        for t in terms
+    ]
+    hits = []
+    for row in rows:
+        if row["is_command"] or row["is_bot"] or not row["text"]:
+            continue
+        words = " ".join(re.findall(r"\w+", row["text"].lower()))
+        counts = [len(p.findall(words)) for p in patterns]
+        if all(counts):
+            hits.append((sum(counts), row["timestamp"], row))
+    hits.sort(key=lambda hit: hit[:2], reverse=True)
+    words = [(w, t.endswith("*")) for t in terms for w in t.rstrip("*").split()]
+    marked = re.compile(
+        "|".join(r"\b" + re.escape(w) + (r"\w*" if prefix else r"\b") for w, prefix in words), re.IGNORECASE
+    )
+    return [
+        {
+            "user": row["user"],
+            "text": row["text"],
+            "timestamp": row["timestamp"],
+            "snippet": marked.sub(lambda m: f"{MATCH_START}{m.group(0)}{MATCH_END}", row["text"][:300]),
+        }
+        for _, _, row in hits[:limit]
+    ]
+
+
+def _message_record(user, text, timestamp, is_bot):
+    return {
+        "user": user,
+        "text": text,
+        "timestamp": timestamp,
+        "is_command": is_command_text(text),
+        "is_bot": bool(is_bot),
+        "author_norm": user.lower() if user else None,
+    }
+
+
+def _merge_summary(meta, fields):
+    for name in SUMMARY_COLUMNS:
+        if name in fields:
+            value = fields[name]
+            meta[name] = [int(mid) for mid in value] if name.endswith("_message_ids") else value
+    return meta
+
+
+class MemoryStateStore(StateStore):
+    """
+    Keeps everything in process memory. Nothing survives a restart and
+    other processes cannot see it; meant as a stand-in for local runs and
+    tests, so it cannot be used with SHARD_COUNT > 1 either.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._messages = {}
+        self._history = {}
+        self._summaries = {}
+        self._rate_limits = {}
+        self._sentiment = {}
+        self._queues = {}
+
+    def add_group_message(self, chat_id, user, text, timestamp, is_bot=False):
+        with self._lock:
+            self._messages.setdefault(str(chat_id), []).append(_message_record(user, text, timestamp, is_bot))
+
+    def iter_group_messages_since(self, chat_id, since, bot_username=None):
+        with self._lock:
+            rows = sorted(self._messages.get(str(chat_id), []), key=lambda row: row["timestamp"])
+        return _filter_messages(rows, since, bot_username)
+
+    def search_group_messages(self, chat_id, query, limit=10):
+        with self._lock:
+            rows = list(self._messages.get(str(chat_id), []))
+        return _search_records(rows, query, limit)
+
+    def add_chat_history_message(self, chat_id, role, content, timestamp):
+        with self._lock:
+            self._history.setdefault(str(chat_id), []).append(
+                {"role": role, "content": content, "timestamp": timestamp}
+            )
+
+    def get_chat_history(self, chat_id, limit=None):
+        with self._lock:
+            rows = self._history.get(str(chat_id), [])
+            return [dict(row) for row in (rows[-limit:] if limit else rows)]
+
+    def get_summary_metadata(self, chat_id):
+        with self._lock:
+            meta = self._summaries.get(str(chat_id))
+            return json.loads(json.dumps(meta)) if meta else {}
+
+    def upsert_summary_metadata(self, chat_id, fields):
+        with self._lock:
+            _merge_summary(self._summaries.setdefault(str(chat_id), {}), fields)
+
+    def load_rate_limits(self):
+        with self._lock:
+            return list(self._rate_limits.values())
+
+    def save_rate_limits(self, rows):
+        now = time.time()
+        with self._lock:
+            for row in rows:
+                self._rate_limits[row[:3]] = tuple(row)
+            for key in [k for k, row in self._rate_limits.items() if row[5] <= now]:
+                del self._rate_limits[key]
+
+    def load_sentiment_buckets(self, chat_id, since):
+        with self._lock:
+            buckets = self._sentiment.get(str(chat_id), {})
+            return [row for start, row in buckets.items() if start >= since]
+
+    def save_sentiment_buckets(self, rows, older_than):
+        with self._lock:
+            for chat_id, *row in rows:
+                self._sentiment.setdefault(str(chat_id), {})[row[0]] = tuple(row)
+            for buckets in self._sentiment.values():
+                for start in [start for start in buckets if start < older_than]:
+                    del buckets[start]
+
+    def _queue(self, shard):
+        with self._lock:
+            return self._queues.setdefault(shard, queue.Queue())
+
+    def push_update(self, shard, update):
+        self._queue(shard).put(update)
+
+    def pop_updates(self, shard, timeout=1.0, limit=100):
+        q = self._queue(shard)
+        try:
+            updates = [q.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(updates) < limit:
+            try:
+                updates.append(q.get_nowait())
+            except queue.Empty:
+                break
+        return updates
+
+
+class RedisStateStore(StateStore):
+    """
+    Shares state between bot workers through Redis (or any server speaking
+    its protocol). Needs the optional `redis` package.
+
+    Layout, all under the `tgbot:` prefix:
+      msgs:<chat>      sorted set of message records, scored by epoch time
+      history:<chat>   list of chat-history entries
+      summary:<chat>   hash of summary_metadata columns (id lists as JSON)
+      rate_limits      hash of rate-limit rows keyed by scope/chat/user
+      cooldown:<key>   one key per running cooldown, expiring with it
+      sentiment:<chat> hash of sentiment buckets keyed by bucket start
+      updates:<shard>  list of raw Telegram updates for that shard
+
+    Sharding pops updates with BLMPOP, which needs Redis 7 or later.
+    """
+
+    shared = True
+    PREFIX = "tgbot:"
+    SEARCH_SCAN_LIMIT = 50000
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("STATE_BACKEND=redis needs the 'redis' package (pip install redis).") from e
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+
+    def _key(self, *parts):
+        return self.PREFIX + ":".join(str(p) for p in parts)
+
+    def init(self):
+        self._redis.ping()
+
+    def add_group_message(self, chat_id, user, text, timestamp, is_bot=False):
+        record = _message_record(user, text, timestamp, is_bot)
+        score = datetime.fromisoformat(timestamp).timestamp()
+        self._redis.zadd(self._key("msgs", chat_id), {json.dumps(record): score})
+
+    def iter_group_messages_since(self, chat_id, since, bot_username=None):
+        low = datetime.fromisoformat(since).timestamp()
+        members = self._redis.zrangebyscore(self._key("msgs", chat_id), low, "+inf")
+        return _filter_messages((json.loads(m) for m in members), since, bot_username)
+
+    def search_group_messages(self, chat_id, query, limit=10):
+        # No full-text index here: scan the newest SEARCH_SCAN_LIMIT messages.
+        members = self._redis.zrevrange(self._key("msgs", chat_id), 0, self.SEARCH_SCAN_LIMIT - 1)
+        return _search_records((json.loads(m) for m in members), query, limit)
+
+    def add_chat_history_message(self, chat_id, role, content, timestamp):
+        entry = {"role": role, "content": content, "timestamp": timestamp}
+        self._redis.rpush(self._key("history", chat_id), json.dumps(entry))
+
+    def get_chat_history(self, chat_id, limit=None):
+        start = -limit if limit else 0
+        return [json.loads(e) for e in self._redis.lrange(self._key("history", chat_id), start, -1)]
+
+    def get_summary_metadata(self, chat_id):
+        raw = self._redis.hgetall(self._key("summary", chat_id))
+        if not raw:
+            return {}
+        return {
+            name: json.loads(raw[name]) if name.endswith("_message_ids") else raw[name]
+            for name in SUMMARY_COLUMNS if name in raw
+        }
+
+    def upsert_summary_metadata(self, chat_id, fields):
+        mapping = {}
+        for name, value in _merge_summary({}, fields).items():
+            if value is None:
+                continue
+            mapping[name] = json.dumps(value) if name.endswith("_message_ids") else value
+        deleted = [name for name in SUMMARY_COLUMNS if name in fields and fields[name] is None]
+        pipe = self._redis.pipeline()
+        if mapping:
+            pipe.hset(self._key("summary", chat_id), mapping=mapping)
+        if deleted:
+            pipe.hdel(self._key("summary", chat_id), *deleted)
+        pipe.execute()
+
+    def load_rate_limits(self):
+        return [tuple(json.loads(v)) for v in self._redis.hvals(self._key("rate_limits"))]
+
+    def save_rate_limits(self, rows):
+        key = self._key("rate_limits")
+        now = time.time()
+        pipe = self._redis.pipeline()
+        if rows:
+            pipe.hset(key, mapping={"|".join(map(str, row[:3])): json.dumps(list(row)) for row in rows})
+        pipe.hgetall(key)
+        stored = pipe.execute()[-1]
+        expired = [field for field, value in stored.items() if json.loads(value)[5] <= now]
+        if expired:
+            self._redis.hdel(key, *expired)
+
+    def reserve_cooldown(self, key, seconds):
+        # SET NX PX starts the cooldown only if no worker holds it already.
+        name = self._key("cooldown", key)
+        if self._redis.set(name, 1, nx=True, px=max(1, int(seconds * 1000))):
+            return 0.0
+        left = self._redis.pttl(name)
+        # A negative TTL means the key expired in between: nothing to wait for.
+        return max(left, 0) / 1000
+
+    def release_cooldown(self, key):
+        self._redis.delete(self._key("cooldown", key))
+
+    def load_sentiment_buckets(self, chat_id, since):
+        raw = self._redis.hgetall(self._key("sentiment", chat_id))
+        return [tuple(json.loads(v)) for field, v in raw.items() if int(field) >= since]
+
+    def save_sentiment_buckets(self, rows, older_than):
+        by_chat = {}
+        for chat_id, *row in rows:
+            by_chat.setdefault(chat_id, {})[str(row[0])] = json.dumps(row)
+        pipe = self._redis.pipeline()
+        for chat_id, mapping in by_chat.items():
+            pipe.hset(self._key("sentiment", chat_id), mapping=mapping)
+            pipe.hkeys(self._key("sentiment", chat_id))
+        results = pipe.execute()
+        # Prune old buckets of the chats just written (each chat is written every few minutes while active).
+        pipe = self._redis.pipeline()
+        for chat_id, fields in zip(by_chat, results[1::2]):
+            old = [field for field in fields if int(field) < older_than]
+            if old:
+                pipe.hdel(self._key("sentiment", chat_id), *old)
+        pipe.execute()
+
+    def push_update(self, shard, update):
+        self._redis.rpush(self._key("updates", shard), json.dumps(update))
+
+    def pop_updates(self, shard, timeout=1.0, limit=100):
+        # One BLMPOP waits for the first update and takes up to `limit` at once,
+        # so two consumers of a shard can never split or reorder a batch.
+        popped = self._redis.blmpop(max(1, int(timeout)), 1, self._key("updates", shard), direction="LEFT", count=limit)
+        if not popped:
+            return []
+        return [json.loads(u) for u in popped[1]]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def create_state_store(backend=STATE_BACKEND):
+    if backend == "sqlite":
+        return SQLiteStateStore()
+    if backend == "memory":
+        return MemoryStateStore()
+    if backend == "redis":
+        return RedisStateStore(REDIS_URL)
+    raise ValueError(f"Unknown STATE_BACKEND '{backend}' (expected sqlite, redis or memory).")
+
+
+def get_state_store():
+    """
+    Returns the process-wide store for the configured STATE_BACKEND.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = create_state_store()
+                store.init()
+                logger.info(f"State backend: {type(store).__name__}")
+                _store = store
+    return _store
+
+
+def set_state_store(store):
+    """
+    Replaces the process-wide store (e.g. with a MemoryStateStore in tests).
+    """
+    global _store
+    with _store_lock:
+        _store = store
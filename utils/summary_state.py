@@ -0,0 +1,86 @@
+# utils/summary_state.py
+
+import copy
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+
+from utils.state_store import get_state_store
+
+
+@dataclass
+class SummaryState:
+    """
+    Per-chat /summarize bookkeeping (one summary_metadata row).
+    """
+    chat_id: int
+    last_summary_time: Optional[datetime] = None
+    last_summary_result: Optional[str] = None
+    last_summary_message_ids: List[int] = field(default_factory=list)
+    last_warning_message_ids: List[int] = field(default_factory=list)
+    last_summarized_timestamp: Optional[datetime] = None
+
+
+# Write-through cache: every save goes to the state store first, then here.
+# With several workers each chat is owned by one of them (utils/sharding.py),
+# so a chat's cached state is only ever written by its owner.
+# The least recently used chats are dropped past CACHE_MAX_CHATS; the store
+# still has them, so they are just read again on next use.
+CACHE_MAX_CHATS = 4096
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def load_summary_state(chat_id):
+    """
+    Returns a copy of the chat's summary state, reading the store only the
+    first time the chat is seen by this process.
+    """
+    with _cache_lock:
+        state = _cache.get(chat_id)
+        if state is not None:
+            _cache.move_to_end(chat_id)
+        else:
+            meta = get_state_store().get_summary_metadata(chat_id)
+            state = _cache[chat_id] = SummaryState(
+                chat_id=chat_id,
+                last_summary_time=_parse_time(meta.get("last_summary_time")),
+                last_summary_result=meta.get("last_summary_result"),
+                last_summary_message_ids=meta.get("last_summary_message_ids", []),
+                last_warning_message_ids=meta.get("last_warning_message_ids", []),
+                last_summarized_timestamp=_parse_time(meta.get("last_summarized_timestamp")),
+            )
+            while len(_cache) > CACHE_MAX_CHATS:
+                _cache.popitem(last=False)
+        return copy.deepcopy(state)
+
+
+def save_summary_state(chat_id, **changes):
+    """
+    Writes the given fields (SummaryState attribute names) with one upsert
+    and updates the cached state. Fields not passed are left unchanged.
+    """
+    unknown = set(changes) - set(SummaryState.__dataclass_fields__) - {"chat_id"}
+    if unknown:
+        raise ValueError(f"Unknown summary state fields: {', '.join(sorted(unknown))}")
+    if not changes:
+        return
+
+    fields = {
+        name: value.isoformat() if isinstance(value, datetime) else value
+        for name, value in changes.items()
+    }
+    # The lock covers the write too, so a concurrent first load cannot cache a stale row.
+    with _cache_lock:
+        get_state_store().upsert_summary_metadata(chat_id, fields)
+        state = _cache.get(chat_id)
+        if state is None:
+            return
+        for name, value in changes.items():
+            setattr(state, name, list(value) if name.endswith("_message_ids") else value)
@@ -1,21 +1,261 @@
 # utils/telegram_utils.py
 
-def safe_send_message(bot, chat_id, text, parse_mode="HTML", chunk_size=4000):
+import re
+import time
+import threading
+from collections import deque
+
+# Telegram counts message length in UTF-16 code units.
+TELEGRAM_MAX_LENGTH = 4096
+
+# Minimum spacing between consecutive parts sent to the same chat (seconds).
+# Telegram asks bots to stay around one message per second per chat.
+SEND_INTERVAL_SECONDS = 1.0
+
+_TOKEN_RE = re.compile(
+    r'(?P<tag><(?P<close>/?)(?P<name>[A-Za-z][\w-]*)[^<>]*>)'
+    r'|(?P<entity>&#?\w+;)'
+    r'|(?P<para>\n[ \t]*\n\s*)'
+    r'|(?P<newline>\n)'
+    r'|(?P<space>[ \t]+)'
+    r'|(?P<word>[^<&\n \t]+|[<&])'
+)
+_PLAIN_TOKEN_RE = re.compile(
+    r'(?P<para>\n[ \t]*\n\s*)'
+    r'|(?P<newline>\n)'
+    r'|(?P<space>[ \t]+)'
+    r'|(?P<word>[^\n \t]+)'
+)
+
+# Preferred split points, best first.
+_BREAK_PRIORITY = {'para': 3, 'newline': 2, 'space': 1}
+
+_last_send_times = {}
+_last_send_lock = threading.Lock()
+
+
+def utf16_len(text):
+    """
+    Length of `text` as Telegram counts it (UTF-16 code units).
+    """
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _tokenize(text, html):
+    pattern = _TOKEN_RE if html else _PLAIN_TOKEN_RE
+    for m in pattern.finditer(text):
+        kind = m.lastgroup
+        if kind in ('close', 'name'):
+            kind = 'tag'
+        if kind == 'tag':
+            yield ('tag', m.group(0), (m.group('name').lower(), bool(m.group('close'))))
+        else:
+            yield (kind, m.group(0), None)
+
+
+def _closing(stack):
+    return ''.join(f'</{name}>' for name, _ in reversed(stack))
+
+
+def _closing_len(stack):
+    return sum(len(name) + 3 for name, _ in stack)
+
+
+def _balance(tokens):
+    """
+    Drops closing tags that match nothing open and closes tags left open,
+    so every closing tag ends the innermost open one.
+    """
+    stack = []
+    for token in tokens:
+        kind, _, meta = token
+        if kind != 'tag':
+            yield token
+            continue
+        name, is_close = meta
+        if not is_close:
+            stack.append(name)
+            yield token
+            continue
+        if name not in stack:
+            continue
+        while stack:
+            inner = stack.pop()
+            yield ('tag', f'</{inner}>', (inner, True))
+            if inner == name:
+                break
+    for name in reversed(stack):
+        yield ('tag', f'</{name}>', (name, True))
+
+
+_EMPTY_PAIR = re.compile(r'<([A-Za-z][\w-]*)\b[^<>]*></\1>')
+_ANY_TAG = re.compile(r'<[^<>]*>')
+
+
+def _drop_empty_pairs(part):
+    # Tags reopened or opened right before a split can end up with nothing inside.
+    while True:
+        stripped = _EMPTY_PAIR.sub('', part)
+        if stripped == part:
+            return part
+        part = stripped
+
+
+def _hard_split(word, budget):
+    """
+    Splits `word` so the head fits in `budget` UTF-16 units.
+    Never cuts a code point (and so never a surrogate pair).
+    """
+    used = 0
+    for i, ch in enumerate(word):
+        used += 2 if ord(ch) > 0xFFFF else 1
+        if used > budget:
+            return word[:i], word[i:]
+    return word, ''
+
+
+def split_html_message(text, limit=TELEGRAM_MAX_LENGTH, html=True):
+    """
+    Splits `text` into parts of at most `limit` UTF-16 units.
+    Prefers paragraph breaks, then line breaks, then spaces; never cuts
+    inside a tag or entity. With html=True, tags still open at a split are
+    closed at the end of the part and reopened at the start of the next one,
+    so every part is balanced. If the reopened tags alone leave no room for
+    text, the message is split again without its tags.
+    """
+    if utf16_len(text) <= limit:
+        return [text]
+
+    tokens = _tokenize(text, html)
+    tokens = deque(_balance(tokens) if html else tokens)
+    parts = []
+    cur = []          # (kind, value, meta) tokens of the current part, reopened tags first
+    cur_len = 0
+    stack = []        # open tags: (name, full opening tag)
+    breaks = []       # candidate split points: (index in cur, length, stack, priority)
+    has_text = False  # whether the current part holds anything besides tags
+
+    def end_part(head, at_stack):
+        """
+        Emits `head` (closed with `at_stack`) as a part and starts the next
+        one with `at_stack` reopened.
+        """
+        nonlocal cur, cur_len, stack, breaks, has_text
+        if any(kind in ('word', 'entity') for kind, _, _ in head):
+            part = ''.join(value for _, value, _ in head).rstrip() + _closing(at_stack)
+            parts.append(_drop_empty_pairs(part) if html else part)
+        stack = list(at_stack)
+        cur = [('reopen', full, None) for _, full in stack]
+        cur_len = sum(utf16_len(full) for _, full in stack)
+        breaks = []
+        has_text = False
+
+    while tokens:
+        token = tokens.popleft()
+        kind, value, meta = token
+
+        if kind in _BREAK_PRIORITY and not has_text:
+            # No leading whitespace at the start of a part.
+            continue
+
+        new_stack = stack
+        if kind == 'tag':
+            # Balanced input: a closing tag always ends the innermost open one.
+            new_stack = stack[:-1] if meta[1] else stack + [(meta[0], value)]
+        size = utf16_len(value)
+
+        if cur_len + size + _closing_len(new_stack) <= limit:
+            if kind in _BREAK_PRIORITY:
+                breaks.append((len(cur), cur_len, tuple(stack), _BREAK_PRIORITY[kind]))
+            elif kind in ('word', 'entity'):
+                has_text = True
+            cur.append(token)
+            cur_len += size
+            stack = new_stack
+            continue
+
+        # The token does not fit: split the current part.
+        if kind in _BREAK_PRIORITY:
+            # Split right here and drop the whitespace.
+            end_part(cur, tuple(stack))
+            continue
+
+        if breaks:
+            # Best break in the second half of the part; otherwise the latest one.
+            half = limit // 2
+            late = [b for b in breaks if b[1] >= half]
+            idx, _, at_stack, _ = max(late, key=lambda b: (b[3], b[0])) if late else breaks[-1]
+            remainder = cur[idx + 1:]
+            end_part(cur[:idx], at_stack)
+            tokens.appendleft(token)
+            tokens.extendleft(reversed(remainder))
+            continue
+
+        if kind == 'word':
+            # A single run of text longer than the remaining room: cut it.
+            head, tail = _hard_split(value, limit - cur_len - _closing_len(stack))
+            if not head and not has_text:
+                if stack:
+                    break  # the reopened tags leave no room
+                head, tail = value[0], value[1:]  # limit below one character: never stall
+            if head:
+                cur.append(('word', head, None))
+                has_text = True
+            if tail:
+                tokens.appendleft(('word', tail, None))
+            end_part(cur, tuple(stack))
+            continue
+
+        # A tag or entity that does not fit: start a new part before it.
+        if has_text:
+            end_part(cur, tuple(stack))
+            tokens.appendleft(token)
+            continue
+        if stack or kind == 'tag':
+            break  # not even on an empty part: give up on the markup
+        # An entity longer than the whole limit: send it on its own rather than stall.
+        end_part([token], ())
+    else:
+        if has_text:
+            part = ''.join(value for _, value, _ in cur).rstrip() + _closing(stack)
+            parts.append(_drop_empty_pairs(part) if html else part)
+        return parts
+
+    # No progress is possible with the tags: split the text without them.
+    return split_html_message(_ANY_TAG.sub('', text), limit, html=html)
+
+
+def _wait_for_send_slot(chat_id, min_interval):
+    """
+    Sleeps just long enough to keep `min_interval` seconds between sends to `chat_id`.
+    """
+    with _last_send_lock:
+        now = time.monotonic()
+        ready_at = _last_send_times.get(chat_id, 0) + min_interval
+        send_at = max(now, ready_at)
+        _last_send_times[chat_id] = send_at
+    if send_at > now:
+        time.sleep(send_at - now)
+
+
+def safe_send_message(bot, chat_id, text, parse_mode="HTML", chunk_size=4000,
+                      min_interval=SEND_INTERVAL_SECONDS):
     """
     Sends a message in multiple parts if it exceeds the chunk_size limit.
+    Parts are split on paragraph/line boundaries with HTML tags kept balanced,
+    and paced at `min_interval` seconds apart so Telegram does not flood-limit them.
+    Pass min_interval=0 when `bot` is an OutboundScheduler, which already paces per chat.
+    Returns the list of sent message ids.
     """
-    if len(text) <= chunk_size:
+    if utf16_len(text) <= chunk_size:
         # <= chunk_size means 1 message only
         msg = bot.send_message(chat_id, text, parse_mode=parse_mode)
         return [msg.message_id]
 
+    parts = split_html_message(text, limit=chunk_size, html=(parse_mode or '').upper() == "HTML")
     message_ids = []
-    start = 0
-    while start < len(text):
-        end = min(start + chunk_size, len(text))
-        chunk = text[start:end]
-        msg = bot.send_message(chat_id, chunk, parse_mode=parse_mode)
+    for part in parts:
+        _wait_for_send_slot(chat_id, min_interval)
+        msg = bot.send_message(chat_id, part, parse_mode=parse_mode)
         message_ids.append(msg.message_id)
-        start = end
     return message_ids
-
@@ -0,0 +1,331 @@
+# utils/vector_memory.py
+
+import atexit
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict, Counter
+
+from config import MEMORY_INDEX_DIR, MEMORY_MAX_ITEMS, get_settings
+from utils import db_manager
+
+logger = logging.getLogger(__name__)
+
+# Long-term memory for /chat: past chat turns and group messages are embedded
+# with a hashing vectorizer (no model, no vocabulary to keep) and searched by
+# cosine similarity. Each chat has two append-only files in MEMORY_INDEX_DIR
+# (by default memory_index/ next to the SQLite database):
+#   <chat>.f16    float16 vectors, DIM per item
+#   <chat>.jsonl  one {"ts", "source", "who", "text"} line per item
+# Vectors are held in memory as float32, so queries need no conversion.
+# Needs the optional `numpy` package; without it the memory stays off.
+
+DIM = 512                # hashed feature space; 1 KB per item on disk
+MIN_CHARS = 20           # shorter texts carry too little to be worth recalling
+TEXT_CHARS = 300         # stored (and recalled) text per item
+MIN_SIMILARITY = 0.15
+FLUSH_SECONDS = 10
+FLUSH_ITEMS = 500
+MAX_LOADED_CHATS = 100
+
+_WORDS = re.compile(r"[\w$@']{2,}")
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+
+def _features(text):
+    words = _WORDS.findall(text.lower())
+    return Counter(words + [f"{a} {b}" for a, b in zip(words, words[1:])])
+
+
+def embed(text):
+    """
+    L2-normalized hashing-trick vector of the words and word pairs in `text`
+    (sublinear term frequency, signed buckets), as float32.
+    """
+    vector = np.zeros(DIM, dtype=np.float32)
+    for feature, count in _features(text).items():
+        h = zlib.crc32(feature.encode())
+        vector[h % DIM] += (1.0 if h & 0x80000000 else -1.0) * (1.0 + math.log(count))
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class _ChatIndex:
+    """
+    One chat's items, with their vectors in the first `count` rows of a
+    preallocated matrix that doubles when full. Rows below `count` never
+    change in place (growth and compaction build new arrays), so a search
+    can use them after the lock is released.
+    """
+
+    __slots__ = ("vectors", "count", "items", "unsaved", "df")
+
+    def __init__(self, vectors=None, items=()):
+        count = 0 if vectors is None else len(vectors)
+        self.vectors = np.zeros((count + count // 4 + 64, DIM), dtype=np.float32)
+        if count:
+            self.vectors[:count] = vectors
+        self.count = count
+        self.items = list(items)
+        self.unsaved = []   # (vector, item) not yet on disk
+        self.df = (self.vectors[:count] != 0).sum(axis=0).astype(np.float32)  # items per non-zero bucket
+
+    def append(self, vector, item):
+        if self.count == len(self.vectors):
+            grown = np.zeros((2 * len(self.vectors), DIM), dtype=np.float32)
+            grown[:self.count] = self.vectors[:self.count]
+            self.vectors = grown
+        self.vectors[self.count] = vector
+        self.count += 1
+        self.items.append(item)
+        self.df += vector != 0
+
+
+class VectorMemory:
+    """
+    Per-chat vector index over past conversation turns and group messages.
+    add() is cheap (one embedding, one row copy, no I/O); a background
+    writer appends new items to disk in batches and compacts oversized
+    chats without holding up add() or search(). A chat's stored index is
+    read when the chat is first seen, by that writer (or by a search,
+    outside the lock), and merged with what was added meanwhile. The least
+    recently used indexes are dropped from memory past MAX_LOADED_CHATS.
+    """
+
+    def __init__(self, directory=MEMORY_INDEX_DIR, max_items=MEMORY_MAX_ITEMS):
+        self.directory = directory or os.path.join(os.path.dirname(db_manager.DB_PATH) or ".", "memory_index")
+        self.max_items = max_items
+        self.enabled = np is not None
+        self._chats = OrderedDict()
+        self._cold = set()  # chats whose files are not read yet
+        self._lock = threading.Lock()
+        # One writer at a time keeps each chat's two files in step (reentrant: flush() loads cold chats).
+        self._io_lock = threading.RLock()
+        self._wake = threading.Event()
+        self._writer = None
+        self._unsaved_count = 0
+        if not self.enabled:
+            logger.warning("Long-term chat memory is off: it needs the 'numpy' package (pip install numpy).")
+
+    # --- Public API ---
+
+    def add(self, chat_id, text, source, who="", timestamp=None):
+        """
+        Remembers `text` for `chat_id`; `source` is "chat" (a /chat turn) or
+        "group" (a group message), `who` the role or user name.
+        """
+        if not self.enabled or not text or len(text) < MIN_CHARS:
+            return
+        vector = embed(text)
+        item = {"ts": timestamp or time.time(), "source": source, "who": who, "text": text[:TEXT_CHARS]}
+        with self._lock:
+            index = self._index(chat_id)
+            index.append(vector, item)
+            index.unsaved.append((vector, item))
+            self._unsaved_count += 1
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_behind, name="vector-memory", daemon=True)
+                self._writer.start()
+            if self._unsaved_count >= FLUSH_ITEMS or chat_id in self._cold:
+                self._wake.set()
+
+    def search(self, chat_id, query, k=None, exclude=()):
+        """
+        Up to `k` (default RETRIEVAL_TOP_K) remembered items most similar to
+        `query`, best first, as their dicts plus a "score". Items whose text
+        is in `exclude` (e.g. already in the prompt) are skipped.
+        """
+        k = get_settings().retrieval_top_k if k is None else k
+        if not self.enabled or not k or not query:
+            return []
+        exclude = {text[:TEXT_CHARS] for text in exclude}
+        with self._lock:
+            self._index(chat_id)
+            cold = chat_id in self._cold
+        if cold:
+            self._load_cold([chat_id])
+        with self._lock:
+            index = self._index(chat_id)
+            if not index.count:
+                return []
+            vectors, items, df = index.vectors[:index.count], index.items, index.df.copy()
+        # Rare buckets count more (IDF on the query side only).
+        idf = np.log((len(vectors) + 1) / (df + 1)) + 1.0
+        q = embed(query) * idf
+        norm = np.linalg.norm(q)
+        if not norm:
+            return []
+        scores = vectors @ (q / norm)
+        top = np.argsort(scores)[::-1]
+        results = []
+        for i in top:
+            if scores[i] < MIN_SIMILARITY or len(results) == k:
+                break
+            item = items[i]
+            if item["text"] in exclude:
+                continue
+            results.append({**item, "score": round(float(scores[i]), 3)})
+        return results
+
+    def flush(self):
+        """
+        Reads the files of newly seen chats, appends unsaved items to their
+        chats' files and compacts chats that outgrew MEMORY_MAX_ITEMS. Runs on
+        the writer thread (and at exit).
+        """
+        if not self.enabled:
+            return
+        with self._io_lock:
+            # Before appending: a chat's files must be read without the items
+            # added since, or those would be loaded twice.
+            self._load_cold()
+            with self._lock:
+                self._unsaved_count = 0
+                batches = []
+                for chat_id, index in self._chats.items():
+                    if index.unsaved:
+                        batches.append((chat_id, index.unsaved))
+                        index.unsaved = []
+                oversized = [cid for cid, index in self._chats.items() if index.count > self.max_items * 1.2]
+            try:
+                if batches:
+                    os.makedirs(self.directory, exist_ok=True)
+                for chat_id, unsaved in batches:
+                    vectors_path, items_path = self._paths(chat_id)
+                    # Vectors first: a crash in between leaves extra vectors,
+                    # which _load() cuts off.
+                    with open(vectors_path, "ab") as f:
+                        f.write(np.stack([v for v, _ in unsaved]).astype(np.float16).tobytes())
+                    with open(items_path, "a", encoding="utf-8") as f:
+                        f.writelines(json.dumps(item, ensure_ascii=False) + "\n" for _, item in unsaved)
+                for chat_id in oversized:
+                    self._compact(chat_id)
+            except OSError as e:
+                logger.error(f"Could not write the chat memory index: {e}")
+
+    # --- Internals ---
+
+    def _write_behind(self):
+        while True:
+            self._wake.wait(FLUSH_SECONDS)
+            self._wake.clear()
+            self.flush()
+
+    def _paths(self, chat_id):
+        base = os.path.join(self.directory, str(chat_id))
+        return base + ".f16", base + ".jsonl"
+
+    def _index(self, chat_id):
+        # Caller holds the lock.
+        index = self._chats.get(chat_id)
+        if index is not None:
+            self._chats.move_to_end(chat_id)
+            return index
+        index = self._chats[chat_id] = _ChatIndex()
+        self._cold.add(chat_id)
+        while len(self._chats) > MAX_LOADED_CHATS:
+            oldest_id, oldest = next(iter(self._chats.items()))
+            if oldest.unsaved or oldest_id in self._cold:
+                break  # keep it until the next flush has read and written it
+            self._chats.popitem(last=False)
+        return index
+
+    def _load_cold(self, chat_ids=None):
+        """
+        Reads the files of cold chats (all, or `chat_ids`) without holding
+        the lock, then puts the items added since after the stored ones.
+        """
+        with self._io_lock:
+            with self._lock:
+                cold = list(self._cold if chat_ids is None else self._cold.intersection(chat_ids))
+            for chat_id in cold:
+                loaded = self._load(chat_id)
+                with self._lock:
+                    self._cold.discard(chat_id)
+                    index = self._chats.get(chat_id)
+                    if index is None:
+                        continue
+                    for i in range(index.count):
+                        loaded.append(index.vectors[i], index.items[i])
+                    loaded.unsaved = index.unsaved
+                    self._chats[chat_id] = loaded
+
+    def _load(self, chat_id):
+        """
+        Reads a chat's files. If they disagree (a write torn by a crash), both
+        are cut back to the items they have in common, so later appends stay
+        aligned.
+        """
+        vectors_path, items_path = self._paths(chat_id)
+        if not os.path.exists(vectors_path) or not os.path.exists(items_path):
+            return _ChatIndex()
+        try:
+            with open(items_path, "rb") as f:
+                data = f.read()
+            items, ends = [], []
+            offset = 0
+            for line in data.splitlines(keepends=True):
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    items.append(json.loads(line))
+                except ValueError:
+                    break
+                offset += len(line)
+                ends.append(offset)
+            vectors = np.fromfile(vectors_path, dtype=np.float16)
+            count = min(len(items), vectors.size // DIM)
+            items_end = ends[count - 1] if count else 0
+            if items_end != len(data) or vectors.size != count * DIM:
+                logger.warning(f"Chat memory files of chat {chat_id} disagree; keeping the first {count} items.")
+                os.truncate(items_path, items_end)
+                os.truncate(vectors_path, count * DIM * 2)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not load the chat memory of chat {chat_id}: {e}")
+            return _ChatIndex()
+        return _ChatIndex(vectors[:count * DIM].reshape(count, DIM), items[:count])
+
+    def _compact(self, chat_id):
+        """
+        Keeps a chat's newest `max_items` items, in memory and on disk. The
+        copies and file writes happen outside the lock; only items added
+        meanwhile are carried over under it. Caller holds the I/O lock.
+        """
+        with self._lock:
+            index = self._chats.get(chat_id)
+            if index is None:
+                return
+            vectors, count, items = index.vectors, index.count, index.items
+            written = len(index.unsaved)  # unsaved items that are in the snapshot
+        keep = min(count, self.max_items)
+        trimmed = _ChatIndex(vectors[count - keep:count], items[count - keep:count])
+        vectors_path, items_path = self._paths(chat_id)
+        with open(vectors_path + ".tmp", "wb") as f:
+            f.write(trimmed.vectors[:keep].astype(np.float16).tobytes())
+        with open(items_path + ".tmp", "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(item, ensure_ascii=False) + "\n" for item in trimmed.items)
+        with self._lock:
+            if self._chats.get(chat_id) is not index:
+                os.remove(vectors_path + ".tmp")
+                os.remove(items_path + ".tmp")
+                return  # dropped meanwhile; its files stay as they are
+            for i in range(count, index.count):
+                trimmed.append(index.vectors[i], index.items[i])
+            trimmed.unsaved = index.unsaved[written:]  # added meanwhile; appended after the swap
+            os.replace(vectors_path + ".tmp", vectors_path)
+            os.replace(items_path + ".tmp", items_path)
+            self._chats[chat_id] = trimmed
+
+
+vector_memory = VectorMemory()
+# Write the last batch on a normal shutdown.
+atexit.register(vector_memory.flush)